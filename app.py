@@ -1,32 +1,31 @@
 # app.py
-import zipfile
 import os
+import hashlib
+import json
+import shutil
 import logging
+import time
 from dotenv import load_dotenv
-import ipfsApi
-import base64
 from db_models.models import ModelRegistry, ModelVote
-from flask import jsonify, request, Flask, send_file
-from utils.iota_utils import load_wallet
-from utils.registry_utils import initialize_registry
-from utils.file_transfer_utils import create_zip, cleanup_files, fix_base64_padding
-from utils.ipfs_utils import fetch_ipfs_data
-from utils.voting_utils import ModelVotingManager
+from flask import jsonify, request, Flask, Response, send_file
+from utils.registry_utils import (
+    initialize_registry, session_scope, list_models, parse_timestamp, model_statuses, nft_ids_to_cids, LISTING_FIELDS
+)
+from utils.file_transfer_utils import stream_zip
+from utils.ipfs_utils import open_ipfs_streams, check_ipfs, close_all, BlobCache
+from utils.registry_cache import RegistryCache, REGISTRY_CACHE_REDIS_URL
+from utils.status_events import StatusStream
+from utils.upload_utils import ingest_multipart_upload, extract_zip_stream, is_sha256, is_valid_model_name, ChunkStore, ResumableUpload, collect_upload_garbage
+from utils.voting_utils import ModelVotingManager, VoteCollector, VoteLedger
 from db_models.models import db, ModelRegistry
-from nio import AsyncClient
 from flask.typing import ResponseReturnValue
-import torch    
 import asyncio
 from uuid import uuid4
+from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError
-from model_pipelines.Teacher_Model import TeacherModel
-from model_pipelines.Student_Model import StudentModel
-from model_pipelines.Global_Model import GlobalModel
-from transformers import AutoConfig, AutoModel, AutoTokenizer
 from typing import Optional
 from celery import Celery
 from datetime import datetime, UTC
-from io import BytesIO
 from functools import lru_cache
 from flask_cors import CORS
 import asyncio
@@ -52,6 +51,24 @@ MATRIX_BOT_USERNAME = os.getenv('MATRIX_BOT_USERNAME', '@bot@socialxmatch.com')
 MATRIX_PASSWORD = os.getenv('MATRIX_PASSWORD')
 VOTING_DURATION = int(os.getenv('VOTING_DURATION', 300))
 MODEL_SAVE_DIR = os.getenv('MODEL_SAVE_DIR', '/models')
+MODEL_STORE_DIR = os.getenv('MODEL_STORE_DIR', 'model_store')
+MAX_UPLOAD_CHUNK_SIZE = int(os.getenv('MAX_UPLOAD_CHUNK_SIZE', 64 * 1024 * 1024))
+CHUNK_STORE_DIR = os.path.join(MODEL_SAVE_DIR, '.chunks')
+IPFS_CACHE_DIR = os.getenv('IPFS_CACHE_DIR', os.path.join(MODEL_SAVE_DIR, '.ipfs_cache'))
+IPFS_CACHE_BYTES = int(os.getenv('IPFS_CACHE_BYTES', 20 * 1024 ** 3))
+UPLOAD_SESSION_DIR = os.path.join(MODEL_SAVE_DIR, '.uploads')
+# Largest archive a resumable upload may declare
+MAX_UPLOAD_ARTIFACT_SIZE = int(os.getenv('MAX_UPLOAD_ARTIFACT_SIZE', 32 * 1024 ** 3))
+# Uploads idle this long are discarded, and unreferenced chunks unused this long deleted
+UPLOAD_TTL = int(os.getenv('UPLOAD_TTL', 24 * 3600))
+# Shortest time between two garbage collections of uploads in one process
+UPLOAD_GC_INTERVAL = int(os.getenv('UPLOAD_GC_INTERVAL', 600))
+APPROVED_MODELS_PAGE_SIZE = int(os.getenv('APPROVED_MODELS_PAGE_SIZE', 100))
+APPROVED_MODELS_MAX_PAGE_SIZE = int(os.getenv('APPROVED_MODELS_MAX_PAGE_SIZE', 1000))
+# Most ids one batch lookup may ask for, which bounds its response size
+MAX_BATCH_IDS = int(os.getenv('MAX_BATCH_IDS', 500))
+# Seconds /ready waits for each service it checks
+READY_TIMEOUT = float(os.getenv('READY_TIMEOUT', 2))
 
 # Flask app initialization
 app = Flask(__name__)
@@ -64,41 +81,73 @@ app.config.update(
 CORS(app) 
 
 
-# Client factories
+# Client factories. Heavy client libraries (and torch/transformers behind the
+# model pipelines) are imported on first use, so importing this module for a
+# web process or a Celery worker stays cheap.
 @lru_cache()
 def get_matrix_client():
+    from nio import AsyncClient
     return AsyncClient(MATRIX_SERVER_URI, MATRIX_BOT_USERNAME)
 
 @lru_cache()
 def get_ipfs_client():
-    return ipfsApi.Client(IPFS_SERVER_IP, IPFS_SERVER_PORT)
+    from utils.ipfs_client import IPFSClient
+    return IPFSClient(f'http://{IPFS_SERVER_IP}:{IPFS_SERVER_PORT}')
+
+@lru_cache()
+def get_blob_cache():
+    return BlobCache(IPFS_CACHE_DIR, IPFS_CACHE_BYTES)
+
+@lru_cache()
+def get_registry_cache():
+    return RegistryCache(redis_url=REGISTRY_CACHE_REDIS_URL)
+
+@lru_cache()
+def get_status_stream():
+    return StatusStream(get_registry_cache())
+
+@lru_cache()
+def get_vote_collector():
+    # One per process, so its room tokens and vote index outlive single tasks.
+    # It makes the closing count, after the model has been claimed for finalizing
+    return VoteCollector(get_matrix_client(), VOTING_ROOMS,
+                         ledger=VoteLedger(app, db, registry_cache=get_registry_cache(),
+                                           voting_duration=VOTING_DURATION,
+                                           open_statuses=('pending', 'finalizing')))
 
 @lru_cache()
 def get_wallet():
+    from utils.iota_utils import load_wallet
     return load_wallet(name=ACCOUNT_HOLDER_NAME)
 
+@lru_cache()
+def get_model_store():
+    from model_pipelines.Model_Store import ModelStore
+    return ModelStore(MODEL_STORE_DIR)
+
 # Model management
 class ModelManager:
-    @staticmethod
-    def load_or_create_model(model_path: str, model_class):
-        try:
-            return torch.load(model_path, weights_only=True)
-        except Exception as e:
-            logger.warning(f"Failed to load model from {model_path}: {e}")
-            return model_class()
+    """
+    Access to the stored models. Only the Celery task that finalizes a vote
+    uses them, and it loads them from the model store with
+    ``initialize_models`` each time, so that it merges into what other
+    workers have saved. The web process never loads them.
+    """
 
     @staticmethod
     def initialize_models():
-        return {
-            'teacher': ModelManager.load_or_create_model('teacher_model.pt', TeacherModel),
-            'student': ModelManager.load_or_create_model('student_model.pt', StudentModel),
-            'global': ModelManager.load_or_create_model('global_model.pt', GlobalModel)
-        }
-
-# Initialize components
-models = ModelManager.initialize_models()
-ipfs_client = get_ipfs_client()
-matrix_client = get_matrix_client()
+        from model_pipelines.Teacher_Model import TeacherModel
+        from model_pipelines.Student_Model import StudentModel
+        from model_pipelines.Global_Model import GlobalModel
+        try:
+            return get_model_store().load()
+        except Exception as e:
+            logger.warning(f"Failed to load models from {MODEL_STORE_DIR}: {e}")
+            return {
+                'teacher': TeacherModel(),
+                'student': StudentModel(),
+                'global': GlobalModel()
+            }
 
 # Initialize registry
 initialize_registry(app=app, db=db)
@@ -159,19 +208,18 @@ celery.conf.update(
     worker_concurrency=4,  # Adjust to your needs
 )
 
-# Celery task
+# Celery tasks
 @celery.task(bind=True)
 async def count_votes_for_model_task(self, model_name: str, model_id: str, task: str):
     await _count_votes_for_model_task(model_name, model_id, task)
 
+@celery.task(bind=True)
+async def finalize_votes_for_model_task(self, model_name: str, model_id: str, task: str):
+    await _finalize_votes_for_model_task(model_name, model_id, task)
 
-from textwrap import dedent
-async def _count_votes_for_model_task(model_name: str, model_id: str, task: str):
-    """Celery task for counting votes on a model."""
-    
-    # Initialize task-specific instances
-    models = ModelManager.initialize_models()
-    voting_manager = ModelVotingManager(
+
+def _get_voting_manager() -> ModelVotingManager:
+    return ModelVotingManager(
         app=app,
         matrix_client=get_matrix_client(),
         ipfs_client=get_ipfs_client(),
@@ -179,254 +227,493 @@ async def _count_votes_for_model_task(model_name: str, model_id: str, task: str)
         MATRIX_PASSWORD=MATRIX_PASSWORD,
         VOTING_DURATION=VOTING_DURATION,
         VOTING_ROOMS=VOTING_ROOMS,
-        db=db
+        db=db,
+        model_store=get_model_store(),
+        vote_collector=get_vote_collector(),
+        registry_cache=get_registry_cache()
     )
-    with app.app_context():
-        try:
+
+def _mark_model_failed(model_id: str) -> None:
+    # Update database status to failed
+    with session_scope(app, db) as session:
+        session.query(ModelRegistry).filter_by(model_id=model_id).update({'status': 'failed'})
+    get_registry_cache().invalidate(model_id)
+
+async def _count_votes_for_model_task(model_name: str, model_id: str, task: str):
+    """
+    Open the vote on a model: record the voting session, broadcast the
+    proposal and schedule ``finalize_votes_for_model_task`` for when the
+    window closes. No worker slot, session or model is held while it is open.
+    """
+    voting_manager = _get_voting_manager()
+    try:
+        # Create voting session
+        with session_scope(app, db) as session:
+            session.add(ModelVote( # type: ignore
+                model_id=model_id,
+                model_name=model_name,
+                yes_votes=0,
+                no_votes=0,
+                voting_start=datetime.now(UTC)
+            ))
+        # Its status now carries a tally
+        get_registry_cache().invalidate(model_id, listings=False)
+
+        # Broadcast voting proposal
+        print('Broadcast voting message')
+        if voting_manager.voting_rooms is None:
+            raise ValueError('No Rooms for voting')
+
+        await voting_manager.broadcast_voting_message({
+            "model_name": model_name,
+            "model_id": model_id
+        })
+
+        # Close the vote from a separate task once the window has passed
+        finalize_votes_for_model_task.apply_async(kwargs={
+            "model_name": model_name,
+            "model_id": model_id,
+            "task": task
+        }, countdown=voting_manager.voting_duration)
+        print(f'Voting for {model_id} closes in {voting_manager.voting_duration} seconds')
+
+    except Exception as e:
+        logger.error(f"Error in count_votes_for_model_task: {str(e)}")
+        _mark_model_failed(model_id)
+        raise
+
+async def _finalize_votes_for_model_task(model_name: str, model_id: str, task: str):
+    """
+    Close the vote on a model: count the votes and, only if it was approved,
+    load the upload and merge it into the teacher, student and global models.
+
+    Safe to deliver more than once (e.g. a broker redelivering the delayed
+    task): only the run that moves the model out of ``pending`` acts.
+    """
+    # Every stage below opens a short session of its own, so no connection or
+    # transaction is held across the Matrix calls, model loading or uploads
+    with session_scope(app, db) as session:
+        claimed = session.query(ModelRegistry).filter_by(model_id=model_id, status='pending').update({'status': 'finalizing'})
+    if not claimed:
+        print(f'Voting for {model_id} was already finalized')
+        return
+    get_registry_cache().invalidate(model_id)
+
+    try:
+        voting_manager = _get_voting_manager()
+        await voting_manager.matrix_login()
+        with app.app_context():
+            voting_session = ModelVote.query.filter_by(model_id=model_id).first()
+
+        print('Counting votes')
+        yes_votes, no_votes = await voting_manager.count_votes_for_model(model_id, voting_session)
+        voting_manager.vote_collector.forget(model_id)
+
+        # Stored models are loaded lazily from the model store
+        models = ModelManager.initialize_models()
+
+        def update_teacher_model():
+            from transformers import AutoConfig, AutoModel, AutoTokenizer
+
             # Load model files
-            model_dir = os.path.join(MODEL_SAVE_DIR, model_name, 'weights')
-            tokenizer_dir = os.path.join(MODEL_SAVE_DIR, model_name, 'tokenizer')
-            
+            model_dir = os.path.join(MODEL_SAVE_DIR, model_id, 'weights')
+            tokenizer_dir = os.path.join(MODEL_SAVE_DIR, model_id, 'tokenizer')
+
             config = AutoConfig.from_pretrained(os.path.join(model_dir, "config.json"))
             model = AutoModel.from_pretrained(model_dir, config=config)
             tokenizer = AutoTokenizer.from_pretrained(tokenizer_dir)
 
             print('Done model loading')
-            
-            # Update student model
+
+            # Update models
             models['student'].add_model(task=task, model_type="model", value=model)
             models['student'].add_model(task=task, model_type="tokenizer", value=tokenizer)
 
-            print('updated student model')
+            models['teacher'].add_model(task, model_name, "model", model)
+            models['teacher'].add_model(task, model_name, "tokenizer", tokenizer)
 
-            def update_teacher_model():
-                # Update models
-                models['teacher'].add_model(task, model_name, "model", model)
-                models['teacher'].add_model(task, model_name, "tokenizer", tokenizer)
+            models['global'].add_model("model", model)
+            models['global'].add_model("tokenizer", tokenizer)
 
-                models['global'].add_model("model", model)
-                models['global'].add_model("tokenizer", tokenizer)
+            return models['teacher'], models['global']
 
-                return models['teacher'], models['global']
-            
-            # Process voting
-            print('starting voting')
-        
-                    # Create voting session
-            voting_session = ModelVote( # type: ignore
-                model_name=model_name,
-                yes_votes=0,
-                no_votes=0,
-                voting_start=datetime.now(UTC)
-            )
+        is_approved = voting_manager.finalize_voting(yes_votes, no_votes, model_name, models['student'], update_teacher_model,
+                                                     task=task, model_id=model_id)
 
-            db.session.add(voting_session)
-            db.session.commit()
-
-            # Broadcast voting proposal
-            print('Broadcast voting message')
-            voting_message = dedent(f"""
-                MODEL VOTING PROPOSAL
-                --------------------
-                Model Name: {model_name}
-                Model ID: {model_id}
-                
-                VOTING INSTRUCTIONS:
-                - Reply 'yes {model_id}' to approve this model
-                - Reply 'no {model_id}' to reject this model
-                - Voting closes in {voting_manager.voting_duration // 60} minutes
-            """)
-
-            if voting_manager.voting_rooms is None:
-                return jsonify({'Error': 'No Rooms for voting'})
-            
-            for room_id in voting_manager.voting_rooms:
-                try:
-                    await voting_manager.matrix_login()  # Ensure the login process is awaited
-                    print(f'Attempting to send message to room {room_id}')
-                    
-                    res = await voting_manager.matrix_client.room_send(
-                        room_id=room_id,
-                        message_type="m.room.message",
-                        content={
-                            "msgtype": "m.text",
-                            "body": voting_message
-                        }
-                    )
-                    print(f'Sent message to room {room_id}')
-                    print(res)
-
-                except TimeoutError:
-                    print(f"Timeout while sending message to room {room_id}")
-                except Exception as e:
-                    print(f"Failed to broadcast voting message: {e}")
-                
-            import time
-            time.sleep(voting_manager.voting_duration) 
-            print('Counting votes')
-            db.session.refresh(voting_session)
-
-            yes_votes, no_votes = await voting_manager.count_votes_for_model(model_id, voting_session)
-            is_approved = voting_manager.finalize_voting(yes_votes, no_votes, model_name, models['student'], update_teacher_model)
-                    # Broadcast results
-            
-            result_message = dedent(f"""
-                MODEL VOTING RESULT
-                -------------------
-                Model: {model_name}
-                Status: {"APPROVED" if is_approved else "REJECTED"}
-            """)
-            
-            for room_id in voting_manager.voting_rooms:
-                try:
-                    await voting_manager.matrix_client.room_send(
-                        room_id=room_id,
-                        message_type="m.room.message",
-                        content={
-                            "msgtype": "m.text",
-                            "body": result_message
-                        }
-                    )
-                except Exception as e:
-                    print(f"Failed to broadcast result: {e}")
-
-            if is_approved:
-            
-                models['global'].add_model('model', model)
-                models['global'].add_model('tokenizer', tokenizer)
-
-                print('added to global')
-                
-                # Save updated models
-                torch.save(models['global'], 'global_model.pt')
-
-                print('saved all')
-                
-                # Update database status
-                with app.app_context():
-                    session = db.session()
-                    try:
-                        model_entry = session.query(ModelRegistry).filter_by(model_id=model_id).first()
-                        if model_entry:
-                            model_entry.status = 'approved'
-                            session.commit()
-                    finally:
-                        session.close()
-                
+        # Broadcast results
+        await voting_manager.broadcast_approval_result(model_name, is_approved)
+
+        if is_approved:
+            print('saved all')
             
-        except Exception as e:
-            logger.error(f"Error in count_votes_for_model_task: {str(e)}")
-            with app.app_context():
-                # Update database status to failed
-                session = db.session()
-                try:
-                    model_entry = session.query(ModelRegistry).filter_by(model_id=model_id).first()
-                    if model_entry:
-                        model_entry.status = 'failed'
-                        session.commit()
-                finally:
-                    session.close()
-                raise
+            # Update database status
+            with session_scope(app, db) as session:
+                session.query(ModelRegistry).filter_by(model_id=model_id).update({'status': 'approved'})
+            get_registry_cache().invalidate(model_id)
+
+    except Exception as e:
+        logger.error(f"Error in finalize_votes_for_model_task: {str(e)}")
+        _mark_model_failed(model_id)
+        raise
+    finally:
+        # An approved upload now lives in the model store; a rejected or
+        # failed one is never read again
+        shutil.rmtree(os.path.join(MODEL_SAVE_DIR, model_id), ignore_errors=True)
+
+def _register_model_for_voting(model_id: str, model_name: str, task: str) -> ResponseReturnValue:
+    """Create the registry entry for an unpacked model and start its voting task."""
+    new_model = ModelRegistry(
+        model_id=model_id,
+        model_name=model_name,
+        task=task,
+        nft_id='pending',
+        status='pending'
+    )
+    db.session.add(new_model)
+    db.session.commit()
+
+    # Start the Celery task
+    count_votes_for_model_task.apply_async(kwargs={
+        "model_name": model_name,
+        "model_id": model_id,
+        "task": task
+    })
+
+    logger.info(f"Voting started for model: {model_name}")
+    return jsonify({
+        "status": "Voting in progress",
+        "model_name": model_name,
+        "model_id": model_id
+    }), 202
+
+def _install_model_files(staging_dir: str, model_id: str) -> Optional[str]:
+    """
+    Check the required weight files in ``staging_dir`` and move the unpacked
+    weights/tokenizer into ``MODEL_SAVE_DIR/<model_id>``, where they stay
+    until the vote on that upload is finalized. Each upload has a directory
+    of its own, so a resubmitted name never replaces files still under vote.
+    Returns the name of the first missing required file, if any.
+    """
+    required_files = ["model.safetensors", "config.json"]
+    for required_file in required_files:
+        if not os.path.exists(os.path.join(staging_dir, 'weights', required_file)):
+            return required_file
+
+    model_root = os.path.join(MODEL_SAVE_DIR, model_id)
+    os.makedirs(model_root)
+    for part in ('weights', 'tokenizer'):
+        os.replace(os.path.join(staging_dir, part), os.path.join(model_root, part))
+    return None
 
 @app.route("/add_model", methods=["POST"])
 async def add_model() -> ResponseReturnValue:
-    """API endpoint to add a complete Hugging Face model as a zip file."""
+    """
+    API endpoint to add a complete Hugging Face model as a zip file.
+
+    The multipart body is consumed in chunks and both archives are unpacked
+    while they arrive, so the zips never touch the disk themselves.
+    """
+    staging_dir = os.path.join(MODEL_SAVE_DIR, '.incoming', str(uuid4()))
     try:
-        # Retrieve form data
-        model_name: Optional[str] = request.form.get("model_name")
-        task: Optional[str] = request.form.get("task")
-        tokenizer_zip = request.files.get("tokenizer.zip")
-        model_zip = request.files.get("model.zip")
+        try:
+            fields, archives = ingest_multipart_upload(
+                request.stream,
+                request.content_type,
+                {
+                    "model.zip": os.path.join(staging_dir, 'weights'),
+                    "tokenizer.zip": os.path.join(staging_dir, 'tokenizer')
+                },
+                text_fields=("model_name", "task")
+            )
+        except ValueError as e:
+            logger.error(f"Rejected upload: {e}")
+            return jsonify({"error": f"Invalid upload: {e}"}), 400
 
-        if not all([model_name, task, model_zip, tokenizer_zip]):
+        model_name: Optional[str] = fields.get("model_name")
+        task: Optional[str] = fields.get("task")
+
+        if not all([model_name, task]) or set(archives) != {"model.zip", "tokenizer.zip"}:
             logger.error("Missing required parameters.")
             return jsonify({"error": "Missing required parameters"}), 400
+        if not is_valid_model_name(model_name):
+            return jsonify({"error": "Invalid model_name"}), 400
 
-        # Create directories and save files
-        model_dir = os.path.join(MODEL_SAVE_DIR, model_name, 'weights')
-        tokenizer_dir = os.path.join(MODEL_SAVE_DIR, model_name, 'tokenizer')
-        os.makedirs(model_dir, exist_ok=True)
-        os.makedirs(tokenizer_dir, exist_ok=True)
+        for field_name, extractor in archives.items():
+            logger.info(f"Received {field_name} for {model_name}: {extractor.archive_size} bytes, sha256 {extractor.digest}")
 
-        # Save and extract zip files
-        zip_path = os.path.join(MODEL_SAVE_DIR, f"{model_name}.zip")
-        model_zip.save(zip_path)
-        tokenizer_zip_path = os.path.join(MODEL_SAVE_DIR, f"{model_name}_tokenizer.zip")
-        tokenizer_zip.save(tokenizer_zip_path)
+        # Verify required files and move them into place
+        model_id = str(uuid4())
+        missing_file = _install_model_files(staging_dir, model_id)
+        if missing_file:
+            logger.error(f"Missing required file: {missing_file}")
+            return jsonify({"error": f"Missing required file: {missing_file}"}), 400
 
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(model_dir)
+        return _register_model_for_voting(model_id, model_name, task)
 
-        with zipfile.ZipFile(tokenizer_zip_path, 'r') as zip_ref:
-            zip_ref.extractall(tokenizer_dir)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error in add_model: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
 
-        # Verify required files
-        required_files = ["model.safetensors", "config.json"]
-        for required_file in required_files:
-            if not os.path.exists(os.path.join(model_dir, required_file)):
-                logger.error(f"Missing required file: {required_file}")
-                return jsonify({"error": f"Missing required file: {required_file}"}), 400
+@lru_cache()
+def get_chunk_store():
+    return ChunkStore(CHUNK_STORE_DIR)
 
-        # Create database entry
-        model_id = str(uuid4())
-        new_model = ModelRegistry(
-            model_id=model_id,
-            model_name=model_name,
-            nft_id='pending',
-            status='pending'
-        )
-        db.session.add(new_model)
-        db.session.commit()
+def _load_upload(upload_id: str) -> ResumableUpload:
+    return ResumableUpload.load(UPLOAD_SESSION_DIR, upload_id)
 
-        # Start the Celery task
-        count_votes_for_model_task.apply_async(kwargs={
-            "model_name": model_name,
-            "model_id": model_id,
-            "task": task
-        })
+_last_upload_gc = 0.0
 
-        logger.info(f"Voting started for model: {model_name}")
-        return jsonify({
-            "status": "Voting in progress",
-            "model_name": model_name,
-            "model_id": model_id
-        }), 202
+def _collect_upload_garbage() -> None:
+    """Expire idle uploads and their unreferenced chunks, at most every ``UPLOAD_GC_INTERVAL`` seconds."""
+    global _last_upload_gc
+    if time.time() - _last_upload_gc < UPLOAD_GC_INTERVAL:
+        return
+    _last_upload_gc = time.time()
+    try:
+        expired, removed = collect_upload_garbage(UPLOAD_SESSION_DIR, get_chunk_store(), UPLOAD_TTL)
+        if expired or removed:
+            logger.info(f"Expired {len(expired)} idle uploads and {removed} unreferenced chunks")
+    except Exception as e:
+        logger.warning(f"Upload garbage collection failed: {e}")
+
+@app.route("/uploads", methods=["POST"])
+def create_upload() -> ResponseReturnValue:
+    """Start a resumable, chunked upload of a model and tokenizer archive."""
+    payload = request.get_json(silent=True) or request.form
+    model_name: Optional[str] = payload.get("model_name")
+    task: Optional[str] = payload.get("task")
+
+    if not all([model_name, task]):
+        return jsonify({"error": "Missing required parameters"}), 400
+    if not is_valid_model_name(model_name):
+        return jsonify({"error": "Invalid model_name"}), 400
+
+    _collect_upload_garbage()
+    try:
+        upload = ResumableUpload.create(UPLOAD_SESSION_DIR, model_name, task, payload.get("sizes") or {},
+                                        MAX_UPLOAD_ARTIFACT_SIZE)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "upload_id": upload.upload_id,
+        "max_chunk_size": MAX_UPLOAD_CHUNK_SIZE
+    }), 201
+
+@app.route("/uploads/<upload_id>", methods=["GET"])
+def get_upload(upload_id: str) -> ResponseReturnValue:
+    """List the chunks received so far, so an interrupted client can resume."""
+    try:
+        upload = _load_upload(upload_id)
+    except KeyError:
+        return jsonify({"error": "Upload not found"}), 404
+
+    return jsonify({
+        "upload_id": upload.upload_id,
+        **upload.session,
+        "chunks": {
+            artifact: [{"offset": offset, "sha256": digest} for offset, digest in upload.chunks(artifact)]
+            for artifact in ResumableUpload.ARTIFACTS
+        }
+    })
+
+@app.route("/uploads/<upload_id>/chunks", methods=["POST"])
+def offer_upload_chunks(upload_id: str) -> ResponseReturnValue:
+    """
+    Announce the chunk layout of an artifact. Chunks the server already holds
+    are recorded straight away; only the offsets listed as missing need a PUT.
+    """
+    try:
+        upload = _load_upload(upload_id)
+        payload = request.get_json(silent=True) or {}
+        artifact = payload.get("artifact")
+        store = get_chunk_store()
+
+        missing = []
+        for chunk in payload.get("chunks", []):
+            offset, digest = int(chunk["offset"]), chunk["sha256"]
+            if is_sha256(digest) and store.has(digest):
+                upload.record_chunk(artifact, offset, digest, store.size(digest))
+                store.touch(digest)
+            else:
+                missing.append(offset)
+    except KeyError:
+        return jsonify({"error": "Upload not found"}), 404
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({"artifact": artifact, "missing": missing})
+
+@app.route("/uploads/<upload_id>/<artifact>", methods=["PUT"])
+def put_upload_chunk(upload_id: str, artifact: str) -> ResponseReturnValue:
+    """Store one chunk of ``artifact`` at ``?offset=``, verified against ``X-Chunk-Sha256``."""
+    offset: Optional[int] = request.args.get("offset", type=int)
+    digest: Optional[str] = request.headers.get("X-Chunk-Sha256", "").lower()
+
+    try:
+        upload = _load_upload(upload_id)
+        if offset is None or not is_sha256(digest) or artifact not in ResumableUpload.ARTIFACTS:
+            return jsonify({"error": "Provide an artifact, an offset and an X-Chunk-Sha256 header"}), 400
+
+        store = get_chunk_store()
+        stored = not store.has(digest)
+        if stored:
+            store.put_stream(request.stream, digest, MAX_UPLOAD_CHUNK_SIZE)
+        upload.record_chunk(artifact, offset, digest, store.size(digest))
+    except KeyError:
+        return jsonify({"error": "Upload not found"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({
+        "offset": offset,
+        "sha256": digest,
+        "size": store.size(digest),
+        "stored": stored
+    }), 201 if stored else 200
+
+@app.route("/uploads/<upload_id>/commit", methods=["POST"])
+def commit_upload(upload_id: str) -> ResponseReturnValue:
+    """
+    Assemble the uploaded chunks, unpack both archives and start voting, the
+    same way ``/add_model`` does. The optional JSON body may carry the expected
+    ``sha256`` of each archive.
+    """
+    try:
+        upload = _load_upload(upload_id)
+    except KeyError:
+        return jsonify({"error": "Upload not found"}), 404
+
+    _collect_upload_garbage()
+    expected = request.get_json(silent=True) or {}
+    staging_dir = os.path.join(MODEL_SAVE_DIR, '.incoming', str(uuid4()))
+    try:
+        session = upload.session
+        store = get_chunk_store()
+        for artifact, part in (("model.zip", "weights"), ("tokenizer.zip", "tokenizer")):
+            artifact_info = expected.get(artifact) or {}
+            extractor = extract_zip_stream(
+                upload.iter_artifact(artifact, store),
+                os.path.join(staging_dir, part)
+            )
+            if artifact_info.get("sha256") and artifact_info["sha256"] != extractor.digest:
+                return jsonify({"error": f"{artifact} does not match its sha256"}), 400
 
+        model_id = str(uuid4())
+        missing_file = _install_model_files(staging_dir, model_id)
+        if missing_file:
+            logger.error(f"Missing required file: {missing_file}")
+            return jsonify({"error": f"Missing required file: {missing_file}"}), 400
+
+        response = _register_model_for_voting(model_id, session["model_name"], session["task"])
+        upload.discard()
+        return response
+
+    except ValueError as e:
+        logger.error(f"Rejected upload {upload_id}: {e}")
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error in add_model: {str(e)}")
+        logger.error(f"Error committing upload {upload_id}: {str(e)}")
         return jsonify({"error": str(e)}), 500
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+def _render_json(payload) -> str:
+    """``payload`` serialized exactly as ``jsonify`` would send it."""
+    return app.json.response(payload).get_data(as_text=True)
+
+def _cached_response(cached) -> ResponseReturnValue:
+    """A cached registry response, or 304 when the client already holds it."""
+    if request.if_none_match.contains(cached.etag):
+        response = Response(status=304)
+    else:
+        response = Response(cached.body, mimetype='application/json', headers=cached.headers)
+    response.set_etag(cached.etag)
+    # Clients may keep it, but must revalidate before each use
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/approved-models', methods=['GET'])
 def get_approved_models():
-    """Fetch all models where the status is 'approved'."""
+    """
+    Fetch approved models, oldest first, one page at a time. When more remain,
+    the X-Next-Cursor header holds the ``cursor`` for the next page.
+    """
     try:
-        # Query models with status 'approved'
-        approved_models = ModelRegistry.query.filter_by(status='approved').all()
-        
-        # Convert the result to a list of dictionaries
-        models_list = []
-        for model in approved_models:
-            models_list.append({
-                'model_id': model.model_id,
-                'model_name': model.model_name,
-                'nft_id': model.nft_id,
-                'teacher_model_cid': model.teacher_model_cid,
-                'student_model_cid': model.student_model_cid,
-                'global_model_cid': model.global_model_cid,
-                'created_at': model.created_at,
-                'status': model.status
-            })
-        
-        # Return the list of models in JSON format
-        return jsonify(models_list), 200
-    
+        limit = min(int(request.args.get('limit', APPROVED_MODELS_PAGE_SIZE)), APPROVED_MODELS_MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError("limit must be positive")
+        fields = request.args.get('fields')
+        fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else LISTING_FIELDS
+        created_after = request.args.get('created_after')
+        created_after = parse_timestamp(created_after) if created_after else None
+        created_before = request.args.get('created_before')
+        created_before = parse_timestamp(created_before) if created_before else None
+        cursor, task = request.args.get('cursor'), request.args.get('task')
+
+        def load():
+            models_list, next_cursor = list_models(
+                ModelRegistry, 'approved', limit,
+                cursor=cursor,
+                task=task,
+                created_after=created_after,
+                created_before=created_before,
+                fields=fields
+            )
+            return _render_json(models_list), {'X-Next-Cursor': next_cursor} if next_cursor else {}
+
+        key = json.dumps([limit, cursor, task, created_after and created_after.isoformat(),
+                          created_before and created_before.isoformat(), list(fields)])
+        return _cached_response(get_registry_cache().get_or_load('listing', key, load))
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _stream_model_archive(cache: BlobCache, archive_key: str, cids: list, names: list):
+    """
+    Chunks of the zip holding the blobs ``cids`` as ``names``. Uncached CIDs
+    are all downloaded at once and the zip is written while they arrive; the
+    blobs and the finished archive are added to the cache on the way.
+    """
+    # Open cached blobs now: an open file survives eviction, and a blob
+    # evicted between the lookup and the open is downloaded like any miss
+    streams, missing = {}, []
+    for i, cid in enumerate(cids):
+        try:
+            if cache.get(cid):
+                streams[i] = cache.iter_blob(cid)
+                continue
+        except FileNotFoundError:
+            pass
+        missing.append(i)
+    try:
+        downloads = open_ipfs_streams(
+            [cids[i] for i in missing],
+            f'http://{IPFS_SERVER_IP}:{IPFS_SERVER_PORT}'
+        )
+    except Exception:
+        close_all(streams.values())
+        raise
+    for i, download in zip(missing, downloads):
+        streams[i] = cache.tee(cids[i], download)
+    streams = [streams[i] for i in range(len(cids))]
+    logger.info(f"Building {archive_key}, {len(missing)} of {len(cids)} blobs from IPFS {cache.stats()}")
+    return cache.tee(archive_key, stream_zip(zip(names, streams)))
+
 @app.route("/fetch_model", methods=["GET"])
 def fetch_model() -> ResponseReturnValue:
-    """Fetch approved model files."""
+    """
+    Fetch approved model files: the archive built at approval (``archive_cid``),
+    or for older models a zip of the three artifacts. Its ETag is derived from
+    the CIDs: ``If-None-Match`` gets a 304, and ``Range``/``If-Range`` requests
+    are answered from the cached archive with 206. Otherwise a cached archive
+    is sent from disk, or streamed while it is downloaded from IPFS.
+    """
     model_name: Optional[str] = request.args.get("model_name")
     nft_id: Optional[str] = request.args.get("nft_id")
 
@@ -442,72 +729,174 @@ def fetch_model() -> ResponseReturnValue:
             model = ModelRegistry.query.filter_by(nft_id=nft_id, status='approved').first()
 
         if not model:
-            models['student'].add_model(task=task, model_type="model", value=model)
-            models['student'].add_model(task=task, model_type="tokenizer", value=tokenizer)
+            return jsonify({"error": "Model not found"}), 404
 
-            models['global'].add_model("model", model)
-            models['global'].add_model("tokenizer", tokenizer)
-            
-            teacher_model_io = BytesIO(models['teacher'])
-            student_model_io = BytesIO(models['student'])
-            global_model_io = BytesIO(models['global'])
-            zip_file = create_zip(student_model_io, teacher_model_io, global_model_io, 'test_model')
-    
-            return send_file(
-                zip_file,
-                as_attachment=True,
-                download_name=f"{model.model_name}_model_files.zip",
-                mimetype="application/zip"
-            )
-            
-        # Fetch IPFS data
-        teacher_model_data = fetch_ipfs_data(model.teacher_model_cid, f'http://{IPFS_SERVER_IP}:{IPFS_SERVER_PORT}')
-        student_model_data = fetch_ipfs_data(model.student_model_cid, f'http://{IPFS_SERVER_IP}:{IPFS_SERVER_PORT}')
-        global_model_data = fetch_ipfs_data(model.global_model_cid, f'http://{IPFS_SERVER_IP}:{IPFS_SERVER_PORT}')
-        
-        # Process the data
-        teacher_model_data = teacher_model_data['Data']['/']['bytes']
-        student_model_data = student_model_data['Data']['/']['bytes']
-        global_model_data = global_model_data['Data']['/']['bytes']
-
-        teacher_model_data = base64.b64decode(fix_base64_padding(teacher_model_data))
-        student_model_data = base64.b64decode(fix_base64_padding(student_model_data))
-        global_model_data = base64.b64decode(fix_base64_padding(global_model_data))
-
-        # Create zip file
-        teacher_model_io = BytesIO(teacher_model_data)
-        student_model_io = BytesIO(student_model_data)
-        global_model_io = BytesIO(global_model_data)
-        zip_file = create_zip(student_model_io, teacher_model_io, global_model_io, model.model_name)
-
-        return send_file(
-            zip_file,
-            as_attachment=True,
-            download_name=f"{model.model_name}_model_files.zip",
-            mimetype="application/zip"
+        cache = get_blob_cache()
+        cids = [model.student_model_cid, model.teacher_model_cid, model.global_model_cid]
+        names = [f"{model.model_name}_{kind}_model.zip" for kind in ("student", "teacher", "global")]
+        download_name = f"{model.model_name}_model_files.zip"
+
+        if model.archive_cid:
+            # Built at approval: serving it is a plain copy of one immutable blob
+            etag = archive_key = model.archive_cid
+            build_archive = lambda: cache.tee(archive_key, open_ipfs_streams(
+                [model.archive_cid], f'http://{IPFS_SERVER_IP}:{IPFS_SERVER_PORT}')[0])
+        elif not all(cids):
+            # An artifact that was never uploaded can't be zipped
+            return jsonify({"error": "Model files not found"}), 404
+        else:
+            # Approved before archives were pre-built: zip the three artifacts here.
+            # The result is fully determined by the CIDs and names, so that digest
+            # is both its ETag and its key in the blob cache
+            etag = hashlib.sha256("\0".join([model.model_name, *cids]).encode()).hexdigest()
+            archive_key = f"archive-{etag}"
+            build_archive = lambda: _stream_model_archive(cache, archive_key, cids, names)
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        archive_path = cache.get(archive_key)
+        if archive_path is None and request.range is not None:
+            # Byte ranges are served from the finished archive, so build it first
+            for _ in build_archive():
+                pass
+            archive_path = cache.get(archive_key)
+
+        if archive_path:
+            logger.info(f"Serving {download_name} from the blob cache {cache.stats()}")
+            return send_file(archive_path, as_attachment=True, download_name=download_name,
+                             mimetype="application/zip", conditional=True, etag=etag)
+
+        response = Response(
+            build_archive(),
+            mimetype="application/zip",
+            headers={
+                "Content-Disposition": f'attachment; filename="{download_name}"',
+                "Accept-Ranges": "bytes"
+            }
         )
+        response.set_etag(etag)
+        return response
 
     except Exception as e:
         logger.exception("Error fetching model files")
         return jsonify({"error": str(e)}), 500
 
+def _load_model_status(model_id: str):
+    """The cached /model_status response for ``model_id``, or None if there is no such model."""
+    def load():
+        with app.app_context():
+            model = ModelRegistry.query.filter_by(model_id=model_id).first()
+            if not model:
+                return None
+
+            # Live tallies from the vote ledger; Matrix is not contacted
+            voting_session = ModelVote.query.filter_by(model_id=model_id).first()
+            return _render_json({
+                "model_name": model.model_name,
+                "status": model.status,
+                "nft_id": model.nft_id,
+                "yes_votes": voting_session.yes_votes if voting_session else None,
+                "no_votes": voting_session.no_votes if voting_session else None
+            }), {}
+
+    return get_registry_cache().get_or_load('status', model_id, load)
+
 @app.route("/model_status/<model_id>", methods=["GET"])
 def get_model_status(model_id: str) -> ResponseReturnValue:
     """Get the status of a model."""
     try:
-        model = ModelRegistry.query.filter_by(model_id=model_id).first()
-        if not model:
+        cached = _load_model_status(model_id)
+        if cached is None:
             return jsonify({"error": "Model not found"}), 404
-        
+        return _cached_response(cached)
+    except Exception as e:
+        logger.error(f"Error fetching model status: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def _batch_ids(key: str) -> list:
+    """The list of string ids under ``key`` in the JSON body of a batch lookup."""
+    ids = (request.get_json(silent=True) or {}).get(key)
+    if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+        raise ValueError(f"Expected a JSON body with a list of strings in '{key}'")
+    if len(ids) > MAX_BATCH_IDS:
+        raise ValueError(f"At most {MAX_BATCH_IDS} ids per request")
+    return ids
+
+@app.route("/model_status:batch", methods=["POST"])
+def get_model_statuses() -> ResponseReturnValue:
+    """Get the status of many models, by ``model_ids``, in one request."""
+    try:
+        model_ids = _batch_ids("model_ids")
+        statuses = model_statuses(model_ids, ModelRegistry, ModelVote)
         return jsonify({
-            "model_name": model.model_name,
-            "status": model.status,
-            "nft_id": model.nft_id
+            "models": statuses,
+            "missing": [model_id for model_id in dict.fromkeys(model_ids) if model_id not in statuses]
         })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        logger.error(f"Error fetching model status: {str(e)}")
+        logger.error(f"Error fetching model statuses: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/model_cids:batch", methods=["POST"])
+def resolve_nft_ids() -> ResponseReturnValue:
+    """Resolve the artifact CIDs of many approved models, by ``nft_ids``, in one request."""
+    try:
+        nft_ids = _batch_ids("nft_ids")
+        resolved = nft_ids_to_cids(nft_ids, ModelRegistry)
+        return jsonify({
+            "models": resolved,
+            "missing": [nft_id for nft_id in dict.fromkeys(nft_ids) if nft_id not in resolved]
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error resolving NFT ids: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/model_status/<model_id>/events", methods=["GET"])
+def stream_model_status(model_id: str) -> ResponseReturnValue:
+    """
+    Server-Sent Events of a model's status: the current one, then each change
+    (state transitions and new votes) until it is approved, rejected or failed.
+    """
+    events = get_status_stream().events(
+        model_id, lambda: _load_model_status(model_id), last_event_id=request.headers.get('Last-Event-ID'))
+    return Response(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # Stop reverse proxies from buffering the stream
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route("/ready", methods=["GET"])
+def ready() -> ResponseReturnValue:
+    """
+    Readiness probe: 200 once the services requests depend on answer (the
+    registry database, the IPFS API and, when configured, the shared Redis
+    cache), else 503 with the error of each one that does not.
+    """
+    def check_database():
+        with session_scope(app, db) as session:
+            session.execute(text('SELECT 1'))
+
+    checks = {
+        "database": check_database,
+        "ipfs": lambda: check_ipfs(f'http://{IPFS_SERVER_IP}:{IPFS_SERVER_PORT}', READY_TIMEOUT),
+        "registry_cache": lambda: get_registry_cache().ping(),
+    }
+    errors = {}
+    for name, check in checks.items():
+        try:
+            check()
+        except Exception as e:
+            errors[name] = str(e)
+    if errors:
+        return jsonify({"status": "unavailable", "errors": errors}), 503
+    return jsonify({"status": "ready"}), 200
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
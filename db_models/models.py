@@ -8,24 +8,36 @@ db = SQLAlchemy()
 class ModelRegistry(db.Model):
     """Database model for storing registered ML models."""
     __tablename__ = "model_registry"
+    __table_args__ = (
+        # Listing approved models in created_at order, optionally for one task
+        db.Index('ix_model_registry_status_created', 'status', 'created_at', 'model_id'),
+        db.Index('ix_model_registry_status_task_created', 'status', 'task', 'created_at', 'model_id'),
+        # Lookups by name (/fetch_model) and by NFT
+        db.Index('ix_model_registry_name_status', 'model_name', 'status'),
+        db.Index('ix_model_registry_nft_status', 'nft_id', 'status'),
+    )
     model_id = db.Column(db.String(255), primary_key=True)
     model_name = db.Column(db.String(255), unique=False, nullable=False)
+    task = db.Column(db.String(255))
     nft_id = db.Column(db.String(255), nullable=False)
     teacher_model_cid = db.Column(db.String(255))
     student_model_cid = db.Column(db.String(255))
     global_model_cid = db.Column(db.String(255))
-    created_at = db.Column(db.DateTime, default=datetime.now(UTC))
-    status = db.Column(db.String(50), default='pending')  # pending, approved, rejected
+    archive_cid = db.Column(db.String(255))  # zip of the three artifacts served by /fetch_model
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(UTC))
+    status = db.Column(db.String(50), default='pending')  # pending, finalizing, approved, rejected, failed
 
     def to_dict(self):
         """Converts the ModelRegistry instance to a dictionary for JSON serialization."""
         return {
             "model_id": self.model_id,
             "model_name": self.model_name,
+            "task": self.task,
             "nft_id": self.nft_id,
             "teacher_model_cid": self.teacher_model_cid,
             "student_model_cid": self.student_model_cid,
             "global_model_cid": self.global_model_cid,
+            "archive_cid": self.archive_cid,
             "created_at": self.created_at.isoformat(),  # Convert datetime to ISO format string
             "status": self.status
         }
@@ -38,7 +50,21 @@ class ModelVote(db.Model):
     """Track votes for model proposals."""
     __tablename__ = "model_votes"
     id = db.Column(db.Integer, primary_key=True)
+    model_id = db.Column(db.String(255), index=True)
     model_name = db.Column(db.String(255), nullable=False)
+    # Live tallies of each voter's latest vote, kept in step with vote_events
     yes_votes = db.Column(db.Integer, default=0)
     no_votes = db.Column(db.Integer, default=0)
-    voting_start = db.Column(db.DateTime, default=datetime.now(UTC))
\ No newline at end of file
+    voting_start = db.Column(db.DateTime, default=datetime.now(UTC))
+
+class VoteEvent(db.Model):
+    """One vote message read from the Matrix voting rooms."""
+    __tablename__ = "vote_events"
+    __table_args__ = (
+        db.Index('ix_vote_events_model_voter', 'model_id', 'voter', 'cast_at'),
+    )
+    event_id = db.Column(db.String(255), primary_key=True)
+    model_id = db.Column(db.String(255), nullable=False)
+    voter = db.Column(db.String(255), nullable=False)
+    vote = db.Column(db.String(8), nullable=False)  # yes, no
+    cast_at = db.Column(db.BigInteger, nullable=False)  # Matrix server timestamp, ms
\ No newline at end of file
@@ -0,0 +1,16 @@
+import os
+
+# Status event streams stay open for a whole vote. Green-thread workers hold
+# each one as an idle greenlet instead of a blocked OS thread, so a worker
+# serves up to worker_connections of them alongside ordinary requests
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+worker_class = 'eventlet'
+# A green thread only gives way to the others when it waits on I/O. Uploads
+# (inflating archives, hashing and writing chunks) yield after every chunk,
+# but each chunk still holds its worker for a moment, and any other
+# CPU-bound request holds it for as long as it runs. More workers keep
+# /ready and the event streams answering meanwhile. The cost is that each
+# worker is a separate process, with its own database pool, registry cache
+# and change subscription
+workers = int(os.getenv('GUNICORN_WORKERS', 2))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
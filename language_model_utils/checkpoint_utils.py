@@ -0,0 +1,279 @@
+import json
+import os
+import struct
+import threading
+from contextlib import ExitStack
+from pathlib import Path
+import torch
+from safetensors import safe_open
+
+SAFE_WEIGHTS_NAME = "model.safetensors"
+SAFE_WEIGHTS_INDEX_NAME = "model.safetensors.index.json"
+DEFAULT_MAX_SHARD_SIZE = 1024 ** 3
+
+_DTYPE_SIZES = {
+    "F64": 8, "I64": 8, "U64": 8,
+    "F32": 4, "I32": 4, "U32": 4,
+    "F16": 2, "BF16": 2, "I16": 2, "U16": 2,
+    "F8_E4M3": 1, "F8_E5M2": 1, "I8": 1, "U8": 1, "BOOL": 1,
+}
+
+TORCH_TO_SAFETENSORS_DTYPE = {
+    torch.float64: "F64", torch.float32: "F32", torch.float16: "F16", torch.bfloat16: "BF16",
+    torch.int64: "I64", torch.int32: "I32", torch.int16: "I16", torch.int8: "I8",
+    torch.uint8: "U8", torch.bool: "BOOL",
+}
+for _name, _code in (("float8_e4m3fn", "F8_E4M3"), ("float8_e5m2", "F8_E5M2")):
+    if hasattr(torch, _name):
+        TORCH_TO_SAFETENSORS_DTYPE[getattr(torch, _name)] = _code
+
+
+SAFETENSORS_TO_TORCH_DTYPE = {code: dtype for dtype, code in TORCH_TO_SAFETENSORS_DTYPE.items()}
+
+
+def tensor_nbytes(dtype: str, shape) -> int:
+    """Size in bytes of a tensor described by a safetensors dtype code and shape."""
+    count = 1
+    for dim in shape:
+        count *= dim
+    return count * _DTYPE_SIZES[dtype]
+
+
+class SafetensorsCheckpoint:
+    """
+    Read-only, memory-mapped view of a safetensors checkpoint.
+
+    ``path`` may be a single ``.safetensors`` file, a sharded index json, or a
+    Hugging Face model directory holding either. Tensors are only read when
+    ``get_tensor`` is called, so opening a checkpoint costs no more than its
+    headers. Use as a context manager to close the underlying mmaps.
+    """
+
+    def __init__(self, path):
+        path = Path(path)
+        if path.is_dir():
+            index = path / SAFE_WEIGHTS_INDEX_NAME
+            path = index if index.exists() else path / SAFE_WEIGHTS_NAME
+        if not path.exists():
+            raise FileNotFoundError(f"No safetensors checkpoint at {path}")
+
+        self.path = path
+        if path.name.endswith(".index.json"):
+            with open(path) as f:
+                weight_map = json.load(f)["weight_map"]
+            self.weight_map = {key: path.parent / shard for key, shard in weight_map.items()}
+        else:
+            self.weight_map = None
+        self._handles = {}
+        self._stack = ExitStack()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._stack.close()
+        self._handles.clear()
+
+    def _handle(self, shard):
+        with self._lock:
+            if shard not in self._handles:
+                self._handles[shard] = self._stack.enter_context(safe_open(str(shard), framework="pt", device="cpu"))
+            return self._handles[shard]
+
+    def _shard(self, key):
+        return self.path if self.weight_map is None else self.weight_map[key]
+
+    @property
+    def shards(self):
+        return [self.path] if self.weight_map is None else sorted(set(self.weight_map.values()))
+
+    def keys(self):
+        if self.weight_map is not None:
+            return list(self.weight_map.keys())
+        return list(self._handle(self.path).keys())
+
+    def __contains__(self, key):
+        if self.weight_map is not None:
+            return key in self.weight_map
+        return key in self._handle(self.path).keys()
+
+    def metadata(self):
+        return self._handle(self.shards[0]).metadata() or {}
+
+    def get_tensor(self, key) -> torch.Tensor:
+        return self._handle(self._shard(key)).get_tensor(key)
+
+    def dtype(self, key) -> str:
+        return self._handle(self._shard(key)).get_slice(key).get_dtype()
+
+    def shape(self, key) -> list:
+        return list(self._handle(self._shard(key)).get_slice(key).get_shape())
+
+    def nbytes(self, key) -> int:
+        return tensor_nbytes(self.dtype(key), self.shape(key))
+
+
+def read_safetensors_header(path):
+    """Return the parsed header of a safetensors file and the offset its tensor data starts at."""
+    with open(path, "rb") as f:
+        (header_size,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_size))
+    return header, 8 + header_size
+
+
+def mmap_state_dict(path):
+    """
+    Tensors of a safetensors checkpoint (file, index json or directory) backed
+    by a private memory map of each shard.
+
+    Nothing is copied: pages are read on demand and live in the page cache,
+    where every process mapping the same file shares them. Writing to a tensor
+    copies just the touched pages into the writing process; the file itself is
+    never modified. Tensors that can't be viewed in place (unaligned or of a
+    dtype torch lacks) are read normally.
+    """
+    checkpoint = SafetensorsCheckpoint(path)
+    state_dict = {}
+    with checkpoint:
+        for shard in checkpoint.shards:
+            header, data_start = read_safetensors_header(shard)
+            header.pop("__metadata__", None)
+            storage = torch.UntypedStorage.from_file(str(shard), shared=False, nbytes=os.path.getsize(shard))
+            for key, info in header.items():
+                dtype = SAFETENSORS_TO_TORCH_DTYPE.get(info["dtype"])
+                start = data_start + info["data_offsets"][0]
+                if dtype is None or start % _DTYPE_SIZES[info["dtype"]]:
+                    state_dict[key] = checkpoint.get_tensor(key)
+                    continue
+                state_dict[key] = torch.empty(0, dtype=dtype).set_(
+                    storage, start // _DTYPE_SIZES[info["dtype"]], info["shape"]
+                )
+    return state_dict
+
+
+class _SafetensorsFileWriter:
+    """
+    Write a single safetensors file tensor by tensor. The header is laid out
+    up front from the declared dtypes and shapes, so no tensor has to be kept
+    around once it has been written.
+    """
+
+    def __init__(self, path, entries, metadata=None):
+        header, offset = {}, 0
+        for key, dtype, shape in entries:
+            size = tensor_nbytes(dtype, shape)
+            header[key] = {"dtype": dtype, "shape": list(shape), "data_offsets": [offset, offset + size]}
+            offset += size
+        if metadata:
+            header["__metadata__"] = metadata
+
+        header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        # Pad to 8 bytes so every tensor stays aligned for memory-mapped reads
+        header_bytes += b" " * (-len(header_bytes) % 8)
+
+        self.path = path
+        self.size = offset
+        self._expected = [(key, header[key]) for key, _, _ in entries]
+        self._file = open(path, "wb")
+        self._file.write(struct.pack("<Q", len(header_bytes)))
+        self._file.write(header_bytes)
+
+    def write(self, key, tensor: torch.Tensor) -> None:
+        expected_key, info = self._expected.pop(0)
+        if key != expected_key:
+            raise ValueError(f"Expected tensor {expected_key}, got {key}")
+        if TORCH_TO_SAFETENSORS_DTYPE[tensor.dtype] != info["dtype"] or list(tensor.shape) != info["shape"]:
+            raise ValueError(f"Tensor {key} does not match its declared dtype/shape")
+        data = tensor.detach().to("cpu").contiguous().reshape(-1).view(torch.uint8)
+        self._file.write(memoryview(data.numpy()))
+
+    def close(self) -> None:
+        self._file.close()
+        if self._expected:
+            raise ValueError(f"{len(self._expected)} declared tensors were never written to {self.path}")
+
+
+def plan_shards(entries, max_shard_size=DEFAULT_MAX_SHARD_SIZE):
+    """
+    Split ``(key, dtype, shape)`` entries into shards of at most
+    ``max_shard_size`` bytes (a single larger tensor gets a shard of its own).
+    Within a shard, wider dtypes come first to keep offsets aligned.
+    """
+    shards, current, current_size = [], [], 0
+    for entry in entries:
+        size = tensor_nbytes(entry[1], entry[2])
+        if current and current_size + size > max_shard_size:
+            shards.append(current)
+            current, current_size = [], 0
+        current.append(entry)
+        current_size += size
+    if current:
+        shards.append(current)
+    return [sorted(shard, key=lambda entry: -_DTYPE_SIZES[entry[1]]) for shard in shards]
+
+
+class ShardedSafetensorsWriter:
+    """
+    Write a checkpoint as Hugging Face style safetensors shards
+    (``model.safetensors`` or ``model-0000x-of-0000n.safetensors`` plus index).
+
+    The full list of ``(key, dtype, shape)`` entries is declared up front;
+    tensors must then be passed to ``write`` in ``order``.
+    """
+
+    def __init__(self, output_dir, entries, max_shard_size=DEFAULT_MAX_SHARD_SIZE, metadata=None):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.metadata = {"format": "pt", **(metadata or {})}
+        self._shards = plan_shards(entries, max_shard_size)
+        self.order = [key for shard in self._shards for key, _, _ in shard]
+
+        count = len(self._shards)
+        if count == 1:
+            self._shard_names = [SAFE_WEIGHTS_NAME]
+        else:
+            self._shard_names = [f"model-{i + 1:05d}-of-{count:05d}.safetensors" for i in range(count)]
+        self._shard_of = {key: i for i, shard in enumerate(self._shards) for key, _, _ in shard}
+        self._current_index = -1
+        self._current = None
+        self.total_size = 0
+
+    def write(self, key, tensor: torch.Tensor) -> None:
+        index = self._shard_of[key]
+        if index != self._current_index:
+            self._close_current()
+            self._current_index = index
+            self._current = _SafetensorsFileWriter(
+                self.output_dir / self._shard_names[index], self._shards[index], self.metadata
+            )
+        self._current.write(key, tensor)
+
+    def _close_current(self):
+        if self._current is not None:
+            self._current.close()
+            self.total_size += self._current.size
+            self._current = None
+
+    def close(self) -> None:
+        self._close_current()
+        index_path = self.output_dir / SAFE_WEIGHTS_INDEX_NAME
+        if len(self._shards) > 1:
+            weight_map = {key: self._shard_names[i] for key, i in self._shard_of.items()}
+            with open(index_path, "w") as f:
+                json.dump({"metadata": {"total_size": self.total_size}, "weight_map": weight_map}, f, indent=2)
+        elif index_path.exists():
+            os.remove(index_path)
+
+
+def save_state_dict_sharded(state_dict, output_dir, max_shard_size=DEFAULT_MAX_SHARD_SIZE, metadata=None):
+    """Write an in-memory state dict through ``ShardedSafetensorsWriter``."""
+    entries = [(key, TORCH_TO_SAFETENSORS_DTYPE[t.dtype], list(t.shape)) for key, t in state_dict.items()]
+    writer = ShardedSafetensorsWriter(output_dir, entries, max_shard_size, metadata)
+    for key in writer.order:
+        writer.write(key, state_dict[key])
+    writer.close()
+    return output_dir
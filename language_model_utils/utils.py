@@ -1,7 +1,118 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import os
+import shutil
 import torch
+from torch.overrides import TorchFunctionMode
+from .checkpoint_utils import (
+    DEFAULT_MAX_SHARD_SIZE,
+    SafetensorsCheckpoint,
+    ShardedSafetensorsWriter,
+    TORCH_TO_SAFETENSORS_DTYPE,
+    mmap_state_dict,
+)
 
-def ties_merge_models(model_a, model_b, threshold=1e-5):
+# Non-weight files copied next to a merged checkpoint so it stays loadable with from_pretrained
+MODEL_CONFIG_FILES = ("config.json", "generation_config.json")
+
+# Parallel merge settings: thread count, scratch memory the pool may use,
+# and the size above which a single tensor is split into row slices
+MERGE_WORKERS = int(os.getenv('MERGE_WORKERS', 1))
+MERGE_MEMORY_BUDGET = int(os.getenv('MERGE_MEMORY_BUDGET', 4 * 1024 ** 3))
+MERGE_SLICE_BYTES = int(os.getenv('MERGE_SLICE_BYTES', 64 * 1024 ** 2))
+
+# Load stored models as copy-on-write views of their safetensors files, so
+# every process on the host shares one copy of the weights
+MODEL_MMAP = os.getenv('MODEL_MMAP', '1') == '1'
+
+def _copy_model_config(model_path, output_dir):
+    """Copy config files from a checkpoint's directory next to merged weights."""
+    model_dir = Path(model_path) if Path(model_path).is_dir() else Path(model_path).parent
+    output_dir = Path(output_dir)
+    for name in MODEL_CONFIG_FILES:
+        if (model_dir / name).exists() and model_dir.resolve() != output_dir.resolve():
+            shutil.copyfile(model_dir / name, output_dir / name)
+
+def _resolve_sign_conflicts(param_a, param_b, inplace=False):
+    """Elementwise part of the pairwise merge: mean where signs agree, else the larger magnitude."""
+    sign_mask = torch.sign(param_a) == torch.sign(param_b)
+    mean = torch.add(param_a, param_b).div_(2)
+    if inplace:
+        magnitude = torch.maximum(param_a.abs_(), param_b.abs_(), out=param_a)
+    else:
+        magnitude = param_a.abs()
+        torch.maximum(magnitude, param_b.abs(), out=magnitude)
+    return torch.where(sign_mask, mean, magnitude, out=mean)
+
+def ties_merge_tensor(param_a, param_b, threshold=1e-5, inplace=False, slice_pool=None,
+                      slice_bytes=MERGE_SLICE_BYTES):
+    """
+    TIES-merge a single pair of tensors, as done per key by ``ties_merge_models``.
+
+    Args:
+        param_a: Tensor from model A; its dtype is kept.
+        param_b: Matching tensor from model B.
+        threshold: Threshold to consider marginal parameter changes.
+        inplace: Reuse the storage of both inputs as scratch space. Only pass
+            True for tensors the caller owns (e.g. freshly read from disk).
+        slice_pool: Optional executor; tensors larger than ``slice_bytes`` are
+            then resolved as row slices in parallel. The result is identical.
+    Returns:
+        The merged tensor. Integer buffers and tensors whose shapes differ
+        are taken from model A unchanged.
+    """
+    if not param_a.is_floating_point() or param_a.shape != param_b.shape:
+        return param_a
+
+    # Reset marginal changes
+    if torch.sub(param_a, param_b).abs_().mean() < threshold:
+        return param_a
+
+    # Resolve sign conflicts, slice by slice for large tensors
+    nbytes = param_a.numel() * param_a.element_size()
+    if slice_pool is None or param_a.dim() == 0 or nbytes <= slice_bytes:
+        return _resolve_sign_conflicts(param_a, param_b, inplace).to(param_a.dtype)
+
+    resolved_param = torch.empty_like(param_a)
+    rows_per_slice = max(1, param_a.shape[0] * slice_bytes // nbytes)
+
+    def resolve_rows(start):
+        stop = start + rows_per_slice
+        resolved_param[start:stop] = _resolve_sign_conflicts(param_a[start:stop], param_b[start:stop], inplace)
+
+    for future in [slice_pool.submit(resolve_rows, start) for start in range(0, param_a.shape[0], rows_per_slice)]:
+        future.result()
+    return resolved_param
+
+def _merge_in_pool(keys, merge_key, tensor_nbytes, consume, workers, memory_budget):
+    """
+    Run ``merge_key(key, slice_pool)`` for every key on a thread pool and pass
+    the results to ``consume(key, tensor)`` in key order, so the output never
+    depends on scheduling. Work is only submitted while the estimated working
+    set (inputs, scratch and pending results) fits in ``memory_budget`` bytes.
+    """
+    pending = deque()
+    in_flight = 0
+
+    def consume_next():
+        nonlocal in_flight
+        key, cost, future = pending.popleft()
+        consume(key, future.result())
+        in_flight -= cost
+
+    with ThreadPoolExecutor(workers, thread_name_prefix="ties-merge") as tensor_pool, \
+         ThreadPoolExecutor(workers, thread_name_prefix="ties-merge-slice") as slice_pool:
+        for key in keys:
+            cost = 4 * tensor_nbytes(key)
+            while pending and in_flight + cost > memory_budget:
+                consume_next()
+            pending.append((key, cost, tensor_pool.submit(merge_key, key, slice_pool)))
+            in_flight += cost
+        while pending:
+            consume_next()
+
+def ties_merge_models(model_a, model_b, threshold=1e-5, workers=None, memory_budget=MERGE_MEMORY_BUDGET):
   """
   Perform TIES merging on two Hugging Face models.
 
@@ -9,37 +120,215 @@ def ties_merge_models(model_a, model_b, threshold=1e-5):
       model_a: Model A (e.g., BioGPT).
       model_b: Model B (e.g., BioBERT).
       threshold: Threshold to consider marginal parameter changes.
+      workers: Number of merge threads (defaults to ``MERGE_WORKERS``); 1 merges serially.
+      memory_budget: Bytes of merge scratch space the worker pool may use at once.
   Returns:
       A merged Hugging Face model.
   """
   state_dict_a = model_a.state_dict()
   state_dict_b = model_b.state_dict()
   merged_state_dict = {}
+  workers = workers or MERGE_WORKERS
 
-  for key in state_dict_a.keys():
+  def merge_key(key, slice_pool=None):
       if key in state_dict_b:
-          param_a = state_dict_a[key]
-          param_b = state_dict_b[key]
-
-          # Reset marginal changes
-          if torch.abs(param_a - param_b).mean() < threshold:
-              merged_state_dict[key] = param_a
-              continue
+          return ties_merge_tensor(state_dict_a[key], state_dict_b[key], threshold, slice_pool=slice_pool)
+      return state_dict_a[key]  # Default to model A's parameters
 
-          # Resolve sign conflicts
-          sign_mask = torch.sign(param_a) == torch.sign(param_b)
-          resolved_param = torch.where(sign_mask, (param_a + param_b) / 2, param_a.abs().max(param_b.abs()))
+  if workers > 1:
+      def tensor_nbytes(key):
+          return state_dict_a[key].numel() * state_dict_a[key].element_size()
 
-          # Selective merging based on resolved sign
-          merged_state_dict[key] = resolved_param
-      else:
-          merged_state_dict[key] = state_dict_a[key]  # Default to model A's parameters
+      _merge_in_pool(list(state_dict_a.keys()), merge_key, tensor_nbytes,
+                     merged_state_dict.__setitem__, workers, memory_budget)
+  else:
+      for key in state_dict_a.keys():
+          merged_state_dict[key] = merge_key(key)
 
   # Load the merged state dict into model A's architecture
   model_a.load_state_dict(merged_state_dict)
 
   return model_a
 
+def ties_merge_update(model_a, model_b, threshold=1e-5, trim=0.0, workers=None,
+                      memory_budget=MERGE_MEMORY_BUDGET):
+  """
+  TIES-merge model B into model A like ``ties_merge_models`` and return the
+  sparse update that was applied, so it can be persisted on its own.
+
+  Args:
+      model_a: Model A, updated in place.
+      model_b: Model B.
+      threshold: Threshold to consider marginal parameter changes.
+      trim: Elements that move by no more than this keep their old value and
+          are left out of the update (0.0 keeps every change).
+      workers: Number of merge threads (defaults to ``MERGE_WORKERS``).
+      memory_budget: Bytes of merge scratch space the worker pool may use at once.
+  Returns:
+      ``(model_a, update)`` where ``update`` maps parameter names to
+      ``(flat_indices, new_values)`` for every tensor that changed; mostly
+      changed tensors are kept whole as ``(None, new_tensor)``.
+  """
+  state_dict_a = model_a.state_dict()
+  state_dict_b = model_b.state_dict()
+  workers = workers or MERGE_WORKERS
+  update = {}
+
+  # Tied weights appear under several names; only record each storage once
+  keys, seen = [], set()
+  for key, param in state_dict_a.items():
+      if key in state_dict_b and param.data_ptr() not in seen:
+          seen.add(param.data_ptr())
+          keys.append(key)
+
+  def merge_key(key, slice_pool=None):
+      param_a = state_dict_a[key]
+      merged = ties_merge_tensor(param_a, state_dict_b[key], threshold, slice_pool=slice_pool)
+      if merged is param_a:
+          return None
+      changed = torch.sub(merged, param_a).abs_().view(-1) > trim
+      indices = changed.nonzero().squeeze(1)
+      if indices.numel() == 0:
+          return None
+      if merged.numel() < 2 ** 31:
+          indices = indices.to(torch.int32)
+      # Dense tensors are cheaper to store whole than as (index, value) pairs
+      if indices.numel() * (indices.element_size() + merged.element_size()) >= merged.numel() * merged.element_size():
+          if trim > 0:
+              merged.view(-1)[~changed] = param_a.view(-1)[~changed]
+          return None, merged
+      return indices, merged.view(-1)[indices]
+
+  def collect(key, entry):
+      if entry is not None:
+          update[key] = entry
+
+  if workers > 1:
+      def tensor_nbytes(key):
+          return state_dict_a[key].numel() * state_dict_a[key].element_size()
+
+      _merge_in_pool(keys, merge_key, tensor_nbytes, collect, workers, memory_budget)
+  else:
+      for key in keys:
+          collect(key, merge_key(key))
+
+  apply_sparse_update(model_a, update)
+  return model_a, update
+
+def apply_sparse_update(model, update):
+  """
+  Write ``{name: (flat_indices, new_values)}`` into a model's parameters in
+  place. ``flat_indices`` of None means ``new_values`` is the whole tensor.
+  """
+  state_dict = model.state_dict()
+  with torch.no_grad():
+      for key, (indices, values) in update.items():
+          if indices is None:
+              state_dict[key].copy_(values)
+          else:
+              state_dict[key].view(-1)[indices.long()] = values.to(state_dict[key].dtype)
+
+def ties_merge_tensors(params, threshold=1e-5):
+  """
+  TIES-merge the same tensor from N models in one batched pass.
+
+  Args:
+      params: Tensors to merge; the first one is the base whose dtype and shape are kept.
+      threshold: Threshold to consider marginal parameter changes.
+  Returns:
+      The merged tensor. With two tensors whose signs agree this is the same
+      as ``ties_merge_tensor``; on sign conflicts the elected sign is kept
+      instead of the bare magnitude.
+  """
+  base = params[0]
+  if not base.is_floating_point():
+      return base
+
+  # Trim: contributions that only marginally differ from the base are reset
+  candidates = [param for param in params[1:] if param.shape == base.shape]
+  contributions = [base]
+  for param in candidates:
+      if torch.sub(base, param).abs_().mean() >= threshold:
+          contributions.append(param)
+  if len(contributions) == 1:
+      return base
+
+  stacked = torch.empty((len(contributions), *base.shape), dtype=torch.promote_types(base.dtype, torch.float32))
+  for i, param in enumerate(contributions):
+      stacked[i].copy_(param)
+
+  # Elect sign: the sign of the summed contributions wins per element
+  elected_sign = torch.sign(stacked.sum(dim=0))
+
+  # Disjoint mean: average only the values that agree with the elected sign
+  agree = torch.sign(stacked) == elected_sign
+  counts = agree.sum(dim=0).clamp_(min=1)
+  merged = stacked.mul_(agree).sum(dim=0).div_(counts)
+  return merged.to(base.dtype)
+
+def _state_source(source):
+  """Open a merge source: a model (state dict) or a safetensors checkpoint path."""
+  if hasattr(source, "state_dict"):
+      return source.state_dict()
+  return SafetensorsCheckpoint(source)
+
+def ties_merge_many(sources, threshold=1e-5, output_dir=None, max_shard_size=DEFAULT_MAX_SHARD_SIZE):
+  """
+  Perform TIES merging on N models at once.
+
+  Instead of folding models in pairwise (K merges and K ``load_state_dict``
+  calls for K models), every tensor is trimmed, sign-elected and
+  disjoint-averaged across all sources in a single pass.
+
+  Args:
+      sources: Hugging Face models and/or safetensors checkpoint paths. The first
+          one is the base: its keys, dtypes and shapes define the result.
+      threshold: Threshold to consider marginal parameter changes.
+      output_dir: If given, write the merged weights there as safetensors shards
+          and return the directory; otherwise the first source must be a model,
+          which receives the merged weights and is returned.
+      max_shard_size: Largest output shard in bytes when writing to ``output_dir``.
+  """
+  if not sources:
+      raise ValueError("Nothing to merge")
+  if output_dir is None and not hasattr(sources[0], "state_dict"):
+      raise ValueError("Pass output_dir when the base is a checkpoint path")
+
+  states = [_state_source(source) for source in sources]
+  try:
+      base = states[0]
+
+      def get(state, key):
+          return state[key] if isinstance(state, dict) else state.get_tensor(key)
+
+      def merged_tensor(key):
+          params = [get(state, key) for state in states if key in state]
+          return ties_merge_tensors(params, threshold)
+
+      if output_dir is None:
+          merged_state_dict = {key: merged_tensor(key) for key in base.keys()}
+          sources[0].load_state_dict(merged_state_dict)
+          return sources[0]
+
+      if isinstance(base, dict):
+          entries = [(key, TORCH_TO_SAFETENSORS_DTYPE[t.dtype], list(t.shape)) for key, t in base.items()]
+          metadata = None
+      else:
+          entries = [(key, base.dtype(key), base.shape(key)) for key in base.keys()]
+          metadata = base.metadata()
+      writer = ShardedSafetensorsWriter(output_dir, entries, max_shard_size, metadata)
+      for key in writer.order:
+          writer.write(key, merged_tensor(key))
+      writer.close()
+      if not isinstance(base, dict):
+          _copy_model_config(sources[0], output_dir)
+      print(f"Merged model saved at {output_dir}")
+      return Path(output_dir)
+  finally:
+      for state in states:
+          if isinstance(state, SafetensorsCheckpoint):
+              state.close()
+
 def merge_tokenizer_vocabularies(tokenizer_a, tokenizer_b):
   """
   Merge the vocabularies of two tokenizers.
@@ -77,4 +366,105 @@ def save_huggingface_model(model, save_dir):
     save_dir = Path(save_dir)
     save_dir.mkdir(parents=True, exist_ok=True)
     model.save_pretrained(save_dir)
-    print(f"Merged model saved at {save_dir}")
\ No newline at end of file
+    print(f"Merged model saved at {save_dir}")
+
+def ties_merge_safetensors(model_a_path, model_b_path, output_dir, threshold=1e-5,
+                           max_shard_size=DEFAULT_MAX_SHARD_SIZE, workers=None,
+                           memory_budget=MERGE_MEMORY_BUDGET):
+    """
+    Perform TIES merging on two safetensors checkpoints without loading either model.
+
+    Tensors are read one pair at a time from the memory-mapped checkpoints,
+    merged in place and streamed into the output shards, so peak memory is
+    a few times the largest single tensor rather than the whole model. The
+    merged weights match ``ties_merge_models`` on the same models.
+
+    Args:
+        model_a_path: Model directory, ``.safetensors`` file or shard index of model A.
+        model_b_path: The same for model B.
+        output_dir: Directory the merged ``model.safetensors`` (or shards + index) is written to.
+        threshold: Threshold to consider marginal parameter changes.
+        max_shard_size: Largest output shard in bytes.
+        workers: Number of merge threads (defaults to ``MERGE_WORKERS``); 1 merges serially.
+        memory_budget: Bytes of tensors the worker pool may hold at once.
+    Returns:
+        ``output_dir``.
+    """
+    output_dir = Path(output_dir)
+    workers = workers or MERGE_WORKERS
+    with SafetensorsCheckpoint(model_a_path) as checkpoint_a, SafetensorsCheckpoint(model_b_path) as checkpoint_b:
+        entries = [(key, checkpoint_a.dtype(key), checkpoint_a.shape(key)) for key in checkpoint_a.keys()]
+        writer = ShardedSafetensorsWriter(output_dir, entries, max_shard_size, checkpoint_a.metadata())
+
+        def merge_key(key, slice_pool=None):
+            param_a = checkpoint_a.get_tensor(key)
+            if key in checkpoint_b:
+                return ties_merge_tensor(param_a, checkpoint_b.get_tensor(key), threshold,
+                                         inplace=True, slice_pool=slice_pool)
+            return param_a  # Default to model A's parameters
+
+        if workers > 1:
+            _merge_in_pool(writer.order, merge_key, checkpoint_a.nbytes, writer.write, workers, memory_budget)
+        else:
+            for key in writer.order:
+                writer.write(key, merge_key(key))
+        writer.close()
+
+    _copy_model_config(model_a_path, output_dir)
+    print(f"Merged model saved at {output_dir}")
+    return output_dir
+
+class _ParametersOnMeta(TorchFunctionMode):
+    """
+    Create modules without allocating their parameters (buffers stay real).
+
+    torch.nn layers allocate parameters with ``torch.empty``, which this mode
+    places on the meta device, while buffers such as position ids come from
+    ``arange``/``zeros`` and are often missing from checkpoints, so they are
+    left alone. Like ``torch.device("meta")``, the mode only applies to the
+    thread that entered it.
+    """
+
+    def __torch_function__(self, func, types, args=(), kwargs=None):
+        kwargs = kwargs or {}
+        if func is torch.empty and kwargs.get("device") is None:
+            kwargs["device"] = "meta"
+        return func(*args, **kwargs)
+
+def attach_huggingface_model(load_dir):
+    """
+    Build a model saved with save_pretrained around ``mmap_state_dict`` views
+    of its safetensors instead of copies. Concurrent workers loading the same
+    directory share the weights through the page cache; a worker that merges
+    into the model only pays for the pages it changes.
+    """
+    from transformers import AutoConfig, AutoModel
+    config = AutoConfig.from_pretrained(load_dir)
+    state_dict = mmap_state_dict(load_dir)
+    with _ParametersOnMeta():
+        model = AutoModel.from_config(config)
+    result = model.load_state_dict(state_dict, strict=False, assign=True)
+    model.tie_weights()
+    missing = [name for name, param in model.named_parameters() if param.is_meta]
+    if missing or result.unexpected_keys:
+        raise ValueError(f"{load_dir} does not match its config: missing {missing}, unexpected {result.unexpected_keys}")
+    return model.eval()
+
+def load_huggingface_model(load_dir, mmap=None):
+    """
+    Load a Hugging Face model saved with save_pretrained. With ``mmap``
+    (default ``MODEL_MMAP``) the weights are attached copy-on-write; checkpoints
+    that can't be attached that way are loaded normally.
+    """
+    if MODEL_MMAP if mmap is None else mmap:
+        try:
+            return attach_huggingface_model(load_dir)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"Loading {load_dir} without mmap: {e}")
+    from transformers import AutoModel
+    return AutoModel.from_pretrained(load_dir)
+
+def load_huggingface_tokenizer(load_dir):
+    """Load a Hugging Face tokenizer saved with save_pretrained."""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(load_dir)
@@ -1,9 +1,43 @@
-from language_model_utils.utils import merge_tokenizer_vocabularies, ties_merge_models
+import os
+from language_model_utils.utils import merge_tokenizer_vocabularies, ties_merge_update
+
+# Merged elements that move by no more than this are left out of the persisted delta
+GLOBAL_DELTA_TRIM = float(os.getenv('GLOBAL_DELTA_TRIM', 0.0))
 
 class GlobalModel:
-  def __init__(self):
-      self.tokenizer = None
-      self.model = None
+  def __init__(self, loader=None):
+      self._tokenizer = None
+      self._model = None
+      # Changes since the last save, written out as deltas by GlobalModelStore
+      self.pending_updates = []
+      self.needs_full_save = False
+      # Deferred restore from a GlobalModelStore, run on first access
+      self.loader = loader
+
+  def _load(self):
+      if self.loader is not None:
+          loader, self.loader = self.loader, None
+          self._model, self._tokenizer = loader()
+
+  @property
+  def model(self):
+      self._load()
+      return self._model
+
+  @model.setter
+  def model(self, value):
+      self._load()
+      self._model = value
+
+  @property
+  def tokenizer(self):
+      self._load()
+      return self._tokenizer
+
+  @tokenizer.setter
+  def tokenizer(self, value):
+      self._load()
+      self._tokenizer = value
 
   def add_model(self, model_type, value):
       
@@ -16,13 +50,35 @@ class GlobalModel:
           self.tokenizer = value
 
       elif model_type == "model" and self.model:
-          # Merge models if already present
-          self.model = ties_merge_models(self.model, value)
+          # Merge models if already present, keeping the applied update
+          self.model, update = ties_merge_update(self.model, value, trim=GLOBAL_DELTA_TRIM)
+          if update:
+              self.pending_updates.append({"op": "merge", "update": update})
       else:
           # Set the model if not present
           self.model = value
+          self.needs_full_save = True
 
       if self.model and self.tokenizer:
           # Manually resize the model's embedding layer to the new vocabulary size
         new_vocab_size = len(self.tokenizer.get_vocab())  # Get the new vocabulary size
-        self.model.resize_token_embeddings(new_vocab_size)
\ No newline at end of file
+        self._resize_token_embeddings(new_vocab_size)
+
+  def _embedding_parameters(self):
+      embeddings = [self.model.get_input_embeddings(), self.model.get_output_embeddings()]
+      weights = {id(module.weight) for module in embeddings if module is not None}
+      return {name: param for name, param in self.model.named_parameters(remove_duplicate=False) if id(param) in weights}
+
+  def _resize_token_embeddings(self, vocab_size):
+      # Record resizes too: new rows are randomly initialised and must be persisted as-is
+      rows_before = {name: param.shape[0] for name, param in self._embedding_parameters().items()}
+      self.model.resize_token_embeddings(vocab_size)
+      rows_after = self._embedding_parameters()
+      if all(rows_before.get(name) == param.shape[0] for name, param in rows_after.items()):
+          return
+      new_rows = {
+          name: param.detach()[rows_before.get(name, 0):].clone()
+          for name, param in rows_after.items()
+          if param.shape[0] > rows_before.get(name, 0)
+      }
+      self.pending_updates.append({"op": "resize", "vocab_size": vocab_size, "rows": new_rows})
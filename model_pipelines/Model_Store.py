@@ -0,0 +1,442 @@
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import shutil
+from contextlib import contextmanager
+import torch
+from safetensors import safe_open
+from safetensors.torch import save_file
+from werkzeug.utils import secure_filename
+from language_model_utils.utils import apply_sparse_update, load_huggingface_model, load_huggingface_tokenizer
+from model_pipelines.Global_Model import GlobalModel
+from model_pipelines.Student_Model import StudentModel, StudentTask
+from model_pipelines.Teacher_Model import TeacherModel, TeacherTask, TeacherTaskModel
+from utils.file_transfer_utils import zip_directory, zip_files
+
+MODEL_STORE_SHARD_SIZE = os.getenv('MODEL_STORE_SHARD_SIZE', '2GB')
+GLOBAL_COMPACT_EVERY = int(os.getenv('GLOBAL_COMPACT_EVERY', 20))
+GLOBAL_COMPACT_RATIO = float(os.getenv('GLOBAL_COMPACT_RATIO', 0.5))
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _store_name(name):
+    """Filesystem-safe, collision-free directory name for a task or model name."""
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]
+    return f"{secure_filename(name) or 'item'}-{digest}"
+
+
+def _replace_dir(tmp_dir, target):
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp_dir, target)
+
+
+def _save_pretrained(obj, target, **kwargs):
+    """save_pretrained into a scratch directory, then swap it into place."""
+    tmp_dir = f"{target}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    obj.save_pretrained(tmp_dir, **kwargs)
+    _replace_dir(tmp_dir, target)
+
+
+@contextmanager
+def _flock(path):
+    """Hold an exclusive lock on ``path`` across processes (and threads: each call opens the file anew)."""
+    with open(path, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+class GlobalModelStore:
+    """
+    Persist the global model as a base checkpoint plus one small delta file per
+    approved contribution.
+
+    Layout under ``root``::
+
+        manifest.json          base directory, ordered delta files, counters, base CID once exported
+        base-000001/           save_pretrained() of the model at the last compaction
+        tokenizer/             current merged tokenizer
+        delta-000002.safetensors, ...
+        snapshots/base-000001+2/   base with its deltas applied, shared by the host's workers
+
+    Each delta holds the sparse merge updates and embedding resizes recorded
+    by ``GlobalModel`` since the previous save, so saving an approval writes
+    bytes in proportion to what changed. Once there are ``compact_every``
+    deltas, or they add up to ``compact_ratio`` of the base, the next save
+    writes a fresh base instead.
+
+    Loading maps the safetensors copy-on-write, so every worker on the host
+    shares one copy of the weights. When there are deltas, the first worker to
+    load writes the merged result as a snapshot keyed by the manifest (base and
+    delta count) and the others map that, instead of each replaying the deltas
+    into a private copy.
+
+    The published form of the model (``export``) follows the same layout: the
+    base is uploaded to IPFS once per compaction, and each approval only
+    publishes the deltas on top of it.
+
+    Every read-modify-write of the manifest (saving, compacting, exporting,
+    writing a snapshot) holds one ``flock``, so workers saving at once append
+    their deltas one after the other, and a compaction never removes a base
+    another worker is still saving against.
+    """
+
+    def __init__(self, root, compact_every=GLOBAL_COMPACT_EVERY, compact_ratio=GLOBAL_COMPACT_RATIO):
+        self.root = root
+        self.compact_every = compact_every
+        self.compact_ratio = compact_ratio
+        os.makedirs(root, exist_ok=True)
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.root, 'manifest.json')
+
+    def read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _needs_compaction(self, manifest):
+        if len(manifest['deltas']) >= self.compact_every:
+            return True
+        return manifest['delta_bytes'] > self.compact_ratio * manifest['base_bytes']
+
+    def save(self, global_model: GlobalModel):
+        """Persist the changes recorded on ``global_model`` since the last save."""
+        # Restoring a stored model may write a snapshot, which takes the lock itself
+        if global_model.model is None:
+            return
+
+        with self._lock():
+            self._save(global_model)
+
+    def _save(self, global_model: GlobalModel):
+        manifest = self.read_manifest()
+        if global_model.tokenizer is not None:
+            _save_pretrained(global_model.tokenizer, os.path.join(self.root, 'tokenizer'))
+
+        if manifest is None or global_model.needs_full_save or self._needs_compaction(manifest):
+            self._compact(global_model, manifest)
+        elif global_model.pending_updates:
+            name = f"delta-{manifest['next_id']:06d}.safetensors"
+            path = os.path.join(self.root, name)
+            self._write_delta(path, global_model.pending_updates)
+            manifest['deltas'].append(name)
+            manifest['delta_bytes'] += os.path.getsize(path)
+            manifest['next_id'] += 1
+            _write_json(self.manifest_path, manifest)
+            print(f"Saved global model delta {name} ({os.path.getsize(path)} bytes)")
+
+        global_model.pending_updates = []
+        global_model.needs_full_save = False
+
+    def compact(self, global_model: GlobalModel):
+        """Write the current model as the new base and drop all deltas."""
+        if global_model.model is None:
+            return
+        with self._lock():
+            self._compact(global_model, self.read_manifest())
+        global_model.pending_updates = []
+        global_model.needs_full_save = False
+
+    def _compact(self, global_model: GlobalModel, manifest):
+        next_id = manifest['next_id'] if manifest else 1
+        base = f"base-{next_id:06d}"
+        global_model.model.save_pretrained(os.path.join(self.root, base), safe_serialization=True,
+                                           max_shard_size=MODEL_STORE_SHARD_SIZE)
+
+        _write_json(self.manifest_path, {
+            'base': base,
+            'base_bytes': _dir_size(os.path.join(self.root, base)),
+            'deltas': [],
+            'delta_bytes': 0,
+            'next_id': next_id + 1
+        })
+
+        # Only remove the old files once the manifest no longer points at them
+        if manifest:
+            shutil.rmtree(os.path.join(self.root, manifest['base']), ignore_errors=True)
+            for name in manifest['deltas']:
+                os.remove(os.path.join(self.root, name))
+            self._prune_snapshots()
+        print(f"Saved global model base {base}")
+
+    def export(self, dest_path, upload):
+        """
+        Write the published form of the global model to ``dest_path``: a zip
+        of a manifest naming the base checkpoint by IPFS CID, the deltas to
+        apply to it in order and the tokenizer. The first export after a
+        compaction zips the base as stored and passes it to ``upload``
+        (paths -> CIDs); later ones reuse its CID, so an approval publishes
+        bytes in proportion to the deltas rather than the model.
+        """
+        with self._lock():
+            return self._export(dest_path, upload)
+
+    def _export(self, dest_path, upload):
+        manifest = self.read_manifest()
+        if manifest is None:
+            raise ValueError("No global model is stored")
+        if not manifest.get('base_cid'):
+            with tempfile.TemporaryDirectory(dir=self.root) as scratch:
+                base_zip = zip_directory(os.path.join(self.root, manifest['base']),
+                                         os.path.join(scratch, f"{manifest['base']}.zip"))
+                manifest['base_cid'] = upload([base_zip])[0]
+            _write_json(self.manifest_path, manifest)
+            print(f"Published global model base {manifest['base']} as {manifest['base_cid']}")
+
+        with tempfile.TemporaryDirectory(dir=self.root) as scratch:
+            export_manifest = os.path.join(scratch, 'manifest.json')
+            _write_json(export_manifest, {key: manifest[key] for key in ('base', 'base_cid', 'deltas')})
+            files = [('manifest.json', export_manifest)]
+            files += [(f'deltas/{name}', os.path.join(self.root, name)) for name in manifest['deltas']]
+            tokenizer_dir = os.path.join(self.root, 'tokenizer')
+            if os.path.isdir(tokenizer_dir):
+                files += [(f'tokenizer/{name}', os.path.join(tokenizer_dir, name))
+                          for name in sorted(os.listdir(tokenizer_dir))]
+            return zip_files(files, dest_path)
+
+    @classmethod
+    def load_export(cls, export_dir, base_dir):
+        """
+        The model published by ``export``: ``export_dir`` is the unpacked
+        global archive and ``base_dir`` the unpacked base its manifest names.
+        """
+        with open(os.path.join(export_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+        model = load_huggingface_model(base_dir)
+        for name in manifest['deltas']:
+            cls._apply_delta(model, os.path.join(export_dir, 'deltas', name))
+        return model
+
+    def load(self):
+        """
+        Return the stored global model, or None if nothing is stored. The base
+        and deltas are only read when the model or tokenizer is first used.
+        """
+        manifest = self.read_manifest()
+        if manifest is None:
+            return None
+        return GlobalModel(loader=lambda: self._restore(manifest))
+
+    def _restore(self, manifest):
+        model_dir = os.path.join(self.root, manifest['base'])
+        if manifest['deltas']:
+            model_dir = self._materialize(manifest)
+        model = load_huggingface_model(model_dir)
+
+        tokenizer = None
+        tokenizer_dir = os.path.join(self.root, 'tokenizer')
+        if os.path.isdir(tokenizer_dir):
+            tokenizer = load_huggingface_tokenizer(tokenizer_dir)
+        return model, tokenizer
+
+    def _materialize(self, manifest):
+        """Return the snapshot directory for ``manifest``, writing it if no worker has yet."""
+        snapshot = f"{manifest['base']}+{len(manifest['deltas'])}"
+        snapshot_dir = os.path.join(self.root, 'snapshots', snapshot)
+        with self._lock():
+            if not os.path.isdir(snapshot_dir):
+                model = load_huggingface_model(os.path.join(self.root, manifest['base']))
+                for name in manifest['deltas']:
+                    self._apply_delta(model, os.path.join(self.root, name))
+                _save_pretrained(model, snapshot_dir, safe_serialization=True,
+                                 max_shard_size=MODEL_STORE_SHARD_SIZE)
+                self._prune_snapshots(keep=snapshot)
+                print(f"Wrote global model snapshot {snapshot}")
+        return snapshot_dir
+
+    def _lock(self):
+        snapshots_dir = os.path.join(self.root, 'snapshots')
+        os.makedirs(snapshots_dir, exist_ok=True)
+        return _flock(os.path.join(snapshots_dir, '.lock'))
+
+    def _prune_snapshots(self, keep=None):
+        # Workers still mapping a removed snapshot keep their (unlinked) files
+        snapshots_dir = os.path.join(self.root, 'snapshots')
+        os.makedirs(snapshots_dir, exist_ok=True)
+        for name in os.listdir(snapshots_dir):
+            if name not in (keep, '.lock'):
+                shutil.rmtree(os.path.join(snapshots_dir, name), ignore_errors=True)
+
+    @staticmethod
+    def _write_delta(path, pending_updates):
+        tensors, ops = {}, []
+        for i, entry in enumerate(pending_updates):
+            if entry['op'] == 'merge':
+                for key, (indices, values) in entry['update'].items():
+                    if indices is not None:
+                        tensors[f"{i}/{key}/indices"] = indices.contiguous()
+                    tensors[f"{i}/{key}/values"] = values.contiguous()
+                ops.append({'op': 'merge', 'keys': list(entry['update'])})
+            else:
+                for key, rows in entry['rows'].items():
+                    tensors[f"{i}/{key}/rows"] = rows.contiguous()
+                ops.append({'op': 'resize', 'vocab_size': entry['vocab_size'], 'keys': list(entry['rows'])})
+        save_file(tensors, f"{path}.tmp", metadata={'format': 'pt', 'ops': json.dumps(ops)})
+        os.replace(f"{path}.tmp", path)
+
+    @staticmethod
+    def _apply_delta(model, path):
+        with safe_open(path, framework='pt', device='cpu') as f:
+            ops = json.loads(f.metadata()['ops'])
+            for i, op in enumerate(ops):
+                if op['op'] == 'merge':
+                    names = set(f.keys())
+                    update = {
+                        key: (
+                            f.get_tensor(f"{i}/{key}/indices") if f"{i}/{key}/indices" in names else None,
+                            f.get_tensor(f"{i}/{key}/values")
+                        )
+                        for key in op['keys']
+                    }
+                    apply_sparse_update(model, update)
+                else:
+                    model.resize_token_embeddings(op['vocab_size'])
+                    state_dict = model.state_dict()
+                    with torch.no_grad():
+                        for key in op['keys']:
+                            rows = f.get_tensor(f"{i}/{key}/rows")
+                            state_dict[key][-rows.shape[0]:] = rows
+
+
+class ModelStore:
+    """
+    On-disk home of the teacher, student and global models.
+
+    Every model and tokenizer is a ``save_pretrained`` directory (sharded
+    safetensors + config) and ``manifest.json`` records which tasks and
+    teachers exist::
+
+        manifest.json
+        teacher/<task>/<model_name>/{model,tokenizer}/
+        student/<task>/{model,tokenizer}/
+        global/                       GlobalModelStore
+
+    ``load`` only reads the manifest; weights are memory-mapped from disk the
+    first time a model is used, so startup does not depend on how many
+    teachers have been approved. ``save`` only rewrites entries that changed.
+    """
+
+    def __init__(self, root, max_shard_size=MODEL_STORE_SHARD_SIZE):
+        self.root = root
+        self.max_shard_size = max_shard_size
+        self.global_store = GlobalModelStore(os.path.join(root, 'global'))
+        os.makedirs(root, exist_ok=True)
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.root, 'manifest.json')
+
+    def read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {'version': 1, 'teacher': {}, 'student': []}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def teacher_dir(self, task, model_name):
+        return os.path.join(self.root, 'teacher', _store_name(task), _store_name(model_name))
+
+    def student_dir(self, task):
+        return os.path.join(self.root, 'student', _store_name(task))
+
+    def load(self):
+        """Return ``{'teacher', 'student', 'global'}`` backed by this store."""
+        manifest = self.read_manifest()
+
+        teacher = TeacherModel()
+        for task, model_names in manifest['teacher'].items():
+            teacher.tasks[task] = TeacherTask(teacher.cache)
+            for model_name in model_names:
+                entry_dir = self.teacher_dir(task, model_name)
+                teacher.tasks[task].models[model_name] = TeacherTaskModel(
+                    model_path=os.path.join(entry_dir, 'model'),
+                    tokenizer_path=os.path.join(entry_dir, 'tokenizer'),
+                    cache=teacher.cache
+                )
+
+        student = StudentModel()
+        for task in manifest['student']:
+            entry_dir = self.student_dir(task)
+            student.tasks[task] = StudentTask(
+                model_path=os.path.join(entry_dir, 'model'),
+                tokenizer_path=os.path.join(entry_dir, 'tokenizer')
+            )
+
+        return {
+            'teacher': teacher,
+            'student': student,
+            'global': self.global_store.load() or GlobalModel()
+        }
+
+    def _save_entry(self, entry, entry_dir):
+        """Write a dirty teacher/student entry and point it at its stored copy."""
+        if entry._model is not None:
+            _save_pretrained(entry._model, os.path.join(entry_dir, 'model'),
+                             safe_serialization=True, max_shard_size=self.max_shard_size)
+            entry.model_path = os.path.join(entry_dir, 'model')
+        if entry._tokenizer is not None:
+            _save_pretrained(entry._tokenizer, os.path.join(entry_dir, 'tokenizer'))
+            entry.tokenizer_path = os.path.join(entry_dir, 'tokenizer')
+        entry.dirty = False
+
+    def save(self, teacher=None, student=None, global_model=None):
+        """
+        Persist whatever changed since the models were loaded or last saved.
+        The manifest is re-read and written under a lock, so saves from other
+        workers in the meantime are kept.
+        """
+        with _flock(os.path.join(self.root, '.lock')):
+            self._save(teacher, student)
+
+        if global_model is not None:
+            self.global_store.save(global_model)
+
+    def _save(self, teacher, student):
+        manifest = self.read_manifest()
+
+        if teacher is not None:
+            for task, teacher_task in teacher.tasks.items():
+                stored = manifest['teacher'].setdefault(task, [])
+                for model_name, entry in teacher_task.models.items():
+                    if entry.dirty:
+                        self._save_entry(entry, self.teacher_dir(task, model_name))
+                    if model_name not in stored and entry.model_path:
+                        stored.append(model_name)
+            # Saved entries can be reloaded now, so they no longer have to stay resident
+            teacher.cache.trim()
+
+        if student is not None:
+            for task, entry in student.tasks.items():
+                if entry.dirty:
+                    self._save_entry(entry, self.student_dir(task))
+                if task not in manifest['student'] and entry.model_path:
+                    manifest['student'].append(task)
+
+        _write_json(self.manifest_path, manifest)
+
+    def export_archives(self, task, model_name, dest_dir, upload):
+        """
+        Package the artifacts published for an approved model as uncompressed
+        zips in ``dest_dir``: its teacher entry, the task's student and the
+        global model as stored (see ``GlobalModelStore.export``, which may
+        ``upload`` its base). Returns ``{'teacher', 'student', 'global'}`` paths.
+        """
+        return {
+            'teacher': zip_directory(self.teacher_dir(task, model_name), os.path.join(dest_dir, 'teacher_model.zip')),
+            'student': zip_directory(self.student_dir(task), os.path.join(dest_dir, 'student_model.zip')),
+            'global': self.global_store.export(os.path.join(dest_dir, 'global_model.zip'), upload),
+        }
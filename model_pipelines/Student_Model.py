@@ -1,4 +1,7 @@
-from language_model_utils.utils import merge_tokenizer_vocabularies, ties_merge_models
+from language_model_utils.utils import (
+    merge_tokenizer_vocabularies, ties_merge_models,
+    load_huggingface_model, load_huggingface_tokenizer,
+)
 
 class StudentModel:
   def __init__(self):
@@ -18,9 +21,35 @@ class StudentModel:
 
 
 class StudentTask:
-  def __init__(self):
-      self.tokenizer = None
-      self.model = None
+  def __init__(self, model_path=None, tokenizer_path=None):
+      self._tokenizer = None
+      self._model = None
+      # Stored copies in the ModelStore; loaded on first access
+      self.model_path = model_path
+      self.tokenizer_path = tokenizer_path
+      self.dirty = False
+
+  @property
+  def model(self):
+      if self._model is None and self.model_path:
+          self._model = load_huggingface_model(self.model_path)
+      return self._model
+
+  @model.setter
+  def model(self, value):
+      self._model = value
+      self.dirty = True
+
+  @property
+  def tokenizer(self):
+      if self._tokenizer is None and self.tokenizer_path:
+          self._tokenizer = load_huggingface_tokenizer(self.tokenizer_path)
+      return self._tokenizer
+
+  @tokenizer.setter
+  def tokenizer(self, value):
+      self._tokenizer = value
+      self.dirty = True
 
   def add_values(self, model_type, value):
       
@@ -42,4 +71,4 @@ class StudentTask:
       if self.model and self.tokenizer:
           # Manually resize the model's embedding layer to the new vocabulary size
         new_vocab_size = len(self.tokenizer.get_vocab())  # Get the new vocabulary size
-        self.model.resize_token_embeddings(new_vocab_size)
\ No newline at end of file
+        self.model.resize_token_embeddings(new_vocab_size)
@@ -1,41 +1,172 @@
+import os
+import threading
+from collections import OrderedDict
+from language_model_utils.utils import load_huggingface_model, load_huggingface_tokenizer
+
+TEACHER_CACHE_BYTES = int(os.getenv('TEACHER_CACHE_BYTES', 8 * 1024 ** 3))
+
+
+def _model_nbytes(model):
+    """Bytes held by a model's parameters and buffers, counting tied storage once."""
+    if model is None:
+        return 0
+    seen, total = set(), 0
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        if tensor.data_ptr() not in seen:
+            seen.add(tensor.data_ptr())
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class TeacherModelCache:
+    """
+    LRU bound on how many bytes of teacher weights stay resident.
+
+    Entries load themselves from the ModelStore on first access and report
+    here; once the resident total passes ``max_bytes`` the least recently used
+    entries are unloaded until it fits again. An entry that is dirty or has no
+    stored copy yet can't be reloaded, so it is pinned until it has been saved.
+    """
+
+    def __init__(self, max_bytes=TEACHER_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def resident_bytes(self):
+        return sum(self._entries.values())
+
+    def touch(self, entry):
+        """Record an access to an already resident entry."""
+        with self._lock:
+            self.hits += 1
+            if entry in self._entries:
+                self._entries.move_to_end(entry)
+
+    def loaded(self, entry):
+        """Record that ``entry`` had to be loaded from disk."""
+        with self._lock:
+            self.misses += 1
+            self.admit(entry)
+
+    def admit(self, entry):
+        """(Re)account for ``entry``'s current weights and evict to stay under budget."""
+        with self._lock:
+            self._entries[entry] = _model_nbytes(entry._model)
+            self._entries.move_to_end(entry)
+            self.trim(keep=entry)
+
+    def trim(self, keep=None):
+        with self._lock:
+            for candidate in list(self._entries):
+                if self.resident_bytes <= self.max_bytes:
+                    break
+                if candidate is keep or candidate.dirty or not candidate.model_path:
+                    continue
+                del self._entries[candidate]
+                candidate.unload()
+                self.evictions += 1
+
+    def discard(self, entry):
+        with self._lock:
+            self._entries.pop(entry, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'resident': len(self._entries),
+                'resident_bytes': self.resident_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
 class TeacherModel:
-  def __init__(self):
+  def __init__(self, cache=None):
       self.tasks = {}
+      self.cache = cache or TeacherModelCache()
 
   def add_model(self, task, model_name, model_type, value):
       # Dynamically create nested models and tasks
       if task not in self.tasks:
-          self.tasks[task] = TeacherTask()  # Create a new Task if it doesn't exist
+          self.tasks[task] = TeacherTask(self.cache)  # Create a new Task if it doesn't exist
       self.tasks[task].add_model(model_name, model_type, value)
 
   def __getattr__(self, task):
       # This method handles dynamic access to models
-      if task in self.tasks:
+      if task != 'tasks' and task in self.tasks:
           return self.tasks[task]  # Return the task object if it exists
       raise AttributeError(f"'TeacherModel' object has no attribute '{task}'")
 
 
 class TeacherTask:
-  def __init__(self):
+  def __init__(self, cache=None):
       self.models = {}
+      self.cache = cache or TeacherModelCache()
 
   def add_model(self, model_name, model_type, value):
       # Add a model to the task, keyed by model_name
       if model_name not in self.models:
-          self.models[model_name] = TeacherTaskModel()
+          self.models[model_name] = TeacherTaskModel(cache=self.cache)
       self.models[model_name].add_values(model_type, value)
 
   def __getattr__(self, model_name):
       # Allow dynamic access to models by model_name
-      if model_name in self.models:
+      if model_name != 'models' and model_name in self.models:
           return self.models[model_name]
       raise AttributeError(f"'Task' object has no attribute '{model_name}'")
 
 
 class TeacherTaskModel:
-  def __init__(self):
-      self.tokenizer = None
-      self.model = None
+  def __init__(self, model_path=None, tokenizer_path=None, cache=None):
+      self._tokenizer = None
+      self._model = None
+      # Stored copies in the ModelStore; loaded on first access
+      self.model_path = model_path
+      self.tokenizer_path = tokenizer_path
+      self.dirty = False
+      self.cache = cache or TeacherModelCache()
+
+  @property
+  def model(self):
+      if self._model is None and self.model_path:
+          self._model = load_huggingface_model(self.model_path)
+          self.cache.loaded(self)
+      elif self._model is not None:
+          self.cache.touch(self)
+      return self._model
+
+  @model.setter
+  def model(self, value):
+      self._model = value
+      self.dirty = True
+      self.cache.admit(self)
+
+  @property
+  def tokenizer(self):
+      if self._tokenizer is None and self.tokenizer_path:
+          self._tokenizer = load_huggingface_tokenizer(self.tokenizer_path)
+          self.cache.loaded(self)
+      elif self._tokenizer is not None:
+          self.cache.touch(self)
+      return self._tokenizer
+
+  @tokenizer.setter
+  def tokenizer(self, value):
+      self._tokenizer = value
+      self.dirty = True
+      self.cache.admit(self)
+
+  def unload(self):
+      # Drop the resident copies; the next access reloads them from the store
+      self._model = None
+      self._tokenizer = None
 
   def add_values(self, model_type, value):
       if model_type == "tokenizer":
@@ -43,4 +174,4 @@ class TeacherTaskModel:
       elif model_type == "model":
           self.model = value
       else:
-          raise ValueError(f"Invalid type: {model_type}")
\ No newline at end of file
+          raise ValueError(f"Invalid type: {model_type}")
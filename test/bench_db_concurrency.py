@@ -0,0 +1,157 @@
+"""
+Run many vote tasks and API readers against one SQLite registry at once, as
+Celery workers and the Flask app do, and compare the database setups:
+
+  legacy  the old engine: rollback journal, driver defaults, BEGIN on first write
+  tuned   initialize_registry: WAL, busy timeout, pooled, BEGIN IMMEDIATE for writes
+
+Each vote task process records batches of votes through VoteLedger and moves
+models through pending -> finalizing -> approved; each reader process lists
+approved models and looks up a model's status, like /approved-models and
+/model_status. Reported: operations per second, read and write latency and
+the number of operations that failed (e.g. "database is locked").
+
+    PYTHONPATH=. python test/bench_db_concurrency.py --writers 8 --readers 16 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SEED_MODELS = 2000
+
+
+def make_app(uri, mode):
+    from flask import Flask
+    from db_models.models import db
+    from utils.registry_utils import initialize_registry
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    if mode == 'tuned':
+        initialize_registry(app, db)
+    else:
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+    return app, db
+
+
+def seed(uri, mode):
+    from db_models.models import ModelRegistry, ModelVote
+    app, db = make_app(uri, mode)
+    epoch = datetime(2025, 1, 1)
+    with app.app_context():
+        db.session.execute(ModelRegistry.__table__.insert(), [{
+            'model_id': f'model-{i:06d}', 'model_name': f'model_{i}', 'task': 'ner', 'nft_id': 'pending',
+            'created_at': epoch + timedelta(seconds=i), 'status': 'approved' if i % 2 else 'pending',
+        } for i in range(SEED_MODELS)])
+        db.session.execute(ModelVote.__table__.insert(), [{
+            'model_id': f'model-{i:06d}', 'model_name': f'model_{i}', 'yes_votes': 0, 'no_votes': 0,
+        } for i in range(SEED_MODELS)])
+        db.session.commit()
+
+
+def writer(uri, mode, seconds, worker, ready, results):
+    from db_models.models import ModelRegistry
+    from utils.voting_utils import VoteLedger
+    app, db = make_app(uri, mode)
+    ledger = VoteLedger(app, db)
+    rng = random.Random(worker)
+    ready.wait()
+    latencies, errors, deadline, n = [], 0, time.time() + seconds, 0
+    while time.time() < deadline:
+        model_id = f'model-{rng.randrange(0, SEED_MODELS, 2):06d}'
+        start = time.perf_counter()
+        try:
+            n += 1
+            ledger.record([(model_id, f'@voter{rng.randrange(50)}', f'w{worker}-{n}-{i}',
+                            rng.choice(('yes', 'no')), int(time.time() * 1000)) for i in range(5)])
+            ledger.tally(model_id)
+            for status in ('finalizing', 'approved', 'pending'):
+                with app.app_context():
+                    ModelRegistry.query.filter_by(model_id=model_id).update({'status': status})
+                    db.session.commit()
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            errors += 1
+    results.put(('write', latencies, errors))
+
+
+def reader(uri, mode, seconds, worker, ready, results):
+    from db_models.models import ModelRegistry, ModelVote
+    from utils.registry_utils import list_models
+    app, db = make_app(uri, mode)
+    rng = random.Random(1000 + worker)
+    ready.wait()
+    latencies, errors, deadline = [], 0, time.time() + seconds
+    while time.time() < deadline:
+        model_id = f'model-{rng.randrange(SEED_MODELS):06d}'
+        start = time.perf_counter()
+        try:
+            with app.app_context():
+                list_models(ModelRegistry, 'approved', 100)
+                ModelRegistry.query.filter_by(model_id=model_id).first()
+                ModelVote.query.filter_by(model_id=model_id).first()
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            errors += 1
+    results.put(('read', latencies, errors))
+
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100)[q - 1] * 1000 if len(values) > 1 else float('nan')
+
+
+def run(mode, args):
+    workdir = tempfile.mkdtemp(prefix='bench_db_')
+    uri = f"sqlite:///{os.path.join(workdir, 'registry.db')}"
+    try:
+        seed(uri, mode)
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        # Every process starts its clock once all of them have imported and connected
+        ready = context.Barrier(args.writers + args.readers)
+        processes = [context.Process(target=writer, args=(uri, mode, args.seconds, i, ready, results))
+                     for i in range(args.writers)]
+        processes += [context.Process(target=reader, args=(uri, mode, args.seconds, i, ready, results))
+                      for i in range(args.readers)]
+        for process in processes:
+            process.start()
+        collected = {'write': ([], 0), 'read': ([], 0)}
+        for _ in processes:
+            kind, latencies, errors = results.get()
+            collected[kind] = (collected[kind][0] + latencies, collected[kind][1] + errors)
+        for process in processes:
+            process.join()
+
+        (writes, write_errors), (reads, read_errors) = collected['write'], collected['read']
+        print(f"{mode:>7} {len(writes) / args.seconds:>9.1f} {percentile(writes, 50):>9.1f} "
+              f"{percentile(writes, 99):>9.1f} {write_errors:>7} {len(reads) / args.seconds:>9.1f} "
+              f"{percentile(reads, 50):>9.1f} {percentile(reads, 99):>9.1f} {read_errors:>7}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--modes', nargs='+', default=['legacy', 'tuned'], choices=['legacy', 'tuned'])
+    args = parser.parse_args()
+
+    print(f"{args.writers} vote task processes, {args.readers} reader processes, {args.seconds:.0f}s each")
+    print(f"{'mode':>7} {'tasks/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'failed':>7} "
+          f"{'reads/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'failed':>7}")
+    for mode in args.modes:
+        run(mode, args)
+
+
+if __name__ == '__main__':
+    main()
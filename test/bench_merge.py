@@ -0,0 +1,73 @@
+"""
+Benchmark the serial and parallel TIES merge paths on synthetic safetensors
+checkpoints and report the speed-up of each worker count over the serial run.
+
+    PYTHONPATH=. python test/bench_merge.py --layers 24 --hidden 2048 --workers 2 4 8 16 32
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import torch
+from safetensors.torch import save_file
+from language_model_utils.checkpoint_utils import SafetensorsCheckpoint
+from language_model_utils.utils import ties_merge_safetensors
+
+
+def make_checkpoint(path, layers, hidden, vocab, seed):
+    generator = torch.Generator().manual_seed(seed)
+    tensors = {"embed_tokens.weight": torch.randn(vocab, hidden, generator=generator)}
+    for layer in range(layers):
+        tensors[f"layers.{layer}.attn.weight"] = torch.randn(hidden, hidden, generator=generator)
+        tensors[f"layers.{layer}.mlp.weight"] = torch.randn(4 * hidden, hidden, generator=generator)
+        tensors[f"layers.{layer}.norm.weight"] = torch.randn(hidden, generator=generator)
+    os.makedirs(path, exist_ok=True)
+    save_file(tensors, os.path.join(path, "model.safetensors"), metadata={"format": "pt"})
+    return sum(t.numel() * t.element_size() for t in tensors.values())
+
+
+def same_weights(path_a, path_b):
+    with SafetensorsCheckpoint(path_a) as a, SafetensorsCheckpoint(path_b) as b:
+        return a.keys() == b.keys() and all(torch.equal(a.get_tensor(k), b.get_tensor(k)) for k in a.keys())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--layers", type=int, default=12)
+    parser.add_argument("--hidden", type=int, default=1024)
+    parser.add_argument("--vocab", type=int, default=32000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--memory-budget", type=int, default=4 * 1024 ** 3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_merge_")
+    try:
+        size = make_checkpoint(os.path.join(workdir, "a"), args.layers, args.hidden, args.vocab, seed=0)
+        make_checkpoint(os.path.join(workdir, "b"), args.layers, args.hidden, args.vocab, seed=1)
+        print(f"checkpoint size: {size / 1024 ** 2:.0f} MiB per model, {os.cpu_count()} cpus")
+
+        def run(workers):
+            output = os.path.join(workdir, f"merged_{workers}")
+            timings = []
+            for _ in range(args.repeat):
+                shutil.rmtree(output, ignore_errors=True)
+                start = time.perf_counter()
+                ties_merge_safetensors(os.path.join(workdir, "a"), os.path.join(workdir, "b"), output,
+                                       workers=workers, memory_budget=args.memory_budget)
+                timings.append(time.perf_counter() - start)
+            return output, min(timings)
+
+        serial_output, serial_time = run(1)
+        print(f"{'workers':>8} {'seconds':>9} {'speed-up':>9} {'identical':>10}")
+        print(f"{1:>8} {serial_time:>9.2f} {1.0:>8.2f}x {'-':>10}")
+        for workers in args.workers:
+            output, elapsed = run(workers)
+            print(f"{workers:>8} {elapsed:>9.2f} {serial_time / elapsed:>8.2f}x {str(same_weights(serial_output, output)):>10}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Seed a SQLite registry with a growing number of models and time /approved-models
+style listings at each size: the old full ``.all()`` read, and keyset pages
+(first, deep, filtered by task and by created_at range) from ``list_models``.
+Keyset pages should cost the same at every size.
+
+    PYTHONPATH=. python test/bench_registry.py --sizes 1000 10000 100000 --page 100
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from flask import Flask
+from sqlalchemy import text, tuple_
+from db_models.models import db, ModelRegistry
+from utils.registry_utils import list_models, ensure_schema, encode_cursor
+
+TASKS = ['ner', 'sentiment', 'summarization', 'translation', 'qa']
+STATUSES = ['approved'] * 8 + ['rejected', 'pending']
+
+
+def seed(start, count, epoch):
+    rows = []
+    for i in range(start, start + count):
+        rows.append({
+            'model_id': f'model-{i:08d}',
+            'model_name': f'model_{i}',
+            'task': TASKS[i % len(TASKS)],
+            'nft_id': f'0x{i:064x}',
+            'teacher_model_cid': f'QmTeacher{i}',
+            'student_model_cid': f'QmStudent{i}',
+            'global_model_cid': f'QmGlobal{i}',
+            'archive_cid': f'QmArchive{i}',
+            'created_at': epoch + timedelta(seconds=i),
+            'status': random.choice(STATUSES),
+        })
+    for batch in range(0, len(rows), 10000):
+        db.session.execute(ModelRegistry.__table__.insert(), rows[batch:batch + 10000])
+    db.session.commit()
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--page', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(0)
+    workdir = tempfile.mkdtemp(prefix='bench_registry_')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(workdir, 'registry.db')}"
+    db.init_app(app)
+    epoch = datetime(2025, 1, 1)
+
+    with app.app_context():
+        db.create_all()
+        ensure_schema(db)
+
+        def deep_page(size):
+            # Resume 90% of the way through the registry
+            cursor = encode_cursor(epoch + timedelta(seconds=int(size * 0.9)), '')
+            return lambda: list_models(ModelRegistry, 'approved', args.page, cursor=cursor)
+
+        print(f"{'models':>8} {'all() ms':>9} {'first ms':>9} {'deep ms':>9} {'task ms':>9} {'range ms':>9}")
+        seeded = 0
+        for size in args.sizes:
+            seed(seeded, size - seeded, epoch)
+            seeded = size
+            middle = epoch + timedelta(seconds=size // 2)
+            results = [
+                timed(lambda: [m.to_dict() for m in ModelRegistry.query.filter_by(status='approved').all()],
+                      max(1, args.repeat // 10)),
+                timed(lambda: list_models(ModelRegistry, 'approved', args.page), args.repeat),
+                timed(deep_page(size), args.repeat),
+                timed(lambda: list_models(ModelRegistry, 'approved', args.page, task='qa',
+                                          fields=['model_id', 'model_name', 'archive_cid']), args.repeat),
+                timed(lambda: list_models(ModelRegistry, 'approved', args.page, created_after=middle,
+                                          created_before=middle + timedelta(hours=1)), args.repeat),
+            ]
+            print(f"{size:>8} " + " ".join(f"{ms:>9.2f}" for ms in results))
+
+        # Plan of a deep, filtered page
+        query = ModelRegistry.query.with_entities(ModelRegistry.model_id) \
+            .filter(ModelRegistry.status == 'approved', ModelRegistry.task == 'qa',
+                    tuple_(ModelRegistry.created_at, ModelRegistry.model_id) > tuple_(middle, '')) \
+            .order_by(ModelRegistry.created_at, ModelRegistry.model_id).limit(args.page)
+        sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')):
+            print('plan:', row[-1])
+
+
+if __name__ == '__main__':
+    main()
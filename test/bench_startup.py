@@ -0,0 +1,66 @@
+"""
+Measure how quickly a fresh process can serve requests from app.py.
+
+Each run starts a new interpreter, imports the app and records three times,
+all measured from just before the interpreter was launched:
+  import  the app module is importable
+  first   a read-only endpoint (/model_status) has answered
+  ready   /ready reports the database, IPFS and Redis reachable
+
+    PYTHONPATH=. python test/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+DRIVER = """
+import json, sys, time
+launched = float(sys.argv[1])
+import app as application
+imported = time.time()
+client = application.app.test_client()
+client.get('/model_status/startup-benchmark')
+first = time.time()
+deadline = first + float(sys.argv[2])
+while client.get('/ready').status_code != 200 and time.time() < deadline:
+    time.sleep(0.02)
+ready = time.time() if client.get('/ready').status_code == 200 else None
+print(json.dumps({
+    'import': imported - launched,
+    'first': first - launched,
+    'ready': ready - launched if ready else None,
+}))
+"""
+
+
+def run_once(timeout):
+    launched = time.time()
+    result = subprocess.run(
+        [sys.executable, "-c", DRIVER, str(launched), str(timeout)],
+        capture_output=True, text=True, check=True, cwd=os.getcwd()
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for /ready")
+    args = parser.parse_args()
+
+    runs = [run_once(args.timeout) for _ in range(args.runs)]
+    print(f"{'stage':>8} {'median s':>9} {'max s':>9}")
+    for stage in ("import", "first", "ready"):
+        timings = [run[stage] for run in runs if run[stage] is not None]
+        if not timings:
+            print(f"{stage:>8} {'timeout':>9}")
+            continue
+        print(f"{stage:>8} {statistics.median(timings):>9.2f} {max(timings):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import os
+import sys
+import types
+import unittest
+from flask import Flask
+from db_models.models import db, ModelRegistry
+from utils.voting_utils import ModelVotingManager
+
+
+class StubModelStore:
+    def save(self, **models):
+        pass
+
+    def export_archives(self, task, model_name, export_dir, upload):
+        archives = {}
+        for kind in ('student', 'teacher', 'global'):
+            archives[kind] = os.path.join(export_dir, f'{kind}.zip')
+            with open(archives[kind], 'wb') as f:
+                f.write(kind.encode())
+        return archives
+
+
+class StubIPFS:
+    def add_many(self, paths):
+        return [{'Hash': f'Qm{os.path.basename(path)}'} for path in paths]
+
+
+class TestFinalizeVoting(unittest.TestCase):
+    def setUp(self):
+        # Minting goes through iota_sdk; only the NFT id it returns matters here
+        iota_utils = types.ModuleType('utils.iota_utils')
+        iota_utils.mint_nft_with_ipfs = lambda account, metadata: 'nft-alpha'
+        self._iota_utils = sys.modules.get('utils.iota_utils')
+        sys.modules['utils.iota_utils'] = iota_utils
+
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        with self.app.app_context():
+            db.create_all()
+        self.manager = ModelVotingManager(self.app, None, StubIPFS(), None, db, None, [], 0,
+                                          model_store=StubModelStore())
+
+    def tearDown(self):
+        if self._iota_utils is not None:
+            sys.modules['utils.iota_utils'] = self._iota_utils
+        else:
+            del sys.modules['utils.iota_utils']
+
+    def register(self, model_id, model_name):
+        with self.app.app_context():
+            db.session.add(ModelRegistry(model_id=model_id, model_name=model_name, task='ner',
+                                         nft_id='pending', status='finalizing'))
+            db.session.commit()
+
+    def status(self, model_id):
+        with self.app.app_context():
+            return db.session.get(ModelRegistry, model_id).status
+
+    def test_resubmitted_name_finalizes_its_own_row(self):
+        self.register('first', 'alpha')
+        self.assertTrue(self.manager.finalize_voting(3, 0, 'alpha', None, lambda: (None, None),
+                                                     task='ner', model_id='first'))
+        self.assertEqual(self.status('first'), 'approved')
+
+        self.register('second', 'alpha')
+        self.assertFalse(self.manager.finalize_voting(0, 3, 'alpha', None, lambda: (None, None),
+                                                      task='ner', model_id='second'))
+        self.assertEqual(self.status('first'), 'approved')
+        self.assertEqual(self.status('second'), 'rejected')
+        with self.app.app_context():
+            self.assertEqual(db.session.get(ModelRegistry, 'first').nft_id, 'nft-alpha')
+
+
+if __name__ == '__main__':
+    unittest.main()
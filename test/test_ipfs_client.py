@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import unittest
+from aiohttp import web
+from utils.ipfs_client import AsyncIPFSClient, IPFSClient
+
+
+class StandInIPFS:
+    """
+    The parts of the IPFS HTTP API the client uses (add, pin/add, cat), kept
+    in memory. Records how many requests overlapped and which connections
+    they arrived on.
+    """
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.blobs = {}
+        self.pinned = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections = set()
+
+    def _track(self, request):
+        self.connections.add(request.transport.get_extra_info('peername'))
+
+    async def add(self, request):
+        self._track(request)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            reader = await request.multipart()
+            part = await reader.next()
+            data = await part.read()
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        cid = 'Qm' + hashlib.sha256(data).hexdigest()[:44]
+        self.blobs[cid] = data
+        if request.query.get('pin', 'true') == 'true':
+            self.pinned.add(cid)
+        return web.json_response({'Name': part.filename, 'Hash': cid, 'Size': str(len(data))})
+
+    async def pin_add(self, request):
+        self._track(request)
+        cid = request.query['arg']
+        if cid not in self.blobs:
+            return web.json_response({'Message': 'not found', 'Code': 0}, status=500)
+        self.pinned.add(cid)
+        return web.json_response({'Pins': [cid]})
+
+    async def cat(self, request):
+        self._track(request)
+        cid = request.query['arg']
+        if cid not in self.blobs:
+            return web.json_response({'Message': 'not found', 'Code': 0}, status=500)
+        return web.Response(body=self.blobs[cid])
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post('/api/v0/add', self.add)
+        app.router.add_post('/api/v0/pin/add', self.pin_add)
+        app.router.add_post('/api/v0/cat', self.cat)
+        return app
+
+
+class TestIPFSClient(unittest.TestCase):
+    CONCURRENCY = 3
+
+    def setUp(self):
+        self.ipfs = StandInIPFS()
+        self.loop = asyncio.new_event_loop()
+        self.runner = web.AppRunner(self.ipfs.app())
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        self.loop.run_until_complete(site.start())
+        port = site._server.sockets[0].getsockname()[1]
+        self.api_url = f'http://127.0.0.1:{port}'
+        self.server = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.server.start()
+
+        self.workdir = tempfile.TemporaryDirectory()
+        self.paths = []
+        for i in range(6):
+            path = os.path.join(self.workdir.name, f'artifact_{i}.zip')
+            with open(path, 'wb') as f:
+                f.write(os.urandom(256 * 1024) + bytes([i]))
+            self.paths.append(path)
+
+    def tearDown(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.server.join()
+        self.workdir.cleanup()
+
+    def test_add_many_uploads_in_parallel_and_pins(self):
+        async def upload():
+            async with AsyncIPFSClient(self.api_url, concurrency=self.CONCURRENCY) as client:
+                return await client.add_many(self.paths)
+
+        results = asyncio.run(upload())
+        self.assertEqual([r['Name'] for r in results], [os.path.basename(p) for p in self.paths])
+        for path, result in zip(self.paths, results):
+            with open(path, 'rb') as f:
+                self.assertEqual(self.ipfs.blobs[result['Hash']], f.read())
+            self.assertIn(result['Hash'], self.ipfs.pinned)
+        self.assertEqual(self.ipfs.max_in_flight, self.CONCURRENCY)
+
+    def test_connections_are_kept_alive_between_calls(self):
+        client = IPFSClient(self.api_url, concurrency=self.CONCURRENCY)
+        try:
+            first = client.add_many(self.paths)
+            client.add_many(self.paths)
+            client.pin(first[0]['Hash'])
+            with open(self.paths[0], 'rb') as f:
+                self.assertEqual(client.cat(first[0]['Hash']), f.read())
+        finally:
+            client.close()
+        self.assertLessEqual(len(self.ipfs.connections), self.CONCURRENCY)
+
+    def test_errors_and_timeouts_raise(self):
+        client = IPFSClient(self.api_url, read_timeout=0.05)
+        try:
+            with self.assertRaises(Exception):
+                client.pin('QmUnknown')
+            with self.assertRaises(asyncio.TimeoutError):
+                client.add(self.paths[0])
+        finally:
+            client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
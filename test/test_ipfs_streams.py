@@ -0,0 +1,70 @@
+import asyncio
+import gc
+import threading
+import time
+import unittest
+from aiohttp import web
+from utils.file_transfer_utils import stream_zip
+from utils.ipfs_utils import open_ipfs_streams
+
+
+class EndlessCat:
+    """``/api/v0/cat`` that streams zeros until the client goes away."""
+
+    async def cat(self, request):
+        response = web.StreamResponse()
+        await response.prepare(request)
+        while True:
+            await response.write(b'\0' * 64 * 1024)
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post('/api/v0/cat', self.cat)
+        return app
+
+
+def pump_threads():
+    return [t for t in threading.enumerate() if t.name.startswith('ipfs-cat-') and t.is_alive()]
+
+
+class TestIpfsStreams(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.runner = web.AppRunner(EndlessCat().app())
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        self.loop.run_until_complete(site.start())
+        port = site._server.sockets[0].getsockname()[1]
+        self.api_url = f'http://127.0.0.1:{port}'
+        self.server = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.server.start()
+
+    def tearDown(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.server.join()
+
+    def assertPumpsStop(self, timeout=5):
+        deadline = time.time() + timeout
+        while pump_threads() and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(pump_threads(), [])
+
+    def test_abandoned_zip_stops_every_download(self):
+        streams = open_ipfs_streams(['a', 'b', 'c'], self.api_url, chunk_size=1024, prefetch_chunks=2)
+        archive = stream_zip(zip(['a', 'b', 'c'], streams))
+        for _ in range(3):
+            next(archive)  # Partway into the first member; b and c are blocked on their queues
+        self.assertEqual(len(pump_threads()), 3)
+        archive.close()
+        self.assertPumpsStop()
+
+    def test_dropped_unread_streams_stop(self):
+        streams = open_ipfs_streams(['a', 'b'], self.api_url, chunk_size=1024, prefetch_chunks=2)
+        del streams
+        gc.collect()
+        self.assertPumpsStop()
+
+
+if __name__ == '__main__':
+    unittest.main()
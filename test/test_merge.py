@@ -0,0 +1,130 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import torch
+from safetensors.torch import save_file
+from language_model_utils.checkpoint_utils import SafetensorsCheckpoint
+from language_model_utils.utils import ties_merge_many, ties_merge_safetensors, ties_merge_tensor, ties_merge_tensors
+
+
+def make_state(seed):
+    generator = torch.Generator().manual_seed(seed)
+    return {
+        "embed.weight": torch.randn(96, 16, generator=generator),
+        "attn.weight": torch.randn(16, 16, generator=generator),
+        "mlp.weight": torch.randn(64, 16, generator=generator),
+        "norm.weight": torch.randn(16, generator=generator),
+        "half.weight": torch.randn(8, 8, generator=generator).to(torch.float16),
+        "position_ids": torch.arange(32).unsqueeze(0),
+    }
+
+
+def baseline_ties_merge(state_a, state_b, threshold=1e-5):
+    """The pairwise merge as ``ties_merge_models`` first did it, kept as the reference."""
+    merged = {}
+    for key, param_a in state_a.items():
+        param_b = state_b.get(key)
+        if param_b is None or not param_a.is_floating_point() or param_a.shape != param_b.shape:
+            merged[key] = param_a
+        elif torch.abs(param_a - param_b).mean() < threshold:
+            merged[key] = param_a
+        else:
+            sign_mask = torch.sign(param_a) == torch.sign(param_b)
+            merged[key] = torch.where(sign_mask, (param_a + param_b) / 2,
+                                      param_a.abs().max(param_b.abs())).to(param_a.dtype)
+    return merged
+
+
+def read_checkpoint(path):
+    with SafetensorsCheckpoint(path) as checkpoint:
+        return {key: checkpoint.get_tensor(key).clone() for key in checkpoint.keys()}
+
+
+def assert_same_state(test, state, expected):
+    test.assertEqual(state.keys(), expected.keys())
+    for key in expected:
+        test.assertEqual(state[key].dtype, expected[key].dtype, key)
+        test.assertTrue(torch.equal(state[key], expected[key]), key)
+
+
+class TestMergeEquivalence(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.state_a, self.state_b = make_state(0), make_state(1)
+        # A marginal change, a tensor model B lacks and one whose shape differs
+        self.state_b["norm.weight"] = self.state_a["norm.weight"] + 1e-7
+        del self.state_b["attn.weight"]
+        self.state_b["mlp.weight"] = self.state_b["mlp.weight"][:32]
+        self.path_a = self.checkpoint("a", self.state_a)
+        self.path_b = self.checkpoint("b", self.state_b)
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def checkpoint(self, name, state):
+        path = os.path.join(self.workdir.name, name)
+        os.makedirs(path)
+        save_file({key: t.contiguous() for key, t in state.items()}, os.path.join(path, "model.safetensors"),
+                  metadata={"format": "pt"})
+        return path
+
+    def merge_safetensors(self, name, **kwargs):
+        output = os.path.join(self.workdir.name, name)
+        ties_merge_safetensors(self.path_a, self.path_b, output, max_shard_size=4096, **kwargs)
+        return read_checkpoint(output)
+
+    def test_streaming_merge_matches_the_baseline(self):
+        expected = baseline_ties_merge(self.state_a, self.state_b)
+        assert_same_state(self, self.merge_safetensors("serial", workers=1), expected)
+
+    def test_parallel_merge_matches_the_baseline(self):
+        expected = baseline_ties_merge(self.state_a, self.state_b)
+        # A budget below one tensor runs them one at a time; a large one runs all at once
+        for memory_budget in (1, 1 << 30):
+            merged = self.merge_safetensors(f"parallel-{memory_budget}", workers=4, memory_budget=memory_budget)
+            assert_same_state(self, merged, expected)
+
+    def test_sliced_tensor_merge_matches_the_baseline(self):
+        param_a, param_b = self.state_a["embed.weight"], make_state(1)["embed.weight"]
+        expected = baseline_ties_merge({"w": param_a}, {"w": param_b})["w"]
+        with ThreadPoolExecutor(4) as slice_pool:
+            for inplace in (False, True):
+                merged = ties_merge_tensor(param_a.clone(), param_b.clone(), inplace=inplace,
+                                           slice_pool=slice_pool, slice_bytes=256)
+                self.assertTrue(torch.equal(merged, expected))
+
+    def test_two_way_many_matches_the_baseline_where_signs_agree(self):
+        expected = baseline_ties_merge(self.state_a, self.state_b)
+        merged = ties_merge_many([self.path_a, self.path_b], output_dir=os.path.join(self.workdir.name, "many"))
+        merged = read_checkpoint(merged)
+        self.assertEqual(merged.keys(), expected.keys())
+        for key in expected:
+            # On a sign conflict the elected sign is kept rather than the bare magnitude
+            self.assertTrue(torch.equal(merged[key].abs(), expected[key].abs()), key)
+
+    def test_n_way_merge_is_the_same_in_memory_and_streamed(self):
+        states = [self.state_a, make_state(2), make_state(3)]
+        paths = [self.path_a] + [self.checkpoint(f"n{i}", state) for i, state in enumerate(states[1:])]
+        streamed = read_checkpoint(ties_merge_many(paths, output_dir=os.path.join(self.workdir.name, "n-way")))
+        assert_same_state(self, streamed, {key: ties_merge_tensors([state[key] for state in states])
+                                           for key in self.state_a})
+
+        # A contribution equal to the base is trimmed, so it doesn't change the result
+        with_copy = ties_merge_many(paths + [self.checkpoint("copy", self.state_a)],
+                                    output_dir=os.path.join(self.workdir.name, "n-way-copy"))
+        assert_same_state(self, read_checkpoint(with_copy), streamed)
+
+        for key, merged in streamed.items():
+            if not merged.is_floating_point():
+                self.assertTrue(torch.equal(merged, self.state_a[key]))
+                continue
+            stacked = torch.stack([state[key].float() for state in states])
+            elected = torch.sign(stacked.sum(dim=0))
+            agree = torch.sign(stacked) == elected
+            expected = (stacked * agree).sum(dim=0) / agree.sum(dim=0).clamp(min=1)
+            torch.testing.assert_close(merged, expected.to(merged.dtype), rtol=0, atol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
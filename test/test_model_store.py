@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+import torch
+from transformers import BertConfig, BertModel
+from model_pipelines.Global_Model import GlobalModel
+from model_pipelines.Model_Store import GlobalModelStore
+
+
+def tiny_model(seed):
+    torch.manual_seed(seed)
+    config = BertConfig(vocab_size=64, hidden_size=16, num_hidden_layers=1, num_attention_heads=2,
+                        intermediate_size=32, max_position_embeddings=32)
+    return BertModel(config).eval()
+
+
+def max_difference(model_a, model_b):
+    state_a, state_b = model_a.state_dict(), model_b.state_dict()
+    assert state_a.keys() == state_b.keys()
+    return max((state_a[key].float() - state_b[key].float()).abs().max().item() for key in state_a)
+
+
+class SlowGlobalModelStore(GlobalModelStore):
+    """Widens the window between reading the manifest and writing it back."""
+
+    @staticmethod
+    def _write_delta(path, pending_updates):
+        time.sleep(0.2)
+        GlobalModelStore._write_delta(path, pending_updates)
+
+
+class TestGlobalModelStore(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.workdir.name, 'global')
+        self.uploaded = []
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def upload(self, paths):
+        # Stands in for IPFS: keeps a copy of each uploaded file
+        cids = []
+        for path in paths:
+            self.uploaded.append(os.path.join(self.workdir.name, f'uploaded-{len(self.uploaded)}'))
+            shutil.copyfile(path, self.uploaded[-1])
+            cids.append(f'Qm{len(self.uploaded)}')
+        return cids
+
+    def contribute(self, store, seeds, global_model=None):
+        global_model = global_model or GlobalModel()
+        for seed in seeds:
+            global_model.add_model("model", tiny_model(seed))
+            store.save(global_model)
+        return global_model
+
+    def test_deltas_and_compaction_round_trip(self):
+        store = GlobalModelStore(self.root, compact_every=2, compact_ratio=100)
+        global_model = GlobalModel()
+        for seed in range(5):
+            self.contribute(store, [seed], global_model)
+            restored = GlobalModelStore(self.root).load().model
+            self.assertEqual(max_difference(restored, global_model.model), 0)
+
+        # base-000001 + 2 deltas, compacted into base-000004 on the fourth save
+        manifest = store.read_manifest()
+        self.assertEqual(manifest['base'], 'base-000004')
+        self.assertEqual(manifest['deltas'], ['delta-000005.safetensors'])
+        self.assertEqual(sorted(name for name in os.listdir(self.root) if name.startswith(('base-', 'delta-'))),
+                         ['base-000004', 'delta-000005.safetensors'])
+
+    def test_export_publishes_the_base_once_and_round_trips(self):
+        store = GlobalModelStore(self.root, compact_every=100, compact_ratio=100)
+        global_model = self.contribute(store, [0, 1])
+        store.export(os.path.join(self.workdir.name, 'first.zip'), self.upload)
+        self.contribute(store, [2], global_model)
+        export_path = store.export(os.path.join(self.workdir.name, 'second.zip'), self.upload)
+
+        # Only the base went to IPFS, and only once
+        self.assertEqual(len(self.uploaded), 1)
+        with zipfile.ZipFile(self.uploaded[0]) as base_zip:
+            base_zip.extractall(os.path.join(self.workdir.name, 'base'))
+        with zipfile.ZipFile(export_path) as export_zip:
+            self.assertEqual(len([n for n in export_zip.namelist() if n.startswith('deltas/')]), 2)
+            export_zip.extractall(os.path.join(self.workdir.name, 'export'))
+
+        restored = GlobalModelStore.load_export(os.path.join(self.workdir.name, 'export'),
+                                                os.path.join(self.workdir.name, 'base'))
+        self.assertEqual(max_difference(restored, global_model.model), 0)
+
+    def test_concurrent_saves_keep_every_delta(self):
+        self.contribute(GlobalModelStore(self.root, compact_every=100, compact_ratio=100), [0])
+
+        # Two workers, each with the model as stored, save a contribution at once
+        workers = []
+        for seed in (1, 2):
+            global_model = SlowGlobalModelStore(self.root, compact_every=100, compact_ratio=100).load()
+            global_model.add_model("model", tiny_model(seed))
+            workers.append(global_model)
+        threads = [threading.Thread(target=SlowGlobalModelStore(self.root, compact_every=100, compact_ratio=100).save,
+                                    args=(global_model,)) for global_model in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        manifest = GlobalModelStore(self.root).read_manifest()
+        self.assertEqual(manifest['deltas'], ['delta-000002.safetensors', 'delta-000003.safetensors'])
+        for name in manifest['deltas']:
+            self.assertTrue(os.path.exists(os.path.join(self.root, name)))
+        self.assertIsNotNone(GlobalModelStore(self.root).load().model)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+from redis.exceptions import WatchError
+from utils.registry_cache import RegistryCache
+
+
+class FakeRedis:
+    """The few commands RegistryCache uses, with WATCH/MULTI semantics."""
+
+    def __init__(self):
+        self.data = {}
+        # Runs just before the next transaction commits, as another client would
+        self.before_exec = None
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+        self.watched = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def watch(self, key):
+        self.watched[key] = self.redis.data.get(key)
+
+    def multi(self):
+        pass
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            if self.watched and not self.commands and name == 'get':
+                return self.redis.data.get(args[0])  # Immediate mode after WATCH
+            self.commands.append((name, args))
+        return queue
+
+    def execute(self):
+        if self.watched and self.redis.before_exec is not None:
+            hook, self.redis.before_exec = self.redis.before_exec, None
+            hook()
+        if any(self.redis.data.get(key) != value for key, value in self.watched.items()):
+            raise WatchError()
+        data, results = self.redis.data, []
+        for name, args in self.commands:
+            if name == 'get':
+                results.append(data.get(args[0]))
+            elif name == 'hget':
+                results.append(data.get(args[0], {}).get(args[1]))
+            elif name == 'set':
+                data[args[0]] = args[1].encode()
+            elif name == 'hset':
+                data.setdefault(args[0], {})[args[1]] = args[2].encode()
+            elif name == 'incr':
+                data[args[0]] = str(int(data.get(args[0], b'0')) + 1).encode()
+            elif name == 'delete':
+                for key in args:
+                    data.pop(key, None)
+            if name not in ('get', 'hget'):
+                results.append(None)
+        return results
+
+
+class TestRegistryCache(unittest.TestCase):
+    def setUp(self):
+        # The Flask app and a Celery worker: separate processes sharing one Redis
+        self.redis = FakeRedis()
+        self.app_cache, self.worker_cache = RegistryCache(), RegistryCache()
+        self.app_cache.redis = self.worker_cache.redis = self.redis
+        self.status = 'pending'
+
+    def load(self):
+        return f'{{"status": "{self.status}"}}', {}
+
+    def test_load_invalidated_before_store_is_not_cached(self):
+        def stale_load():
+            loaded = self.load()
+            self.status = 'approved'
+            self.worker_cache.invalidate('m1')
+            return loaded
+
+        self.assertIn('pending', self.app_cache.get_or_load('status', 'm1', stale_load).body)
+        self.assertIn('approved', self.app_cache.get_or_load('status', 'm1', self.load).body)
+
+    def test_invalidated_while_storing_is_not_cached(self):
+        def invalidate():
+            self.status = 'approved'
+            self.worker_cache.invalidate('m1')
+
+        self.redis.before_exec = invalidate
+        self.assertIn('pending', self.app_cache.get_or_load('status', 'm1', self.load).body)
+        self.assertIn('approved', self.app_cache.get_or_load('status', 'm1', self.load).body)
+
+    def test_unchanged_load_is_cached(self):
+        self.app_cache.get_or_load('status', 'm1', self.load)
+        self.status = 'approved'
+        self.assertIn('pending', self.app_cache.get_or_load('status', 'm1', self.load).body)
+        self.assertEqual(self.app_cache.hits, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
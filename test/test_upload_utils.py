@@ -0,0 +1,147 @@
+import hashlib
+import io
+import os
+import tempfile
+import time
+import unittest
+import zipfile
+from utils.upload_utils import ChunkStore, ResumableUpload, collect_upload_garbage, extract_zip_stream
+
+SIZES = {"model.zip": 8, "tokenizer.zip": 4}
+
+
+def slices(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class Unseekable(io.RawIOBase):
+    """A write-only stream, so zipfile falls back to data descriptors."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+
+def age(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+class TestUploadGarbage(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.uploads = os.path.join(self.workdir.name, '.uploads')
+        os.makedirs(self.uploads)
+        self.store = ChunkStore(os.path.join(self.workdir.name, '.chunks'))
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def put(self, upload, artifact, offset, data):
+        digest = hashlib.sha256(data).hexdigest()
+        self.store.put_stream(io.BytesIO(data), digest, 1024)
+        upload.record_chunk(artifact, offset, digest, len(data))
+        return digest
+
+    def test_idle_uploads_and_their_chunks_expire(self):
+        idle = ResumableUpload.create(self.uploads, 'idle', 'ner', SIZES, 1024)
+        active = ResumableUpload.create(self.uploads, 'active', 'ner', SIZES, 1024)
+        idle_digest = self.put(idle, 'model.zip', 0, b'idle')
+        shared_digest = self.put(active, 'model.zip', 0, b'shared')
+        for path in (os.path.join(idle.dir, 'session.json'), self.store.path(idle_digest),
+                     self.store.path(shared_digest)):
+            age(path, 7200)
+
+        expired, removed = collect_upload_garbage(self.uploads, self.store, 3600)
+        self.assertEqual(expired, [idle.upload_id])
+        self.assertEqual(removed, 1)
+        self.assertFalse(self.store.has(idle_digest))
+        self.assertTrue(self.store.has(shared_digest))  # Still recorded by the active upload
+        ResumableUpload.load(self.uploads, active.upload_id)
+        with self.assertRaises(KeyError):
+            ResumableUpload.load(self.uploads, idle.upload_id)
+
+    def test_declared_sizes_are_capped_and_enforced(self):
+        with self.assertRaises(ValueError):
+            ResumableUpload.create(self.uploads, 'big', 'ner', {"model.zip": 2048, "tokenizer.zip": 4}, 1024)
+        with self.assertRaises(ValueError):
+            ResumableUpload.create(self.uploads, 'partial', 'ner', {"model.zip": 8}, 1024)
+
+        upload = ResumableUpload.create(self.uploads, 'model', 'ner', SIZES, 1024)
+        with self.assertRaises(ValueError):
+            self.put(upload, 'tokenizer.zip', 2, b'past the end')
+        self.put(upload, 'tokenizer.zip', 0, b'toke')
+        self.assertEqual(b''.join(upload.iter_artifact('tokenizer.zip', self.store)), b'toke')
+        with self.assertRaises(ValueError):
+            list(upload.iter_artifact('model.zip', self.store))
+
+
+
+class TestStreamingZipExtractor(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.dest = os.path.join(self.workdir.name, 'dest')
+        self.files = {'config.json': b'{"hidden_size": 16}', 'weights/model.bin': os.urandom(4096) * 8}
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def extract(self, archive, slice_size=7):
+        extractor = extract_zip_stream(slices(archive, slice_size), self.dest)
+        self.assertEqual(extractor.digest, hashlib.sha256(archive).hexdigest())
+        return extractor.manifest
+
+    def assertExtracted(self, manifest, files):
+        self.assertEqual(manifest, {
+            os.path.normpath(name): {'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+            for name, data in files.items()
+        })
+        for name, data in files.items():
+            with open(os.path.join(self.dest, name), 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+    def test_stored_and_deflated_members(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zf:
+            zf.writestr('weights/', b'')
+            zf.writestr('config.json', self.files['config.json'], compress_type=zipfile.ZIP_STORED)
+            zf.writestr('weights/model.bin', self.files['weights/model.bin'], compress_type=zipfile.ZIP_DEFLATED)
+        self.assertExtracted(self.extract(buffer.getvalue()), self.files)
+
+    def test_members_with_data_descriptors(self):
+        stream = Unseekable()
+        with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for name, data in self.files.items():
+                with zf.open(name, 'w') as f:
+                    f.write(data)
+        archive = bytes(stream.buffer)
+        with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+            self.assertTrue(all(info.flag_bits & 0x8 for info in zf.infolist()))
+        self.assertExtracted(self.extract(archive, slice_size=1000), self.files)
+
+    def test_parent_and_absolute_names_stay_inside(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zf:
+            for name in ('../escaped.txt', 'a/../../nested.txt', '/absolute.txt'):
+                zf.writestr(zipfile.ZipInfo(name), name.encode())
+        manifest = self.extract(buffer.getvalue())
+        self.assertEqual(sorted(manifest), ['a/nested.txt', 'absolute.txt', 'escaped.txt'])
+        self.assertEqual(sorted(os.listdir(self.workdir.name)), ['dest'])
+
+    def test_corrupt_member_is_rejected(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zf:
+            zf.writestr('config.json', self.files['config.json'], compress_type=zipfile.ZIP_STORED)
+        archive = buffer.getvalue().replace(b'hidden', b'hiddeN')
+        with self.assertRaises(ValueError):
+            self.extract(archive)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import asyncio
+import unittest
+from datetime import datetime, UTC
+from types import SimpleNamespace
+from flask import Flask
+from db_models.models import db, ModelRegistry, ModelVote
+from utils.vote_listener import VoteListener
+from utils.voting_utils import VoteLedger
+
+START = datetime(2025, 1, 1, tzinfo=UTC)
+START_MS = int(START.timestamp() * 1000)
+
+
+class TestVoteLedger(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(ModelRegistry(model_id='m1', model_name='alpha', task='ner', nft_id='pending'))
+            db.session.add(ModelVote(model_id='m1', model_name='alpha', yes_votes=0, no_votes=0,
+                                     voting_start=START))
+            db.session.commit()
+        self.ledger = VoteLedger(self.app, db, voting_duration=300)
+
+    def set_status(self, status):
+        with self.app.app_context():
+            ModelRegistry.query.filter_by(model_id='m1').update({'status': status})
+            db.session.commit()
+
+    def test_votes_after_the_window_are_dropped(self):
+        self.assertEqual(self.ledger.record([
+            ('m1', '@a', 'e1', 'yes', START_MS + 1000),
+            ('m1', '@b', 'e2', 'yes', START_MS + 301 * 1000),
+            ('m1', '@a', 'e3', 'no', START_MS + 400 * 1000),  # Too late to change @a's vote
+        ]), 1)
+        self.assertEqual(self.ledger.tally('m1'), (1, 0))
+
+    def test_only_the_closing_count_records_a_finalizing_model(self):
+        self.set_status('finalizing')
+        self.assertEqual(self.ledger.record([('m1', '@a', 'e1', 'yes', START_MS + 1000)]), 0)
+        closing = VoteLedger(self.app, db, voting_duration=300, open_statuses=('pending', 'finalizing'))
+        self.assertEqual(closing.record([('m1', '@a', 'e1', 'yes', START_MS + 1000)]), 1)
+        self.set_status('approved')
+        self.assertEqual(closing.record([('m1', '@b', 'e2', 'yes', START_MS + 2000)]), 0)
+        self.assertEqual(self.ledger.tally('m1'), (1, 0))
+
+    def test_listener_does_not_decide_a_finalizing_model(self):
+        decided = []
+        listener = VoteListener(None, ['!room'], self.ledger, on_decided=decided.append, quorum=2)
+        closing = VoteLedger(self.app, db, voting_duration=300, open_statuses=('pending', 'finalizing'))
+
+        def vote(sender, event_id):
+            event = SimpleNamespace(body='yes m1', sender=sender, event_id=event_id,
+                                    server_timestamp=START_MS + 1000)
+            asyncio.run(listener.on_message(SimpleNamespace(room_id='!room'), event))
+
+        vote('@a', 'e1')
+        # The scheduled finalization claims the model and counts a vote the listener has not seen yet
+        self.set_status('finalizing')
+        closing.record([('m1', '@b', 'e2', 'yes', START_MS + 1000)])
+        vote('@c', 'e3')
+        self.assertEqual(decided, [])
+        self.assertEqual(self.ledger.tally('m1'), (2, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
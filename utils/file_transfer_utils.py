@@ -1,21 +1,86 @@
 
 import zipfile
-from io import BytesIO
+from io import RawIOBase
 import os
+import shutil
+from utils.ipfs_utils import close_all
 
-# Create a ZIP file in memory
-def create_zip(student_model_io: BytesIO, teacher_model_io: BytesIO, global_model_io: BytesIO, model_name: str) -> BytesIO:
+# Fixed member timestamp, so the same inputs always produce the same archive
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+def zip_files(files, zip_path: str) -> str:
+    """
+    Pack ``(name, path)`` pairs into an uncompressed ZIP on disk. Timestamps
+    are fixed, so the same files always give the same bytes (and IPFS CID).
+    Returns ``zip_path``.
+    """
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED, allowZip64=True) as zipf:
+        for name, file_path in files:
+            info = zipfile.ZipInfo(name, date_time=ZIP_DATE_TIME)
+            with open(file_path, 'rb') as src, zipf.open(info, 'w', force_zip64=True) as dest:
+                shutil.copyfileobj(src, dest, 1024 * 1024)
+    return zip_path
+
+def zip_directory(src_dir: str, zip_path: str) -> str:
+    """
+    Pack a directory into an uncompressed ZIP on disk (safetensors weights
+    gain next to nothing from deflate). Returns ``zip_path``.
+    """
+    files = []
+    for folder_name, subfolders, filenames in os.walk(src_dir):
+        subfolders.sort()
+        for filename in sorted(filenames):
+            file_path = os.path.join(folder_name, filename)
+            files.append((os.path.relpath(file_path, src_dir), file_path))
+    return zip_files(files, zip_path)
+
+class _ZipStreamBuffer(RawIOBase):
+    """Unseekable sink for ZipFile; the written bytes are collected with ``drain``."""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def stream_zip(entries, compression=zipfile.ZIP_STORED):
     """
-    Create a ZIP archive containing both the student and teacher models in memory.
-    Returns a BytesIO object containing the zip file.
+    Generate a ZIP archive from ``(name, iterable of bytes)`` entries as it is
+    being written. Only the chunk in flight is held in memory; sizes and CRCs
+    follow each member in a data descriptor. Members are stored uncompressed
+    by default, as model archives are already compact. Closing the generator
+    before the end closes every entry's iterable, so downloads feeding later
+    members stop too.
     """
-    zip_io = BytesIO()
-    with zipfile.ZipFile(zip_io, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        zipf.writestr(f"{model_name}_student_model.pt", student_model_io.getvalue())
-        zipf.writestr(f"{model_name}_teacher_model.pt", teacher_model_io.getvalue())
-        zipf.writestr(f"{model_name}_global_model.pt", global_model_io.getvalue())
-    zip_io.seek(0)  # Move to the beginning of the in-memory file
-    return zip_io
+    entries = list(entries)
+    buffer = _ZipStreamBuffer()
+    try:
+        with zipfile.ZipFile(buffer, 'w', compression, allowZip64=True) as zipf:
+            for name, chunks in entries:
+                info = zipfile.ZipInfo(name, date_time=ZIP_DATE_TIME)
+                info.compress_type = compression
+                with zipf.open(info, 'w', force_zip64=True) as member:
+                    for chunk in chunks:
+                        member.write(chunk)
+                        yield buffer.drain()
+                yield buffer.drain()
+        yield buffer.drain()
+    finally:
+        close_all(chunks for _, chunks in entries)
 
 def convert_to_bytes(data: str) -> bytes:
     """
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import threading
+import aiohttp
+from .ipfs_utils import IPFS_CONCURRENCY
+
+IPFS_CONNECT_TIMEOUT = int(os.getenv('IPFS_CONNECT_TIMEOUT', 10))
+# Longest silence tolerated while reading a response; uploads of large
+# archives can take minutes, so there is no limit on the total time
+IPFS_READ_TIMEOUT = int(os.getenv('IPFS_READ_TIMEOUT', 300))
+
+
+class AsyncIPFSClient:
+    """
+    Client for the IPFS HTTP API (``/api/v0``) on a single aiohttp session.
+
+    The session keeps up to ``concurrency`` connections alive and reuses them
+    across calls, and no more than ``concurrency`` requests are in flight at
+    once. The session is bound to the event loop it is first used on; use the
+    client as an async context manager, or call ``close``.
+    """
+
+    def __init__(self, api_url, concurrency=IPFS_CONCURRENCY,
+                 connect_timeout=IPFS_CONNECT_TIMEOUT, read_timeout=IPFS_READ_TIMEOUT):
+        self.api_url = api_url.rstrip('/')
+        self.concurrency = concurrency
+        self.timeout = aiohttp.ClientTimeout(total=None, connect=connect_timeout, sock_read=read_timeout)
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _open(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, raise_for_status=True)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _post(self, command, params, data=None):
+        session = self._open()
+        async with self._semaphore:
+            async with session.post(f"{self.api_url}/api/v0/{command}", params=params, data=data) as response:
+                return await response.json(content_type=None)
+
+    async def add(self, path, pin=True) -> dict:
+        """Upload the file at ``path``, streamed from disk; returns the API's ``{Name, Hash, Size}``."""
+        with open(path, 'rb') as f:
+            form = aiohttp.FormData()
+            form.add_field('file', f, filename=os.path.basename(path), content_type='application/octet-stream')
+            return await self._post('add', {'pin': str(pin).lower()}, data=form)
+
+    async def add_many(self, paths, pin=True) -> list:
+        """Upload all ``paths`` in parallel; results are in the order of ``paths``."""
+        return list(await asyncio.gather(*(self.add(path, pin=pin) for path in paths)))
+
+    async def pin(self, cid) -> dict:
+        return await self._post('pin/add', {'arg': cid})
+
+    async def cat(self, cid) -> bytes:
+        session = self._open()
+        async with self._semaphore:
+            async with session.post(f"{self.api_url}/api/v0/cat", params={'arg': cid}) as response:
+                return await response.read()
+
+
+class IPFSClient:
+    """
+    Blocking front for ``AsyncIPFSClient``, for code that is not a coroutine
+    (``ModelVotingManager.finalize_voting``, ``upload_metadata_to_ipfs``).
+
+    Calls run on a private event loop thread that lives as long as the
+    client, so its pooled connections are reused by every caller, whichever
+    thread or event loop it calls from.
+    """
+
+    def __init__(self, api_url, **kwargs):
+        self.client = AsyncIPFSClient(api_url, **kwargs)
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name='ipfs-client', daemon=True).start()
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def add(self, path, pin=True) -> dict:
+        return self._run(self.client.add(path, pin=pin))
+
+    def add_many(self, paths, pin=True) -> list:
+        return self._run(self.client.add_many(paths, pin=pin))
+
+    def pin(self, cid) -> dict:
+        return self._run(self.client.pin(cid))
+
+    def cat(self, cid) -> bytes:
+        return self._run(self.client.cat(cid))
+
+    def close(self):
+        self._run(self.client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
@@ -1,6 +1,24 @@
+import hashlib
 import json
 import os
+import queue
+import re
+import threading
+import uuid
 import requests
+from requests.adapters import HTTPAdapter
+
+IPFS_CAT_CHUNK_SIZE = 1024 * 1024
+# Chunks each concurrent download may read ahead of the consumer
+IPFS_PREFETCH_CHUNKS = 8
+# Requests in flight to the IPFS API at once, and so kept-alive connections
+IPFS_CONCURRENCY = int(os.getenv('IPFS_CONCURRENCY', 4))
+_STARTED, _END = object(), object()
+
+# One keep-alive connection pool for every blocking call to the IPFS API
+# (a /fetch_model download holds up to three at once)
+_session = requests.Session()
+_session.mount('http://', HTTPAdapter(pool_maxsize=3 * IPFS_CONCURRENCY))
 
 def upload_metadata_to_ipfs(ipfs_client, metadata: dict) -> str:
   """Uploads metadata to IPFS and returns the CID."""
@@ -15,7 +33,237 @@ def upload_metadata_to_ipfs(ipfs_client, metadata: dict) -> str:
 # Function to fetch data from IPFS using the CID
 def fetch_ipfs_data(cid, ipfs_gateway_url):
     # Send a POST request to fetch the CID data from IPFS
-    response = requests.post(ipfs_gateway_url, params={'arg': cid})
+    response = _session.post(ipfs_gateway_url, params={'arg': cid})
     response.raise_for_status(
     )  # Raise an error if the response is not successful
     return response.json()  # Return the response JSON
+
+def check_ipfs(api_url, timeout):
+    """Raise unless the IPFS API at ``api_url`` answers within ``timeout`` seconds."""
+    _session.post(f"{api_url}/api/v0/version", timeout=timeout).raise_for_status()
+
+
+def _pump_ipfs_cat(cid, api_url, chunks, closed, chunk_size, timeout):
+    def put(item):
+        while not closed.is_set():
+            try:
+                chunks.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        with _session.post(f"{api_url}/api/v0/cat", params={'arg': cid}, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            if not put(_STARTED):
+                return
+            for chunk in response.iter_content(chunk_size):
+                if not put(chunk):
+                    return
+        put(_END)
+    except Exception as e:
+        put(e)
+
+class IpfsStream:
+    """
+    Chunks of one download started by ``open_ipfs_streams``. Reading it to
+    the end, ``close()``, or dropping the last reference to it stops the
+    download and frees its thread and connection, whether or not it was
+    ever read from.
+    """
+
+    def __init__(self, chunks, closed):
+        self._chunks = chunks
+        self._closed = closed
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._closed.is_set():
+            raise StopIteration
+        item = self._chunks.get()
+        if item is _END:
+            self.close()
+            raise StopIteration
+        if isinstance(item, Exception):
+            self.close()
+            raise item
+        return item
+
+    def close(self):
+        self._closed.set()
+
+    def __del__(self):
+        self.close()
+
+def close_all(iterables):
+    """Close every iterable that can be closed (generators, ``IpfsStream``)."""
+    for iterable in iterables:
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
+
+def open_ipfs_streams(cids, api_url, chunk_size=IPFS_CAT_CHUNK_SIZE, prefetch_chunks=IPFS_PREFETCH_CHUNKS, timeout=60):
+    """
+    Start raw ``/api/v0/cat`` downloads of all ``cids`` at once and return one
+    iterator of byte chunks per CID, in the same order.
+
+    Each download runs in its own thread and reads at most ``prefetch_chunks``
+    ahead of its consumer, so later CIDs make progress while earlier ones are
+    being consumed without any of them being held in memory whole. Raises
+    if a download cannot be started (e.g. unknown CID). Streams that won't
+    be read to the end must be closed (see ``IpfsStream``).
+    """
+    streams = []
+    for cid in cids:
+        chunks, closed = queue.Queue(maxsize=prefetch_chunks), threading.Event()
+        threading.Thread(target=_pump_ipfs_cat, args=(cid, api_url, chunks, closed, chunk_size, timeout),
+                         name=f"ipfs-cat-{cid}", daemon=True).start()
+        streams.append((chunks, closed))
+
+    try:
+        for chunks, _ in streams:
+            started = chunks.get()
+            if isinstance(started, Exception):
+                raise started
+    except Exception:
+        for _, closed in streams:
+            closed.set()
+        raise
+    return [IpfsStream(chunks, closed) for chunks, closed in streams]
+
+
+class BlobCache:
+    """
+    On-disk cache of immutable blobs keyed by content: IPFS CIDs, and
+    archives built only from CIDs.
+
+    Every blob is stored with the sha256 it had when written and is checked
+    against it before the first read in each process, so a corrupted file is
+    dropped and refetched rather than served. Reads refresh a blob's mtime;
+    once the cache holds more than ``max_bytes``, least recently read blobs are
+    evicted.
+    """
+    _KEY = re.compile(r'[A-Za-z0-9_-]+')
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.corrupt = 0
+        self._verified = set()
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        if not self._KEY.fullmatch(key):
+            raise ValueError(f"Invalid cache key: {key}")
+        return os.path.join(self.root, key)
+
+    def get(self, key: str):
+        """Path of the cached blob for ``key``, or None on a miss."""
+        path = self.path(key)
+        try:
+            stat = os.stat(path)
+            with open(f"{path}.sha256") as f:
+                expected = f.read().strip()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        version = (key, stat.st_ino, stat.st_size)
+        if version not in self._verified:
+            hasher = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for data in iter(lambda: f.read(IPFS_CAT_CHUNK_SIZE), b''):
+                    hasher.update(data)
+            if hasher.hexdigest() != expected:
+                print(f"Dropping corrupt cached blob {key}")
+                self._remove(path)
+                with self._lock:
+                    self.corrupt += 1
+                    self.misses += 1
+                return None
+            self._verified.add(version)
+
+        os.utime(path)
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def iter_blob(self, key: str, chunk_size=IPFS_CAT_CHUNK_SIZE):
+        """Chunks of a cached blob. The file is opened right away, so a later eviction can't cut it short."""
+        f = open(self.path(key), 'rb')
+
+        def chunks():
+            with f:
+                while True:
+                    data = f.read(chunk_size)
+                    if not data:
+                        break
+                    yield data
+        return chunks()
+
+    def tee(self, key: str, chunks):
+        """
+        Pass ``chunks`` through unchanged while writing them to the cache. The
+        blob is only added once the iterator has been consumed to the end;
+        closing it early closes ``chunks`` too.
+        """
+        path = self.path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+        hasher = hashlib.sha256()
+        try:
+            with open(tmp_path, 'wb') as f:
+                for data in chunks:
+                    f.write(data)
+                    hasher.update(data)
+                    yield data
+            with open(f"{path}.sha256", 'w') as f:
+                f.write(hasher.hexdigest())
+            os.replace(tmp_path, path)
+            self._verified.add((key, os.stat(path).st_ino, os.path.getsize(path)))
+        finally:
+            close_all([chunks])
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+
+    def evict(self) -> None:
+        with self._lock:
+            blobs = []
+            for name in os.listdir(self.root):
+                if self._KEY.fullmatch(name):
+                    try:
+                        stat = os.stat(os.path.join(self.root, name))
+                    except FileNotFoundError:
+                        continue
+                    blobs.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in blobs)
+            for _, size, name in sorted(blobs):
+                if total <= self.max_bytes:
+                    break
+                # Readers that already opened the file keep streaming it
+                self._remove(os.path.join(self.root, name))
+                total -= size
+                self.evictions += 1
+
+    @staticmethod
+    def _remove(path):
+        for name in (path, f"{path}.sha256"):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'corrupt': self.corrupt,
+            }
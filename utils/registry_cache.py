@@ -0,0 +1,211 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Longest a cached response may be served after the row behind it changed
+# without an invalidation reaching this process (e.g. a Celery worker's update
+# when the cache is not shared through Redis)
+REGISTRY_CACHE_TTL = float(os.getenv('REGISTRY_CACHE_TTL', 5))
+# With a shared cache every change is invalidated explicitly; the TTL only
+# bounds what a lost invalidation can leave behind
+REGISTRY_CACHE_REDIS_TTL = int(os.getenv('REGISTRY_CACHE_REDIS_TTL', 300))
+REGISTRY_CACHE_REDIS_URL = os.getenv('REGISTRY_CACHE_REDIS_URL')
+
+
+class CachedResponse(NamedTuple):
+    body: str
+    headers: dict
+    etag: str
+
+
+class RegistryCache:
+    """
+    Read-through cache of rendered registry responses: one entry per model's
+    status, and one per distinct /approved-models query.
+
+    Entries are kept in this process, or in Redis when ``redis_url`` is set
+    so that the Flask app sees invalidations made by Celery workers and the
+    vote listener at once. ``invalidate`` must be called whenever a model's
+    row changes; it also drops every listing, since any status transition
+    can add a model to or remove it from them. Each entry carries an ETag
+    (a digest of its body) for conditional requests.
+
+    A response loaded while its model changed is not cached: each model (and
+    the set of listings) has a version, bumped by ``invalidate`` and checked
+    before storing. In Redis it is a counter that is written only if it is
+    unchanged (WATCH/MULTI), so invalidations from other processes count too.
+
+    Every invalidation is also a change notification: callbacks registered
+    with ``add_listener`` get the model id, in every process sharing the
+    cache when it is in Redis (through pub/sub), else in this one.
+    """
+
+    def __init__(self, ttl=REGISTRY_CACHE_TTL, redis_url=None, redis_ttl=REGISTRY_CACHE_REDIS_TTL,
+                 prefix='registry-cache'):
+        self.ttl = ttl
+        self.redis_ttl = redis_ttl
+        self.prefix = prefix
+        self.redis = None
+        if redis_url:
+            import redis
+            self.redis = redis.Redis.from_url(redis_url)
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._subscriber = None
+
+    def _redis_key(self, group, key):
+        return f"{self.prefix}:{group}:{key}" if group == 'status' else f"{self.prefix}:{group}"
+
+    def _version_key(self, group, key):
+        return f"{self.prefix}:version:{key}" if group == 'status' else f"{self.prefix}:version:listing"
+
+    def _lookup(self, group, key):
+        """The cached response for ``key`` (or None) and the version to store a fresh one under."""
+        if self.redis is not None:
+            try:
+                with self.redis.pipeline(transaction=False) as pipe:
+                    if group == 'status':
+                        pipe.get(self._redis_key(group, key))
+                    else:
+                        pipe.hget(self._redis_key(group, key), key)
+                    pipe.get(self._version_key(group, key))
+                    raw, version = pipe.execute()
+            except Exception as e:
+                logger.warning(f"Registry cache unavailable, reading the database: {e}")
+                return None, None
+            return (CachedResponse(*json.loads(raw)) if raw else None), version
+
+        with self._lock:
+            entry = self._entries.get((group, key))
+            if entry is None or entry[0] < time.monotonic():
+                return None, self._generation
+            return entry[1], self._generation
+
+    def _store(self, group, key, cached: CachedResponse, version):
+        if self.redis is not None:
+            from redis.exceptions import WatchError
+
+            version_key = self._version_key(group, key)
+            try:
+                with self.redis.pipeline() as pipe:
+                    # Skip it if the model was invalidated since its version was read,
+                    # by this process or any other
+                    pipe.watch(version_key)
+                    if pipe.get(version_key) != version:
+                        return
+                    pipe.multi()
+                    raw = json.dumps(cached)
+                    if group == 'status':
+                        pipe.set(self._redis_key(group, key), raw, ex=self.redis_ttl)
+                    else:
+                        pipe.hset(self._redis_key(group, key), key, raw)
+                        pipe.expire(self._redis_key(group, key), self.redis_ttl)
+                    pipe.execute()
+            except WatchError:
+                pass  # Invalidated while storing
+            except Exception as e:
+                logger.warning(f"Registry cache unavailable, not caching: {e}")
+            return
+
+        with self._lock:
+            # Skip it if the data changed while it was being read
+            if version == self._generation:
+                self._entries[(group, key)] = (time.monotonic() + self.ttl, cached)
+
+    def get_or_load(self, group, key, loader) -> Optional[CachedResponse]:
+        """
+        The cached response for ``key`` in ``group`` ('status' or 'listing'),
+        or the one rendered by ``loader`` on a miss. ``loader`` returns
+        ``(body, headers)``, or None when there is nothing to cache (e.g. an
+        unknown model), which is passed through as None.
+        """
+        cached, version = self._lookup(group, key)
+        with self._lock:
+            if cached is not None:
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        loaded = loader()
+        if loaded is None:
+            return None
+        body, headers = loaded
+        cached = CachedResponse(body, headers, hashlib.sha256(body.encode()).hexdigest())
+        self._store(group, key, cached, version)
+        return cached
+
+    def invalidate(self, model_id, listings=True):
+        """Drop the cached status of ``model_id`` and, unless ``listings`` is false, every listing."""
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(('status', model_id), None)
+            if listings:
+                self._entries = {k: v for k, v in self._entries.items() if k[0] != 'listing'}
+        if self.redis is None:
+            self._notify(model_id)
+            return
+        keys = [self._redis_key('status', model_id)]
+        versions = [self._version_key('status', model_id)]
+        if listings:
+            keys.append(self._redis_key('listing', None))
+            versions.append(self._version_key('listing', None))
+        try:
+            with self.redis.pipeline() as pipe:
+                for version_key in versions:
+                    pipe.incr(version_key)
+                    # Only needs to outlive a load; kept as long as the entries it guards
+                    pipe.expire(version_key, 2 * self.redis_ttl)
+                pipe.delete(*keys)
+                pipe.publish(f"{self.prefix}:changed", model_id)
+                pipe.execute()
+        except Exception as e:
+            logger.warning(f"Registry cache invalidation of {model_id} failed: {e}")
+
+    def ping(self):
+        """Raise if the shared cache is unreachable; a cache kept in this process always answers."""
+        if self.redis is not None:
+            self.redis.ping()
+
+    def add_listener(self, callback):
+        """Call ``callback(model_id)`` after each invalidation of a model."""
+        with self._lock:
+            self._listeners.append(callback)
+            if self.redis is not None and self._subscriber is None:
+                self._subscriber = threading.Thread(target=self._subscribe, name='registry-cache-changes',
+                                                    daemon=True)
+                self._subscriber.start()
+
+    def _notify(self, model_id):
+        for callback in list(self._listeners):
+            try:
+                callback(model_id)
+            except Exception:
+                logger.exception(f"Registry change listener failed for {model_id}")
+
+    def _subscribe(self):
+        # One subscription per process, however many listeners it has
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(f"{self.prefix}:changed")
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self._notify(message['data'].decode())
+            except Exception as e:
+                logger.warning(f"Registry change subscription lost, retrying: {e}")
+                time.sleep(1)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                    "backend": "redis" if self.redis is not None else "local"}
@@ -1,12 +1,132 @@
+import base64
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, UTC
+from sqlalchemy import event, inspect, text, tuple_
+from sqlalchemy.engine import make_url
+
+# The registry the app has always used when no database is configured
+DEFAULT_DATABASE_URI = 'sqlite:///models_registry.db'
+# Connections each process keeps open, and how many more it may open under load
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+# How long (ms) a SQLite statement waits for a lock held by another process
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 30000))
+
+# Most ids bound into one IN (...) query; older SQLite builds allow 999 parameters
+IN_QUERY_CHUNK = 500
+
+# Columns /approved-models may return; all of them unless ``fields`` narrows it
+LISTING_FIELDS = ('model_id', 'model_name', 'task', 'nft_id', 'teacher_model_cid', 'student_model_cid',
+                  'global_model_cid', 'archive_cid', 'created_at', 'status')
 
 def initialize_registry(app, db):
-    """Initialize the database and create the model registry table."""
-    app.config[
-        "SQLALCHEMY_DATABASE_URI"] = "sqlite:///models_registry.db"  # Update for your DB
+    """
+    Initialize the database and create the model registry table.
+
+    The database is ``SQLALCHEMY_DATABASE_URI`` (a SQLite file by default, or
+    a server database such as Postgres), with the pool and, for SQLite, the
+    locking settings from ``engine_options``.
+    """
+    uri = app.config.get("SQLALCHEMY_DATABASE_URI") or DEFAULT_DATABASE_URI
+    app.config["SQLALCHEMY_DATABASE_URI"] = uri
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(uri))
     db.init_app(app)
     with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            configure_sqlite(db.engine)
         db.create_all()
+        ensure_schema(db)
+
+def engine_options(uri) -> dict:
+    """Pool settings for ``uri``; an in-memory SQLite database keeps SQLAlchemy's defaults."""
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite':
+        if url.database in (None, '', ':memory:'):
+            return {}
+        return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+def configure_sqlite(engine, journal_mode=SQLITE_JOURNAL_MODE, busy_timeout=SQLITE_BUSY_TIMEOUT):
+    """
+    Make a SQLite file usable by the web process and Celery workers at once.
+
+    In WAL mode readers never block the writer or each other. Writers queue
+    on the file lock for up to ``busy_timeout`` ms instead of failing at
+    once. Transactions are begun explicitly, so ``begin_write`` can take the
+    write lock up front (``BEGIN IMMEDIATE``): a transaction that reads and
+    then writes could otherwise fail without waiting, when another writer
+    commits in between.
+    """
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, _):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout)}")
+        cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        if journal_mode.upper() == 'WAL':
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _on_begin(connection):
+        immediate = connection.get_execution_options().get('sqlite_immediate')
+        connection.exec_driver_sql("BEGIN IMMEDIATE" if immediate else "BEGIN")
+
+def begin_write(db):
+    """
+    Start the session's transaction as a write transaction. Call before the
+    first query of a transaction that reads and then writes; on databases
+    other than SQLite this changes nothing.
+    """
+    db.session.connection(execution_options={'sqlite_immediate': True})
+
+@contextmanager
+def session_scope(app, db, write=False):
+    """
+    One short unit of work: a session of its own, committed on success and
+    rolled back on error, whose connection goes back to the pool on exit.
+    """
+    with app.app_context():
+        try:
+            if write:
+                begin_write(db)
+            yield db.session
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+def ensure_schema(db):
+    """
+    Add the columns and indexes declared on the models that an existing
+    database is missing; ``create_all`` only creates whole tables.
+    """
+    inspector = inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    column_type = column.type.compile(dialect=db.engine.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
 
 def update_registry(db, model_name, nft_id, weights_cid, config_cid, ModelRegistry):
     """Add or update a model in the registry."""
@@ -31,14 +151,113 @@ def update_registry(db, model_name, nft_id, weights_cid, config_cid, ModelRegist
         db.session.rollback()
         raise e
 
+def _chunks(ids, size=IN_QUERY_CHUNK):
+    ids = list(dict.fromkeys(ids))
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+def nft_ids_to_cids(nft_ids, ModelRegistry) -> dict:
+    """
+    Resolve the artifact CIDs of many approved models by NFT ID at once, in
+    ``IN`` queries on the (nft_id, status) index. Returns
+    ``{nft_id: {...}}``; unknown NFT IDs are left out.
+    """
+    resolved = {}
+    for chunk in _chunks(nft_ids):
+        rows = ModelRegistry.query.with_entities(
+            ModelRegistry.nft_id, ModelRegistry.model_id, ModelRegistry.model_name,
+            ModelRegistry.student_model_cid, ModelRegistry.teacher_model_cid,
+            ModelRegistry.global_model_cid, ModelRegistry.archive_cid
+        ).filter(ModelRegistry.nft_id.in_(chunk), ModelRegistry.status == 'approved').all()
+        for row in rows:
+            resolved[row.nft_id] = {key: getattr(row, key) for key in row._fields if key != 'nft_id'}
+    return resolved
+
 def nft_id_to_cid(nft_id, ModelRegistry):
     """Resolve metadata CIDs from an NFT ID."""
-    model = ModelRegistry.query.filter_by(nft_id=nft_id).first()
-    if not model:
+    resolved = nft_ids_to_cids([nft_id], ModelRegistry)
+    if nft_id not in resolved:
         raise ValueError("NFT ID not found in registry.")
-    return {
-        "weights_cid": model.weights_cid,
-        "config_cid": model.config_cid,
-        "model_name": model.model_name
-    }
+    return resolved[nft_id]
+
+def model_statuses(model_ids, ModelRegistry, ModelVote) -> dict:
+    """
+    The /model_status body of many models at once: one ``IN`` query on the
+    registry's primary key and one on the votes' model_id index per chunk.
+    Unknown ids are left out.
+    """
+    statuses = {}
+    for chunk in _chunks(model_ids):
+        models = ModelRegistry.query.with_entities(
+            ModelRegistry.model_id, ModelRegistry.model_name, ModelRegistry.status, ModelRegistry.nft_id
+        ).filter(ModelRegistry.model_id.in_(chunk)).all()
+        votes = {row.model_id: row for row in ModelVote.query.with_entities(
+            ModelVote.model_id, ModelVote.yes_votes, ModelVote.no_votes
+        ).filter(ModelVote.model_id.in_(chunk)).all()}
+        for model in models:
+            voting_session = votes.get(model.model_id)
+            statuses[model.model_id] = {
+                "model_name": model.model_name,
+                "status": model.status,
+                "nft_id": model.nft_id,
+                "yes_votes": voting_session.yes_votes if voting_session else None,
+                "no_votes": voting_session.no_votes if voting_session else None
+            }
+    return statuses
+
+
+def encode_cursor(created_at, model_id) -> str:
+    """Opaque cursor pointing just past the row (``created_at``, ``model_id``)."""
+    position = json.dumps([created_at.isoformat(), model_id]).encode()
+    return base64.urlsafe_b64encode(position).decode().rstrip('=')
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, model_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), model_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def parse_timestamp(value: str) -> datetime:
+    """ISO 8601 time as the naive UTC value stored in ``created_at``."""
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp: {value}")
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(UTC).replace(tzinfo=None)
+    return timestamp
+
+def list_models(ModelRegistry, status, limit, cursor=None, task=None, created_after=None,
+                created_before=None, fields=LISTING_FIELDS):
+    """
+    One page of models with ``status``, oldest first, as dicts of ``fields``.
+
+    Pages are read by keyset: the query resumes from the last row of the
+    previous page (``cursor``) on the (status, [task,] created_at, model_id)
+    index, so a page costs the same however deep into the registry it is.
+    Returns the rows and the cursor of the next page, or None on the last one.
+    """
+    unknown = set(fields) - set(LISTING_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    # The cursor needs the sort key whether or not it was asked for
+    columns = list(dict.fromkeys([*fields, 'created_at', 'model_id']))
+    order = (ModelRegistry.created_at, ModelRegistry.model_id)
+
+    query = ModelRegistry.query.with_entities(*(getattr(ModelRegistry, c) for c in columns)) \
+        .filter(ModelRegistry.status == status)
+    if task is not None:
+        query = query.filter(ModelRegistry.task == task)
+    if created_after is not None:
+        query = query.filter(ModelRegistry.created_at >= created_after)
+    if created_before is not None:
+        query = query.filter(ModelRegistry.created_at < created_before)
+    if cursor is not None:
+        query = query.filter(tuple_(*order) > tuple_(*decode_cursor(cursor)))
 
+    rows = query.order_by(*order).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].model_id)
+    return [{c: getattr(row, c) for c in fields} for row in rows], next_cursor
@@ -0,0 +1,80 @@
+import json
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+# Seconds between keep-alive comments on an idle stream. Each one is also a
+# recheck of the model's status, which catches changes made by processes
+# that share no Redis cache with this one
+SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT', 15))
+# A model leaves these states only by being re-registered, so a stream ends there
+TERMINAL_STATUSES = ('approved', 'rejected', 'failed')
+
+
+class StatusStream:
+    """
+    Server-Sent Events of model status changes.
+
+    One listener on the ``RegistryCache`` fans each change out to the streams
+    watching that model, which then read the new status through the cache,
+    so the change feed costs one subscription per process however many
+    clients wait. Each open stream still occupies a request handler for its
+    lifetime; serve it from green-thread workers (see gunicorn.conf.py), not
+    one OS thread per connection.
+    """
+
+    def __init__(self, registry_cache, heartbeat=SSE_HEARTBEAT):
+        self.registry_cache = registry_cache
+        self.heartbeat = heartbeat
+        self._watchers = {}
+        self._lock = threading.Lock()
+        registry_cache.add_listener(self._changed)
+
+    def _changed(self, model_id):
+        with self._lock:
+            watchers = list(self._watchers.get(model_id, ()))
+        for changes in watchers:
+            try:
+                changes.put_nowait(model_id)
+            except queue.Full:
+                pass  # A wake-up is already pending; it reads the latest status
+
+    @contextmanager
+    def watch(self, model_id):
+        """A queue that receives ``model_id`` whenever the model changes."""
+        changes = queue.Queue(maxsize=1)
+        with self._lock:
+            self._watchers.setdefault(model_id, set()).add(changes)
+        try:
+            yield changes
+        finally:
+            with self._lock:
+                self._watchers[model_id].discard(changes)
+                if not self._watchers[model_id]:
+                    del self._watchers[model_id]
+
+    def events(self, model_id, load_status, last_event_id=None):
+        """
+        SSE frames for ``model_id``: its current status (unless the client
+        already has it, per ``last_event_id``), then every change, until the
+        model reaches a terminal status or disappears. ``load_status()``
+        returns the model's cached status response, or None.
+        """
+        with self.watch(model_id) as changes:
+            sent = last_event_id
+            while True:
+                cached = load_status()
+                if cached is None:
+                    yield 'event: error\ndata: {"error": "Model not found"}\n\n'
+                    return
+                if cached.etag != sent:
+                    sent = cached.etag
+                    data = ''.join(f'data: {line}\n' for line in cached.body.strip().splitlines())
+                    yield f'event: status\nid: {cached.etag}\n{data}\n'
+                if json.loads(cached.body).get('status') in TERMINAL_STATUSES:
+                    return
+                try:
+                    changes.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
@@ -0,0 +1,546 @@
+import hashlib
+import json
+import os
+import shutil
+import struct
+import time
+import uuid
+import zipfile
+import zlib
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NEED_DATA
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Longest plain form field value kept from a multipart upload
+MAX_FORM_FIELD_SIZE = 64 * 1024
+
+_LOCAL_FILE_HEADER = 0x04034b50
+_DATA_DESCRIPTOR = 0x08074b50
+_CENTRAL_DIRECTORY = 0x02014b50
+_END_OF_CENTRAL_DIRECTORY = 0x06054b50
+_LOCAL_HEADER_FORMAT = '<IHHHHHIIIHH'
+_LOCAL_HEADER_SIZE = struct.calcsize(_LOCAL_HEADER_FORMAT)
+
+
+class StreamingZipExtractor:
+    """
+    Extract a zip archive while its bytes are still arriving.
+
+    Members are read from their local file headers, so nothing but the
+    member currently being inflated is held in memory and the archive itself
+    is never written to disk. Each member is CRC-checked and hashed on the way
+    through; the resulting manifest is returned by ``close()``.
+    """
+
+    def __init__(self, dest_dir):
+        self.dest_dir = dest_dir
+        self.archive_hash = hashlib.sha256()
+        self.archive_size = 0
+        self.manifest = {}
+        self._buffer = bytearray()
+        self._member = None
+        self._done = False
+        os.makedirs(dest_dir, exist_ok=True)
+
+    def feed(self, data: bytes) -> None:
+        """Consume the next slice of the archive."""
+        self.archive_hash.update(data)
+        self.archive_size += len(data)
+        if self._done:
+            # Central directory: everything we need was in the local headers
+            return
+        self._buffer += data
+        while self._step():
+            pass
+
+    def close(self) -> dict:
+        """Finish extraction and return ``{member: {'size', 'sha256'}}``."""
+        if self._member is not None:
+            if self._member['file'] is not None:
+                self._member['file'].close()
+            raise ValueError(f"Truncated zip member: {self._member['name']}")
+        if not self._done and (self._buffer or not self.manifest):
+            raise ValueError("Invalid zip file provided")
+        return self.manifest
+
+    @property
+    def digest(self) -> str:
+        return self.archive_hash.hexdigest()
+
+    def _step(self) -> bool:
+        if self._member is None:
+            return self._read_header()
+        if self._member['descriptor_pending']:
+            return self._read_descriptor()
+        return self._read_data()
+
+    def _read_header(self) -> bool:
+        if len(self._buffer) < 4:
+            return False
+        signature = struct.unpack_from('<I', self._buffer)[0]
+        if signature in (_CENTRAL_DIRECTORY, _END_OF_CENTRAL_DIRECTORY):
+            self._done = True
+            self._buffer.clear()
+            return False
+        if signature != _LOCAL_FILE_HEADER:
+            raise ValueError("Invalid zip file provided")
+        if len(self._buffer) < _LOCAL_HEADER_SIZE:
+            return False
+
+        (_, _, flags, method, _, _, crc, compressed_size, file_size,
+         name_length, extra_length) = struct.unpack_from(_LOCAL_HEADER_FORMAT, self._buffer)
+        header_size = _LOCAL_HEADER_SIZE + name_length + extra_length
+        if len(self._buffer) < header_size:
+            return False
+
+        name = bytes(self._buffer[_LOCAL_HEADER_SIZE:_LOCAL_HEADER_SIZE + name_length])
+        name = name.decode('utf-8' if flags & 0x800 else 'cp437')
+        extra = bytes(self._buffer[_LOCAL_HEADER_SIZE + name_length:header_size])
+        del self._buffer[:header_size]
+
+        if flags & 0x1:
+            raise ValueError(f"Encrypted zip members are not supported: {name}")
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise ValueError(f"Unsupported compression method {method} for {name}")
+
+        zip64 = False
+        if compressed_size == 0xFFFFFFFF or file_size == 0xFFFFFFFF:
+            file_size, compressed_size = _parse_zip64_sizes(extra, file_size, compressed_size)
+            zip64 = True
+
+        streamed = bool(flags & 0x8)
+        if streamed and method == zipfile.ZIP_STORED:
+            raise ValueError(f"Stored member {name} has no size in its header and cannot be streamed")
+
+        target = safe_member_path(self.dest_dir, name)
+        is_directory = target is None or name.endswith('/')
+        file = None
+        if is_directory:
+            if target is not None:
+                os.makedirs(target, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            file = open(target, 'wb')
+
+        self._member = {
+            'name': name,
+            'target': target,
+            'file': file,
+            'crc': crc,
+            'file_size': file_size,
+            'remaining': None if streamed else compressed_size,
+            'streamed': streamed,
+            'zip64': zip64,
+            'descriptor_pending': False,
+            'inflater': zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None,
+            'running_crc': 0,
+            'written': 0,
+            'hash': hashlib.sha256(),
+        }
+        if self._member['remaining'] == 0:
+            self._finish_member(crc, file_size)
+        return True
+
+    def _read_data(self) -> bool:
+        member = self._member
+        if not self._buffer:
+            return False
+
+        if member['remaining'] is not None:
+            take = min(member['remaining'], len(self._buffer))
+            chunk = bytes(self._buffer[:take])
+            del self._buffer[:take]
+            member['remaining'] -= take
+        else:
+            chunk = bytes(self._buffer)
+            self._buffer.clear()
+
+        inflater = member['inflater']
+        if inflater is not None:
+            self._write(inflater.decompress(chunk))
+            if inflater.eof:
+                # Bytes past the end of the deflate stream belong to the next record
+                self._buffer[:0] = inflater.unused_data
+                member['remaining'] = 0
+        else:
+            self._write(chunk)
+
+        if member['remaining'] == 0:
+            if member['streamed']:
+                member['descriptor_pending'] = True
+            else:
+                self._finish_member(member['crc'], member['file_size'])
+        return True
+
+    def _read_descriptor(self) -> bool:
+        member = self._member
+        size_format = '<Q' if member['zip64'] else '<I'
+        field = struct.calcsize(size_format)
+        needed = 4 + 4 + 2 * field
+        if len(self._buffer) < needed:
+            return False
+        offset = 4 if struct.unpack_from('<I', self._buffer)[0] == _DATA_DESCRIPTOR else 0
+        if len(self._buffer) < offset + 4 + 2 * field:
+            return False
+        crc = struct.unpack_from('<I', self._buffer, offset)[0]
+        file_size = struct.unpack_from(size_format, self._buffer, offset + 4 + field)[0]
+        del self._buffer[:offset + 4 + 2 * field]
+        self._finish_member(crc, file_size)
+        return True
+
+    def _write(self, data: bytes) -> None:
+        if not data:
+            return
+        member = self._member
+        member['running_crc'] = zlib.crc32(data, member['running_crc'])
+        member['written'] += len(data)
+        member['hash'].update(data)
+        if member['file'] is not None:
+            member['file'].write(data)
+
+    def _finish_member(self, crc, file_size) -> None:
+        member = self._member
+        self._member = None
+        if member['file'] is not None:
+            member['file'].close()
+        if member['running_crc'] != crc or member['written'] != file_size:
+            raise ValueError(f"Bad CRC-32 for zip member {member['name']}")
+        if member['file'] is not None:
+            self.manifest[os.path.relpath(member['target'], self.dest_dir)] = {
+                'size': member['written'],
+                'sha256': member['hash'].hexdigest()
+            }
+
+
+def yield_to_other_requests():
+    """
+    Let other requests run between chunks of CPU- and disk-bound work. Under
+    gunicorn's eventlet workers (which patch ``time.sleep``) this switches to
+    the other green threads; in a plain thread it is next to free.
+    """
+    time.sleep(0)
+
+
+def _parse_zip64_sizes(extra: bytes, file_size: int, compressed_size: int):
+    """Read the real sizes out of a zip64 extended information extra field."""
+    offset = 0
+    while offset + 4 <= len(extra):
+        header_id, data_size = struct.unpack_from('<HH', extra, offset)
+        if header_id == 0x0001:
+            data = extra[offset + 4:offset + 4 + data_size]
+            values = list(struct.unpack_from(f'<{len(data) // 8}Q', data))
+            if file_size == 0xFFFFFFFF and values:
+                file_size = values.pop(0)
+            if compressed_size == 0xFFFFFFFF and values:
+                compressed_size = values.pop(0)
+            break
+        offset += 4 + data_size
+    return file_size, compressed_size
+
+
+def safe_member_path(dest_dir, name):
+    """
+    Map an archive member name onto ``dest_dir`` the way ``extractall`` does,
+    dropping absolute prefixes and ``..`` components. Returns None for names
+    that resolve to ``dest_dir`` itself.
+    """
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.', '..')]
+    if not parts:
+        return None
+    parts[0] = os.path.splitdrive(parts[0])[1] or parts[0]
+    return os.path.join(dest_dir, *parts)
+
+
+def extract_zip_stream(chunks, dest_dir):
+    """
+    Extract an iterable of archive byte chunks into ``dest_dir``.
+    Returns the extractor so callers can read its manifest and digest.
+    """
+    extractor = StreamingZipExtractor(dest_dir)
+    for chunk in chunks:
+        extractor.feed(chunk)
+        yield_to_other_requests()
+    extractor.close()
+    return extractor
+
+
+def ingest_multipart_upload(stream, content_type, archive_dirs, text_fields, chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    Stream a multipart/form-data body, unpacking file parts on the fly.
+
+    ``archive_dirs`` maps form field names (e.g. ``"model.zip"``) to the
+    directory each archive is extracted into. The fields named in
+    ``text_fields`` are decoded as UTF-8 (up to ``MAX_FORM_FIELD_SIZE``
+    bytes each) and returned alongside the extractors of the archives that
+    were received: ``(fields, {field_name: StreamingZipExtractor})``. Any
+    other part is read past and dropped.
+    """
+    mimetype, options = parse_options_header(content_type or '')
+    boundary = options.get('boundary')
+    if mimetype != 'multipart/form-data' or not boundary:
+        raise ValueError("Expected a multipart/form-data request")
+
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    fields, archives = {}, {}
+    current_field, field_value, extractor = None, bytearray(), None
+
+    while True:
+        data = stream.read(chunk_size)
+        decoder.receive_data(data or None)
+        yield_to_other_requests()
+
+        event = decoder.next_event()
+        while event is not NEED_DATA:
+            if isinstance(event, Field):
+                current_field, extractor = event.name, None
+                field_value.clear()
+            elif isinstance(event, File):
+                current_field, extractor = event.name, None
+                if event.name in archive_dirs:
+                    extractor = StreamingZipExtractor(archive_dirs[event.name])
+                    archives[event.name] = extractor
+            elif isinstance(event, Data):
+                if extractor is not None:
+                    extractor.feed(event.data)
+                elif current_field in text_fields:
+                    field_value += event.data
+                    if len(field_value) > MAX_FORM_FIELD_SIZE:
+                        raise ValueError(f"Form field {current_field} exceeds {MAX_FORM_FIELD_SIZE} bytes")
+                if not event.more_data:
+                    if extractor is not None:
+                        extractor.close()
+                    elif current_field in text_fields:
+                        try:
+                            fields[current_field] = field_value.decode('utf-8')
+                        except UnicodeDecodeError:
+                            raise ValueError(f"Form field {current_field} is not valid UTF-8")
+                    current_field, extractor = None, None
+                    field_value.clear()
+            elif isinstance(event, Epilogue):
+                return fields, archives
+            event = decoder.next_event()
+
+        if not data:
+            raise ValueError("Unexpected end of multipart body")
+
+
+class ChunkStore:
+    """
+    Content-addressed staging area for upload chunks.
+    Chunks are stored once under their sha256, whichever upload sent them.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def has(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def size(self, digest: str) -> int:
+        return os.path.getsize(self.path(digest))
+
+    def put_stream(self, stream, digest: str, max_size: int, chunk_size=UPLOAD_CHUNK_SIZE) -> int:
+        """Store a chunk read from ``stream`` after checking it hashes to ``digest``."""
+        target = self.path(digest)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{uuid.uuid4().hex}.part"
+        hasher, size = hashlib.sha256(), 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                while True:
+                    data = stream.read(chunk_size)
+                    if not data:
+                        break
+                    size += len(data)
+                    if size > max_size:
+                        raise ValueError(f"Chunk exceeds the {max_size} byte limit")
+                    hasher.update(data)
+                    f.write(data)
+                    yield_to_other_requests()
+            if hasher.hexdigest() != digest:
+                raise ValueError("Chunk does not match its sha256")
+            os.replace(tmp_path, target)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return size
+
+    def touch(self, digest: str) -> None:
+        """Mark a stored chunk as just used, so ``sweep`` keeps it for another ``max_age``."""
+        os.utime(self.path(digest))
+
+    def sweep(self, live: set, max_age: float) -> int:
+        """
+        Delete chunks that no digest in ``live`` refers to and that were last
+        stored or reused more than ``max_age`` seconds ago, along with stale
+        partial writes. Returns the number of files removed.
+        """
+        cutoff, removed = time.time() - max_age, 0
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                path = os.path.join(prefix_dir, name)
+                try:
+                    if name in live or os.stat(path).st_mtime >= cutoff:
+                        continue
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def iter_chunk(self, digest: str, chunk_size=UPLOAD_CHUNK_SIZE):
+        with open(self.path(digest), 'rb') as f:
+            while True:
+                data = f.read(chunk_size)
+                if not data:
+                    break
+                yield data
+
+
+class ResumableUpload:
+    """
+    Server-side state of one resumable upload: which chunk (by sha256) sits
+    at which offset of each archive. Every chunk record is its own small file,
+    so concurrent PUTs never contend on a shared manifest.
+
+    Each archive's size is declared up front, and no chunk may reach past it.
+    The session file's mtime is the upload's last activity, which ``expire``
+    goes by.
+    """
+    ARTIFACTS = ("model.zip", "tokenizer.zip")
+
+    def __init__(self, root, upload_id):
+        self.upload_id = upload_id
+        self.dir = os.path.join(root, upload_id)
+
+    @classmethod
+    def create(cls, root, model_name, task, sizes: dict, max_size: int):
+        if set(sizes) != set(cls.ARTIFACTS):
+            raise ValueError(f"Declare the size of each of {', '.join(cls.ARTIFACTS)}")
+        for artifact, size in sizes.items():
+            if not isinstance(size, int) or isinstance(size, bool) or not 0 < size <= max_size:
+                raise ValueError(f"{artifact} must be between 1 and {max_size} bytes")
+        upload = cls(root, str(uuid.uuid4()))
+        os.makedirs(upload.dir)
+        with open(os.path.join(upload.dir, 'session.json'), 'w') as f:
+            json.dump({"model_name": model_name, "task": task, "sizes": sizes, "created_at": time.time()}, f)
+        return upload
+
+    @classmethod
+    def expire(cls, root, max_age: float) -> list:
+        """Discard the uploads idle for more than ``max_age`` seconds. Returns their ids."""
+        cutoff, expired = time.time() - max_age, []
+        for upload_id in os.listdir(root) if os.path.isdir(root) else []:
+            upload = cls(root, upload_id)
+            try:
+                last_active = os.stat(os.path.join(upload.dir, 'session.json')).st_mtime
+            except FileNotFoundError:
+                last_active = os.stat(upload.dir).st_mtime  # Never finished being created
+            if last_active < cutoff:
+                upload.discard()
+                expired.append(upload_id)
+        return expired
+
+    @classmethod
+    def live_chunks(cls, root) -> set:
+        """Digests of every chunk recorded by an upload still under ``root``."""
+        live = set()
+        for upload_id in os.listdir(root) if os.path.isdir(root) else []:
+            upload = cls(root, upload_id)
+            for artifact in cls.ARTIFACTS:
+                live.update(digest for _, digest in upload.chunks(artifact))
+        return live
+
+    @classmethod
+    def load(cls, root, upload_id):
+        try:
+            upload_id = str(uuid.UUID(upload_id))
+        except ValueError:
+            raise KeyError(upload_id)
+        upload = cls(root, upload_id)
+        if not os.path.exists(os.path.join(upload.dir, 'session.json')):
+            raise KeyError(upload_id)
+        return upload
+
+    @property
+    def session(self) -> dict:
+        with open(os.path.join(self.dir, 'session.json')) as f:
+            return json.load(f)
+
+    def record_chunk(self, artifact: str, offset: int, digest: str, size: int) -> None:
+        if artifact not in self.ARTIFACTS:
+            raise ValueError(f"Unknown artifact: {artifact}")
+        if offset < 0 or not is_sha256(digest):
+            raise ValueError("Chunks need a non-negative offset and a sha256 hex digest")
+        declared = self.session["sizes"][artifact]
+        if offset + size > declared:
+            raise ValueError(f"Chunk at byte {offset} reaches past the declared {declared} bytes of {artifact}")
+        artifact_dir = os.path.join(self.dir, artifact)
+        os.makedirs(artifact_dir, exist_ok=True)
+        record = os.path.join(artifact_dir, f"{offset:020d}")
+        with open(f"{record}.tmp", 'w') as f:
+            f.write(digest)
+        os.replace(f"{record}.tmp", record)
+        os.utime(os.path.join(self.dir, 'session.json'))
+
+    def chunks(self, artifact: str) -> list:
+        """Return the recorded ``(offset, digest)`` pairs of an artifact in order."""
+        artifact_dir = os.path.join(self.dir, artifact)
+        if not os.path.isdir(artifact_dir):
+            return []
+        chunks = []
+        for name in sorted(os.listdir(artifact_dir)):
+            if name.endswith('.tmp'):
+                continue
+            with open(os.path.join(artifact_dir, name)) as f:
+                chunks.append((int(name), f.read().strip()))
+        return chunks
+
+    def iter_artifact(self, artifact: str, store: ChunkStore):
+        """
+        Yield the bytes of an artifact from the chunk store, checking that the
+        recorded chunks cover its declared size without gaps or overlaps.
+        """
+        expected_size = self.session["sizes"][artifact]
+        position = 0
+        for offset, digest in self.chunks(artifact):
+            if offset != position:
+                raise ValueError(f"{artifact} has a gap or overlap at byte {position}")
+            if not store.has(digest):
+                raise ValueError(f"{artifact} chunk at byte {offset} is missing from the store")
+            yield from store.iter_chunk(digest)
+            position += store.size(digest)
+        if position != expected_size:
+            raise ValueError(f"{artifact} is incomplete: {position} bytes received")
+
+    def discard(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def collect_upload_garbage(upload_root, store: ChunkStore, max_age: float):
+    """
+    Expire uploads idle for over ``max_age`` seconds, then delete the chunks
+    none of the remaining uploads refer to that have not been stored or
+    reused for as long. Chunks are only kept to spare clients resending
+    them; installed models are unpacked and never read them again.
+    Returns ``(expired upload ids, number of chunk files removed)``.
+    """
+    expired = ResumableUpload.expire(upload_root, max_age)
+    return expired, store.sweep(ResumableUpload.live_chunks(upload_root), max_age)
+
+
+def is_sha256(value) -> bool:
+    return isinstance(value, str) and len(value) == 64 and all(c in '0123456789abcdef' for c in value)
+
+
+def is_valid_model_name(value) -> bool:
+    """A model name is letters, digits, ``.``, ``_`` and ``-``, and never a path."""
+    return (isinstance(value, str) and 0 < len(value) <= 128 and value not in ('.', '..')
+            and all(c.isascii() and (c.isalnum() or c in '._-') for c in value))
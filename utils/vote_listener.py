@@ -0,0 +1,108 @@
+"""
+Long-running listener that streams votes from the Matrix voting rooms into
+the vote ledger as they are posted, and closes a vote early once its outcome
+is clear.
+
+    python -m utils.vote_listener
+"""
+import asyncio
+import os
+from utils.voting_utils import VoteCollector
+
+# Early finalization: once at least VOTE_QUORUM voters have voted and one side
+# holds a VOTE_SUPERMAJORITY share, the vote is closed without waiting for
+# VOTING_DURATION. A quorum of 0 disables early finalization.
+VOTE_QUORUM = int(os.getenv('VOTE_QUORUM', 0))
+VOTE_SUPERMAJORITY = float(os.getenv('VOTE_SUPERMAJORITY', 2 / 3))
+SYNC_TIMEOUT = int(os.getenv('MATRIX_SYNC_TIMEOUT', 30000))
+
+
+def is_decided(yes_votes, no_votes, quorum=VOTE_QUORUM, supermajority=VOTE_SUPERMAJORITY):
+    """Whether a tally is clear-cut enough to finalize before the window closes."""
+    total = yes_votes + no_votes
+    if quorum <= 0 or total < quorum:
+        return False
+    return max(yes_votes, no_votes) / total >= supermajority
+
+
+class VoteListener:
+    """
+    Record votes from ``sync_forever`` callbacks instead of scanning room
+    history after the window closes.
+
+    ``on_decided(model_id)`` is called once for each proposal whose tally
+    passes ``is_decided`` while the ledger still holds its vote open, so never
+    for a model that is already being finalized. Finalizing is expected to be
+    idempotent, so the scheduled end-of-window finalization can still run
+    afterwards.
+    """
+
+    def __init__(self, matrix_client, voting_rooms, ledger, on_decided=None,
+                 quorum=VOTE_QUORUM, supermajority=VOTE_SUPERMAJORITY):
+        self.matrix_client = matrix_client
+        self.voting_rooms = set(voting_rooms or [])
+        self.ledger = ledger
+        self.on_decided = on_decided
+        self.quorum = quorum
+        self.supermajority = supermajority
+        self.decided = set()
+
+    async def on_message(self, room, event):
+        if room.room_id not in self.voting_rooms:
+            return
+        vote = VoteCollector.parse_vote(event.body)
+        if vote is None:
+            return
+
+        choice, model_id = vote
+        recorded = self.ledger.record([(model_id, event.sender, event.event_id, choice, event.server_timestamp)])
+        if not recorded or model_id in self.decided or self.on_decided is None:
+            return
+
+        yes_votes, no_votes = self.ledger.tally(model_id)
+        print(f'Vote on {model_id}: {yes_votes} yes / {no_votes} no')
+        if not is_decided(yes_votes, no_votes, self.quorum, self.supermajority):
+            return
+        self.decided.add(model_id)
+        if self.ledger.is_open(model_id):
+            self.on_decided(model_id)
+
+    async def run(self, timeout=SYNC_TIMEOUT):
+        from nio import RoomMessageText
+        self.matrix_client.add_event_callback(self.on_message, RoomMessageText)
+        await self.matrix_client.sync_forever(timeout=timeout, full_state=True)
+
+
+def main():
+    from app import (
+        app, db, get_matrix_client, get_registry_cache, finalize_votes_for_model_task,
+        MATRIX_PASSWORD, VOTING_ROOMS, VOTING_DURATION,
+    )
+    from db_models.models import ModelRegistry
+    from utils.voting_utils import VoteLedger
+
+    def finalize_now(model_id):
+        with app.app_context():
+            model = ModelRegistry.query.filter_by(model_id=model_id, status='pending').first()
+            if model is None:
+                return
+            print(f'Finalizing {model.model_name} early')
+            finalize_votes_for_model_task.apply_async(kwargs={
+                "model_name": model.model_name,
+                "model_id": model_id,
+                "task": model.task
+            })
+
+    async def listen():
+        matrix_client = get_matrix_client()
+        await matrix_client.login(MATRIX_PASSWORD)
+        ledger = VoteLedger(app, db, registry_cache=get_registry_cache(), voting_duration=VOTING_DURATION)
+        listener = VoteListener(matrix_client, VOTING_ROOMS, ledger, on_decided=finalize_now)
+        print(f'Listening for votes in {len(VOTING_ROOMS)} rooms')
+        await listener.run()
+
+    asyncio.run(listen())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,240 @@
 
-from db_models.models import ModelRegistry
+from db_models.models import ModelRegistry, ModelVote, VoteEvent
+from sqlalchemy.exc import IntegrityError
+from datetime import UTC
 from textwrap import dedent
-from utils.iota_utils import mint_nft_with_ipfs
-import torch
+from utils.file_transfer_utils import zip_files
+from utils.registry_utils import begin_write
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+# Broadcasts: rooms sent to at once, attempts per room, first retry delay (s)
+MATRIX_BROADCAST_CONCURRENCY = int(os.getenv('MATRIX_BROADCAST_CONCURRENCY', 8))
+MATRIX_BROADCAST_RETRIES = int(os.getenv('MATRIX_BROADCAST_RETRIES', 3))
+MATRIX_BROADCAST_BACKOFF = float(os.getenv('MATRIX_BROADCAST_BACKOFF', 0.5))
+
+
+class VoteLedger:
+    """
+    Persistent record of the votes cast on each proposal.
+
+    Every vote message is stored once in ``vote_events``; a voter's latest
+    vote is the one that counts. ``ModelVote.yes_votes``/``no_votes`` are
+    updated in the same transaction as each event, so reading a tally is a
+    single row lookup.
+
+    Only votes cast within ``voting_duration`` seconds of the vote opening
+    are stored, and only while the model's status is one of
+    ``open_statuses``. The listener records while a model is ``pending``;
+    the closing count also reads the votes of the model it is finalizing.
+    """
+
+    def __init__(self, app, db, registry_cache=None, voting_duration=None, open_statuses=('pending',)):
+        self.app = app
+        self.db = db
+        self.registry_cache = registry_cache
+        self.voting_duration = voting_duration
+        self.open_statuses = tuple(open_statuses)
+
+    def record(self, votes):
+        """Store ``(model_id, voter, event_id, choice, cast_at)`` votes; returns how many were new."""
+        recorded = 0
+        with self.app.app_context():
+            for vote in votes:
+                try:
+                    begin_write(self.db)
+                    new = self._record(*vote)
+                    self.db.session.commit()
+                    recorded += new
+                    if new and self.registry_cache is not None:
+                        # The model's status carries its live tally
+                        self.registry_cache.invalidate(vote[0], listings=False)
+                except IntegrityError:
+                    # Already recorded, e.g. by another worker reading the same room
+                    self.db.session.rollback()
+                except Exception:
+                    self.db.session.rollback()
+                    raise
+        return recorded
+
+    def _record(self, model_id, voter, event_id, choice, cast_at):
+        # Lock the proposal's counters first so concurrent writers apply in turn
+        voting_session = ModelVote.query.filter_by(model_id=model_id).with_for_update().first()
+        if voting_session is None:
+            return 0  # Not a proposal this registry knows about
+        if not self._is_open(voting_session, cast_at):
+            return 0
+
+        previous = (VoteEvent.query
+                    .filter_by(model_id=model_id, voter=voter)
+                    .order_by(VoteEvent.cast_at.desc(), VoteEvent.event_id.desc())
+                    .first())
+        self.db.session.add(VoteEvent(event_id=event_id, model_id=model_id, voter=voter,
+                                      vote=choice, cast_at=cast_at))
+        self.db.session.flush()
+
+        if previous is not None and (previous.cast_at, previous.event_id) > (cast_at, event_id):
+            return 1  # An older vote arriving late; the voter's newer vote still counts
+        counters = {'yes': ModelVote.yes_votes, 'no': ModelVote.no_votes}
+        changes = {counters[choice]: counters[choice] + 1}
+        if previous is not None:
+            if previous.vote == choice:
+                return 1
+            changes[counters[previous.vote]] = counters[previous.vote] - 1
+        ModelVote.query.filter_by(id=voting_session.id).update(changes)
+        return 1
+
+    def _is_open(self, voting_session, cast_at=None):
+        if cast_at is not None and self.voting_duration is not None:
+            start = voting_session.voting_start
+            if start.tzinfo is None:
+                start = start.replace(tzinfo=UTC)
+            if cast_at > (start.timestamp() + self.voting_duration) * 1000:
+                return False  # Cast after the window closed
+        status = (ModelRegistry.query.with_entities(ModelRegistry.status)
+                  .filter_by(model_id=voting_session.model_id).scalar())
+        return status in self.open_statuses
+
+    def is_open(self, model_id):
+        """Whether votes on ``model_id`` are still being recorded."""
+        with self.app.app_context():
+            voting_session = ModelVote.query.filter_by(model_id=model_id).first()
+            return voting_session is not None and self._is_open(voting_session)
+
+    def tally(self, model_id):
+        """Return ``(yes_votes, no_votes)`` for ``model_id`` from the stored counters."""
+        with self.app.app_context():
+            voting_session = ModelVote.query.filter_by(model_id=model_id).first()
+            if voting_session is None:
+                return 0, 0
+            return voting_session.yes_votes or 0, voting_session.no_votes or 0
+
+
+class VoteCollector:
+    """
+    Incremental reader of the votes posted in the Matrix voting rooms.
+
+    Keeps a pagination token per room, so each ``sweep`` only pages through
+    events that arrived since the previous one, and indexes every vote by the
+    model id it names. One sweep therefore serves every open proposal.
+
+    A room is first read backwards from the present down to ``since`` (the
+    start of the oldest vote asked about), so votes cast before this process
+    started collecting are not missed. With a ``ledger``, the votes found by
+    each sweep are also recorded there.
+    """
+    PAGE_SIZE = 100
+
+    def __init__(self, matrix_client, voting_rooms, ledger=None):
+        self.matrix_client = matrix_client
+        self.voting_rooms = voting_rooms or []
+        self.ledger = ledger
+        self.tokens = {}
+        self.horizons = {}
+        # model_id -> {event_id: (sender, 'yes' | 'no', server_timestamp)}
+        self.votes = {}
+        self._unrecorded = []
+
+    @staticmethod
+    def parse_vote(body):
+        """``'yes <model_id>'`` / ``'no <model_id>'`` -> (choice, model_id), else None."""
+        words = body.lower().split()
+        if len(words) >= 2 and words[0] in ('yes', 'no'):
+            return words[0], words[-1]
+        return None
+
+    def add_event(self, event):
+        body = getattr(event, 'body', None)
+        vote = self.parse_vote(body) if isinstance(body, str) else None
+        if vote:
+            choice, model_id = vote
+            events = self.votes.setdefault(model_id, {})
+            if event.event_id not in events:
+                events[event.event_id] = (event.sender, choice, event.server_timestamp)
+                self._unrecorded.append((model_id, event.sender, event.event_id, choice, event.server_timestamp))
+
+    def tally(self, model_id):
+        """Return ``(yes_votes, no_votes)`` seen so far for ``model_id``, counting each voter's latest vote."""
+        latest = {}
+        for event_id, (sender, choice, timestamp) in self.votes.get(model_id, {}).items():
+            if sender not in latest or (timestamp, event_id) > latest[sender][:2]:
+                latest[sender] = (timestamp, event_id, choice)
+        choices = [choice for _, _, choice in latest.values()]
+        return choices.count('yes'), choices.count('no')
+
+    def forget(self, model_id):
+        self.votes.pop(model_id, None)
+
+    async def sweep(self, since=None):
+        """Read new events from every voting room into the index."""
+        if since is not None and since.tzinfo is None:
+            since = since.replace(tzinfo=UTC)
+        since_ms = int(since.timestamp() * 1000) if since is not None else 0
+
+        sync_token = None
+        for room_id in self.voting_rooms:
+            try:
+                if room_id not in self.tokens or since_ms < self.horizons[room_id]:
+                    sync_token = sync_token or await self._sync_token()
+                    await self._backfill(room_id, sync_token, since_ms)
+                else:
+                    await self._read_forward(room_id)
+            except Exception as e:
+                print(f"Error retrieving votes from room {room_id}: {e}")
+
+        if self.ledger is not None and self._unrecorded:
+            votes, self._unrecorded = self._unrecorded, []
+            self.ledger.record(votes)
+
+    async def _sync_token(self):
+        from nio import SyncResponse
+        response = await self.matrix_client.sync(timeout=0, sync_filter={"room": {"timeline": {"limit": 1}}})
+        if not isinstance(response, SyncResponse):
+            raise RuntimeError(f"Matrix sync failed: {response}")
+        return response.next_batch
+
+    async def _messages(self, room_id, token, direction):
+        from nio import RoomMessagesResponse
+        response = await self.matrix_client.room_messages(room_id, start=token, direction=direction,
+                                                          limit=self.PAGE_SIZE)
+        if not isinstance(response, RoomMessagesResponse):
+            raise RuntimeError(f"Reading {room_id} failed: {response}")
+        for event in response.chunk:
+            self.add_event(event)
+        return response
+
+    async def _backfill(self, room_id, sync_token, since_ms):
+        from nio import MessageDirection
+        token = sync_token
+        while True:
+            response = await self._messages(room_id, token, MessageDirection.back)
+            if not response.chunk or not response.end or response.chunk[-1].server_timestamp < since_ms:
+                break
+            token = response.end
+        # Everything up to the sync point has been read; continue forward from there
+        self.tokens[room_id] = sync_token
+        self.horizons[room_id] = since_ms
+
+    async def _read_forward(self, room_id):
+        from nio import MessageDirection
+        token = self.tokens[room_id]
+        while True:
+            response = await self._messages(room_id, token, MessageDirection.front)
+            token = response.end or token
+            if len(response.chunk) < self.PAGE_SIZE or not response.end:
+                break
+        self.tokens[room_id] = token
 
 
 class ModelVotingManager:
-    def __init__(self, app, matrix_client, ipfs_client, account, db, MATRIX_PASSWORD, VOTING_ROOMS, VOTING_DURATION):
+    def __init__(self, app, matrix_client, ipfs_client, account, db, MATRIX_PASSWORD, VOTING_ROOMS, VOTING_DURATION, model_store=None, vote_collector=None, registry_cache=None):
         self.matrix_client = matrix_client
+        self.registry_cache = registry_cache
+        self.vote_collector = vote_collector or VoteCollector(matrix_client, VOTING_ROOMS)
+        self.model_store = model_store
         self.account = account
         self.ipfs_client = ipfs_client
         self.matrix_password = MATRIX_PASSWORD
@@ -26,136 +253,127 @@ class ModelVotingManager:
 
     async def count_votes_for_model(self, model_id, voting_session):
         """
-        Count votes for a specific model using Matrix room messages
-        """
-        with self.app.app_context():
-            yes_votes, no_votes = 0, 0
-
-            for room_id in self.voting_rooms:
-                try:
-                    # Retrieve recent room messages
-                    response = await self.matrix_client.room_messages(
-                        room_id, 
-                        start=''
-                    )
-                   
-
-                    # Process votes in these messages
-                    for event in response.chunk:
-                        # Check if this is a vote for our specific model
-                        if self.is_valid_vote(event, model_id):
-                            print('processing single vote')
-                            if not self.db.session.object_session(voting_session):
-                                self.db.session.add(voting_session)
-
-                            yes, no = self.process_single_vote(
-                                voting_session, 
-                                event
-                            )
-                            yes_votes += yes
-                            no_votes += no
-                    return yes_votes, no_votes
-
-                except Exception as e:
-                    
-                    print(f"Error retrieving votes from room {room_id}: {e}")
-                    return 0, 1
-
-
-    def is_valid_vote(self, event, model_id):
-        """
-        Validate if the message is a valid vote for the model
-        """
-        # Example vote format: "yes ModelID" or "no ModelID"
-        print(event)
-        body = event.body.lower().strip()
-        res = (body.startswith('yes ') or body.startswith('no ')) and \
-               body.split()[-1].strip() == model_id
-        print(res)
-        return res
-
-    def process_single_vote(self, voting_session, event):
+        Count votes for a specific model. Reads whatever arrived in the voting
+        rooms since the last sweep, then tallies each voter's latest vote.
         """
-        Process an individual vote
-        """
-        body = event.body.lower().strip()
-        yes , no = 0, 0
-
-        # Ensure voting_session is attached to the session
-        if body.startswith('yes'):
-            yes += 1
-        elif body.startswith('no'):
-            no += 1
-                
-        return yes, no
+        since = voting_session.voting_start if voting_session is not None else None
+        await self.vote_collector.sweep(since=since)
+        if self.vote_collector.ledger is not None:
+            return self.vote_collector.ledger.tally(model_id)
+        return self.vote_collector.tally(model_id)
 
 
-    def finalize_voting(self, yes_votes, no_votes, model_name, student_model, update_teacher_model):
+    def finalize_voting(self, yes_votes, no_votes, model_name, student_model, update_teacher_model, task=None, *, model_id):
         """
-        Finalize voting and process model
+        Finalize voting and process model. The registry row is the one the
+        vote was opened on (``model_id``; names need not be unique). It is read
+        and written in two short sessions; none is open while the models are
+        merged, saved and uploaded.
         """
         print('Finalizing voting')
         with self.app.app_context():
             # Retrieve the model
-            model = ModelRegistry.query.filter_by(model_name=model_name).first()
+            model = ModelRegistry.query.filter_by(model_id=model_id).first()
 
             if not model:
-                print(f"Model {model_name} not found")
+                print(f"Model {model_name} ({model_id}) not found")
                 return False
+            metadata = model.to_dict()
 
-            # Determine voting outcome
-            is_approved = yes_votes > no_votes
+        # Determine voting outcome
+        is_approved = yes_votes > no_votes
 
 
-            if is_approved:
-                try:
-                    teacher_model, global_model = update_teacher_model()
-                    student_file_path = 'student_model.pt'
-                    teacher_file_path = 'teacher_model.pt'
-                    global_file_path = 'global_model.pt'
-
-                    # Save models for testing (consider moving model creation elsewhere for production)
-                    torch.save(student_model, student_file_path)
-                    torch.save(teacher_model, teacher_file_path)
-                    torch.save(global_model, global_file_path)
-
-                    print('Starting IPFS upload')
-                    model.student_model_cid =  retrieve_hash(self.ipfs_client.add(student_file_path))
-                    model.teacher_model_cid = retrieve_hash(self.ipfs_client.add(teacher_file_path))
-                    model.global_model_cid =  retrieve_hash(self.ipfs_client.add(global_file_path))
-                    print('Minting NFt')
-
-                    # Mint NFT and update model status
-                    nft_id = mint_nft_with_ipfs(
-                        account=self.account,
-                        metadata=model.to_json()
-
-                    )
-
-                    
-                    
-                    model.status = 'approved'
-                    model.nft_id = nft_id
-                    self.db.session.commit()
-                
-                    
-                    
-                except Exception as e:
-                    print(f"Model processing failed: {e}")
-                    is_approved = False
-                    model.status = 'rejected'
-                    self.db.session.commit()
-            else:
-                model.status = 'rejected'
-                student_model = torch.load('student_model.pt')
-                self.db.session.commit()
+        if is_approved:
+            try:
+                teacher_model, global_model = update_teacher_model()
+
+                # Persist only what changed, as safetensors shards in the model store
+                self.model_store.save(teacher=teacher_model, student=student_model, global_model=global_model)
 
+                print('Starting IPFS upload')
+                with tempfile.TemporaryDirectory() as export_dir:
+                    archives = self.model_store.export_archives(
+                        task, model_name, export_dir,
+                        upload=lambda paths: [retrieve_hash(added) for added in self.ipfs_client.add_many(paths)])
 
-        # Clean up voting session
-        self.db.session.commit()
+                    # The download served by /fetch_model, built once here rather than per request
+                    download = zip_files([
+                        (f"{model_name}_{kind}_model.zip", archives[kind])
+                        for kind in ('student', 'teacher', 'global')
+                    ], os.path.join(export_dir, 'model_files.zip'))
+
+                    # All four uploads run in parallel and are pinned
+                    cids = [retrieve_hash(added) for added in self.ipfs_client.add_many(
+                        [archives['student'], archives['teacher'], archives['global'], download])]
+                changes = dict(zip(('student_model_cid', 'teacher_model_cid', 'global_model_cid', 'archive_cid'), cids))
+                metadata.update(changes)
+                print('Minting NFt')
+                from utils.iota_utils import mint_nft_with_ipfs
+
+                # Mint NFT and update model status
+                nft_id = mint_nft_with_ipfs(
+                    account=self.account,
+                    metadata=json.dumps(metadata)
+                )
+                changes.update(status='approved', nft_id=nft_id)
+
+            except Exception as e:
+                print(f"Model processing failed: {e}")
+                is_approved = False
+                changes = {'status': 'rejected'}
+        else:
+            # The unsaved student merge is simply dropped with this task's models
+            changes = {'status': 'rejected'}
+
+        with self.app.app_context():
+            ModelRegistry.query.filter_by(model_id=model_id).update(changes)
+            self.db.session.commit()
+        if self.registry_cache is not None:
+            self.registry_cache.invalidate(model_id)
 
         return is_approved
 
+    async def broadcast(self, body):
+        """
+        Send a text message to every voting room. Logs in once, sends to up to
+        ``MATRIX_BROADCAST_CONCURRENCY`` rooms at a time and retries failed
+        sends with exponential backoff. Returns
+        ``{room_id: {'ok', 'attempts', 'latency'}}``.
+        """
+        from nio import RoomSendResponse
+        await self.matrix_login()
+        semaphore = asyncio.Semaphore(MATRIX_BROADCAST_CONCURRENCY)
+
+        async def send(room_id):
+            async with semaphore:
+                start = time.perf_counter()
+                for attempt in range(1, MATRIX_BROADCAST_RETRIES + 1):
+                    try:
+                        response = await self.matrix_client.room_send(
+                            room_id=room_id,
+                            message_type="m.room.message",
+                            content={
+                                "msgtype": "m.text",
+                                "body": body
+                            }
+                        )
+                        if isinstance(response, RoomSendResponse):
+                            return room_id, {'ok': True, 'attempts': attempt, 'latency': time.perf_counter() - start}
+                        error = response
+                    except Exception as e:
+                        error = e
+                    print(f"Attempt {attempt} to send to room {room_id} failed: {error}")
+                    if attempt < MATRIX_BROADCAST_RETRIES:
+                        await asyncio.sleep(MATRIX_BROADCAST_BACKOFF * 2 ** (attempt - 1))
+                return room_id, {'ok': False, 'attempts': MATRIX_BROADCAST_RETRIES, 'latency': time.perf_counter() - start}
+
+        results = dict(await asyncio.gather(*(send(room_id) for room_id in self.voting_rooms or [])))
+        for room_id, result in results.items():
+            print(f"Broadcast to {room_id}: {'sent' if result['ok'] else 'FAILED'} "
+                  f"after {result['attempts']} attempt(s) in {result['latency']:.2f}s")
+        return results
+
     async def broadcast_voting_message(self, model_data):
         """
         Broadcast model voting message to Matrix rooms
@@ -170,21 +388,9 @@ class ModelVotingManager:
             VOTING INSTRUCTIONS:
             - Reply 'yes {model_data['model_id']}' to approve this model
             - Reply 'no {model_data['model_id']}' to reject this model
-            - Voting closes in 5 minutes
+            - Voting closes in {self.voting_duration // 60} minutes
         """)
-        
-        for room_id in self.voting_rooms:
-            try:
-                await self.matrix_client.room_send(
-                    room_id=room_id,
-                    message_type="m.room.message",
-                    content={
-                        "msgtype": "m.text",
-                        "body": voting_message
-                    }
-                )
-            except Exception as e:
-                print(f"Failed to broadcast voting message: {e}")
+        return await self.broadcast(voting_message)
 
     async def broadcast_approval_result(self, model_name, approved):
         """
@@ -197,19 +403,7 @@ class ModelVotingManager:
             Model: {model_name}
             Status: {"APPROVED" if approved else "REJECTED"}
         """)
-        
-        for room_id in self.voting_rooms:
-            try:
-                await self.matrix_client.room_send(
-                    room_id=room_id,
-                    message_type="m.room.message",
-                    content={
-                        "msgtype": "m.text",
-                        "body": result_message
-                    }
-                )
-            except Exception as e:
-                print(f"Failed to broadcast result: {e}")
+        return await self.broadcast(result_message)
 
 
 def retrieve_hash(x):